@@ -0,0 +1,476 @@
+"""
+Async API Client for Crow
+- asyncio counterparts of HybridClient / ChatSession / retry_with_backoff
+- Same routing, ledger and cost logic as the sync client
+- Lets several sessions, summarizations and analyses share one event loop
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Dict, Callable, AsyncIterator, Awaitable, Optional, Union
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from openrouter_client import HybridClient, ChatResponse, TextPart
+from payload import HistoryEncoder
+from ledger import CallMetrics, ledger_context
+from rate_limit import APIError, is_retryable, retry_delay, parse_retry_after
+
+
+async def async_retry_with_backoff(
+    func: Callable[[], Awaitable],
+    max_retries: int = 6,
+    base_delay: float = 2,
+    max_delay: float = 30,
+    max_total_wait: float = 120,
+    on_retry: Callable[[Exception, int, float], None] = None
+):
+    """
+    Retry a coroutine factory with exponential backoff on transient errors.
+
+    Same policy as main.retry_with_backoff: errors are classified by HTTP
+    status (rate_limit.is_retryable), the server's Retry-After is honoured
+    and total waiting is capped at max_total_wait seconds. Cancellation is
+    never retried: asyncio.CancelledError propagates immediately, including
+    out of the backoff sleep.
+    """
+    waited = 0.0
+    for attempt in range(max_retries):
+        try:
+            with ledger_context(retries=attempt):
+                return await func()
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt, base_delay, max_delay)
+            if attempt >= max_retries - 1 or waited + delay > max_total_wait:
+                raise
+            if on_retry:
+                on_retry(e, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+async def _aiter_chunks(chunks) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+class AsyncChatSession:
+    """Maintains conversation history for an async chat session."""
+
+    def __init__(self, client: 'AsyncHybridClient', history: List[Dict] = None, model_getter=None):
+        self.client = client
+        self.history = history or []
+        self.model_getter = model_getter  # Function to get current model (for fatigue)
+        self.gemini_chat = None  # Live direct-Gemini chat (see openrouter_client._GeminiChat)
+        self.encoder = HistoryEncoder()  # Serialized history, re-encoded only where it changed
+
+    async def send_message(self, message: str, stream: bool = False) -> ChatResponse:
+        """
+        Send a message and get a response.
+
+        With stream=True an AsyncStreamingChatResponse is returned: iterate it
+        with `async for` for text deltas, or `await response.read()`.
+        """
+        user_entry = {
+            "role": "user",
+            "content": message
+        }
+        self.history.append(user_entry)
+
+        model = self.model_getter() if self.model_getter else self.client.default_model
+
+        # Drop the user entry on failure or cancellation so retries don't duplicate it
+        try:
+            result = await self.client.chat(self.history, model, stream=stream, prompt_cache=True, session=self)
+        except BaseException:
+            self._discard(user_entry)
+            raise
+
+        if stream:
+            return AsyncStreamingChatResponse(
+                result,
+                self.history,
+                on_complete=self._append_assistant,
+                on_error=lambda: self._discard(user_entry)
+            )
+
+        self._append_assistant(result)
+        return ChatResponse(result, self.history)
+
+    def _append_assistant(self, response_text: str):
+        """Add assistant response to history."""
+        self.history.append({
+            "role": "assistant",
+            "content": response_text
+        })
+
+    def _discard(self, entry: Dict):
+        """Remove a pending user entry after a failed call."""
+        if self.history and self.history[-1] is entry:
+            self.history.pop()
+
+
+class AsyncStreamingChatResponse(ChatResponse):
+    """
+    Async chat response whose text arrives incrementally.
+
+    `async for delta in response` yields text deltas; `await response.read()`
+    drains the rest. .text is available once the stream has finished.
+    """
+
+    def __init__(self, deltas: AsyncIterator[str], history: List[Dict],
+                 on_complete: Callable[[str], None] = None, on_error: Callable[[], None] = None):
+        self._deltas = deltas
+        self._history = history
+        self._chunks = []
+        self._text = None
+        self._on_complete = on_complete
+        self._on_error = on_error
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._text is not None:
+            return
+        try:
+            async for delta in self._deltas:
+                self._chunks.append(delta)
+                yield delta
+        except BaseException:
+            if self._on_error:
+                self._on_error()
+            raise
+
+        self._text = "".join(self._chunks)
+        if self._on_complete:
+            self._on_complete(self._text)
+
+    async def read(self) -> str:
+        """Consume the rest of the stream and return the full text."""
+        async for _ in self:
+            pass
+        return self._text
+
+    @property
+    def done(self) -> bool:
+        return self._text is not None
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise RuntimeError("Stream not finished - use 'await response.read()'")
+        return self._text
+
+    @property
+    def parts(self):
+        return [TextPart(self.text)]
+
+
+class AsyncHybridClient(HybridClient):
+    """
+    asyncio version of HybridClient.
+
+    Routing, payloads, ledger entries and cost calculation are inherited from
+    HybridClient; only the transport is async (aiohttp, pooled per client).
+    The direct-Gemini path runs the sync SDK in a worker thread.
+    """
+
+    REQUEST_TIMEOUT = 120
+
+    def __init__(self, *args, **kwargs):
+        if aiohttp is None:
+            raise ImportError("AsyncHybridClient requires aiohttp (pip install aiohttp)")
+        super().__init__(*args, **kwargs)
+
+    def _create_http_session(self):
+        # aiohttp sessions must be created inside the running loop - see _get_http()
+        self._aio_session = None
+        self._async_slots = {}
+        return None
+
+    def _get_http(self) -> 'aiohttp.ClientSession':
+        """Get (or lazily create) the pooled aiohttp session."""
+        if self._aio_session is None or self._aio_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_connections * self.pool_maxsize,
+                limit_per_host=self.pool_maxsize
+            )
+            self._aio_session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.openrouter_headers,
+                timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+            )
+        return self._aio_session
+
+    async def aclose(self):
+        """Close pooled connections."""
+        if self._aio_session is not None:
+            await self._aio_session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _post_openrouter_async(self, messages: List[Dict], model: str, stream: bool = False,
+                                     prompt_cache: bool = False,
+                                     encoder: HistoryEncoder = None,
+                                     metrics: CallMetrics = None) -> 'aiohttp.ClientResponse':
+        """POST a chat completion request to OpenRouter, raising on HTTP errors."""
+        metrics = metrics or CallMetrics()
+        body, headers = self._encode_request(messages, model, stream, prompt_cache, encoder)
+        body = metrics.count_request(body)
+        self._estimate_prompt(messages, model, metrics)
+        if not isinstance(body, bytes):
+            body = _aiter_chunks(body)  # aiohttp streams async iterables as a chunked body
+        kwargs = {}
+        if stream:
+            # Streams can legitimately run longer than REQUEST_TIMEOUT - only bound the gaps
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=None, sock_read=self.REQUEST_TIMEOUT)
+
+        # Fail fast if the model's circuit is open, otherwise wait for a rate-limit token
+        guard = self.limiter.guard(model)
+        wait = guard.before_call()
+        try:
+            if wait > 0:
+                metrics.rate_wait = wait
+                await asyncio.sleep(wait)
+
+            started = time.monotonic()
+            try:
+                response = await self._get_http().post(self.openrouter_url, data=body, headers=headers, **kwargs)
+                metrics.mark_first_byte()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                guard.record_failure(e)
+                raise
+            guard.record_latency(time.monotonic() - started, self.latency_slo)
+
+            if response.status != 200:
+                try:
+                    body = await response.text()
+                finally:
+                    response.release()
+                error = APIError(
+                    f"OpenRouter API error {response.status}: {body}",
+                    status_code=response.status,
+                    retry_after=parse_retry_after(response.headers),
+                    model=model
+                )
+                guard.record_failure(error)
+                raise error
+        except BaseException:
+            guard.release_probe()  # Cancelled mid-call: don't keep a half-open circuit's probe
+            raise
+
+        guard.record_success(response.headers)
+        return response
+
+    async def _chat_openrouter_async(self, messages: List[Dict], model: str, ledger_fields: Dict = None,
+                                     prompt_cache: bool = False, encoder: HistoryEncoder = None) -> str:
+        """Send request to OpenRouter and wait for the full completion."""
+        metrics = CallMetrics()
+        response = await self._post_openrouter_async(messages, model, prompt_cache=prompt_cache, encoder=encoder,
+                                                     metrics=metrics)
+        async with response:
+            raw = await response.read()
+        metrics.response_bytes = len(raw)
+        data = json.loads(raw)
+        text = self._parse_completion(data)
+
+        self._record_usage(model, data.get("usage"), ledger_fields, metrics)
+
+        return text
+
+    async def _stream_openrouter_async(self, messages: List[Dict], model: str, ledger_fields: Dict = None,
+                                       prompt_cache: bool = False,
+                                       encoder: HistoryEncoder = None) -> AsyncIterator[str]:
+        """Send a streaming request; HTTP errors are raised before returning."""
+        metrics = CallMetrics()
+        response = await self._post_openrouter_async(messages, model, stream=True, prompt_cache=prompt_cache,
+                                                     encoder=encoder, metrics=metrics)
+        return self._iter_sse_deltas_async(response, model, ledger_fields, metrics)
+
+    async def _iter_sse_deltas_async(self, response: 'aiohttp.ClientResponse', model: str,
+                                     ledger_fields: Dict = None,
+                                     metrics: CallMetrics = None) -> AsyncIterator[str]:
+        """Yield content deltas from an OpenRouter SSE stream."""
+        metrics = metrics or CallMetrics()
+        usage = None
+        try:
+            async with response:
+                async for raw_line in response.content:
+                    metrics.response_bytes += len(raw_line)
+                    chunk = self._parse_sse_line(raw_line.decode("utf-8").strip())
+                    if chunk is None:
+                        continue
+                    if chunk.get("done"):
+                        break
+
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for delta in self._chunk_deltas(chunk):
+                        metrics.mark_first_token()
+                        yield delta
+        except Exception as e:
+            self.limiter.guard(model).record_failure(e)
+            raise
+
+        self._record_usage(model, usage, ledger_fields, metrics)
+
+    async def chat(self, messages: List[Dict], model: str = None, stream: bool = False,
+                   ledger_fields: Dict = None, prompt_cache: bool = False,
+                   session: AsyncChatSession = None) -> Union[str, AsyncIterator[str]]:
+        """
+        Send a chat completion request, routing to appropriate API.
+
+        Returns the response text, or an async iterator of deltas if streaming.
+        """
+        model = model or self.default_model
+        if self.cassette is not None and self.cassette.replaying:
+            result = self._replay(messages, model, stream, ledger_fields)
+            return _aiter_chunks(result) if stream else result
+
+        started = time.monotonic()
+        result = await self._chat_with_failover_async(messages, model, stream, ledger_fields, prompt_cache, session)
+        if self.cassette is None:
+            return result
+        if stream:
+            return self._recorded_stream_async(result, messages, model, started)
+        await asyncio.to_thread(self.cassette.record, messages, model, result,
+                                seconds=time.monotonic() - started)
+        return result
+
+    async def _chat_with_failover_async(self, messages: List[Dict], model: str, stream: bool,
+                                        ledger_fields: Optional[Dict], prompt_cache: bool,
+                                        session: AsyncChatSession = None) -> Union[str, AsyncIterator[str]]:
+        """Try `model`, then its fallback chain while models are degraded."""
+        candidates = self._failover_candidates(model)
+        reason = None
+
+        # Same failover policy as HybridClient.chat
+        for index, candidate in enumerate(candidates):
+            is_last = index == len(candidates) - 1
+            guard = self.limiter.guard(candidate)
+
+            degraded = guard.is_degraded(self.failover_after)
+            if degraded and not is_last:
+                reason = reason or degraded
+                continue
+
+            try:
+                result = await self._route_async(messages, candidate, stream,
+                                                 self._failover_fields(ledger_fields, model, candidate, reason),
+                                                 prompt_cache, session)
+            except Exception as e:
+                degraded = guard.is_degraded(self.failover_after)
+                if is_last or not is_retryable(e) or not degraded:
+                    raise
+                reason = reason or degraded
+                continue
+
+            if candidate != model:
+                self._notify_failover(model, candidate, reason)
+            return result
+
+    async def _recorded_stream_async(self, deltas: AsyncIterator[str], messages: List[Dict], model: str,
+                                     started: float) -> AsyncIterator[str]:
+        """Pass deltas through, recording the stream once it completes."""
+        received = []
+        async for delta in deltas:
+            received.append(delta)
+            yield delta
+        await asyncio.to_thread(self.cassette.record, messages, model, "".join(received), received,
+                                seconds=time.monotonic() - started)
+
+    async def _route_async(self, messages: List[Dict], model: str, stream: bool, ledger_fields: Dict,
+                           prompt_cache: bool, session: AsyncChatSession = None) -> Union[str, AsyncIterator[str]]:
+        """Send one request to a single model via the appropriate API."""
+        if self._is_gemini_model(model):
+            text = await asyncio.to_thread(self._chat_gemini_guarded, messages, model, session)
+            if not stream:
+                return text
+
+            async def single():
+                yield text
+            return single()
+
+        encoder = session.encoder if session is not None else None
+        if stream:
+            return await self._stream_openrouter_async(messages, model, ledger_fields, prompt_cache, encoder)
+        else:
+            return await self._chat_openrouter_async(messages, model, ledger_fields, prompt_cache, encoder)
+
+    def start_chat(self, history: List[Dict] = None, model_getter: Callable = None) -> AsyncChatSession:
+        """Start a new async chat session (history may be in Gemini format)."""
+        return AsyncChatSession(self, self._convert_history(history), model_getter)
+
+    async def generate_content(self, prompt: str, model: str = None, ledger_fields: Dict = None,
+                               use_cache: bool = True) -> ChatResponse:
+        """Simple one-shot generation (shares the sync client's response cache)."""
+        model = model or self.default_model
+        messages = [{"role": "user", "content": prompt}]
+
+        cache = self.cache if (use_cache and self.cache and self.cache.enabled) else None
+        if cache:
+            cached = await asyncio.to_thread(cache.get, model, prompt)
+            if cached is not None:
+                self._record_cache_hit(model, ledger_fields)
+                return ChatResponse(cached, messages)
+            ledger_fields = dict(ledger_fields or {}, cache="miss",
+                                 cache_hits=cache.hits, cache_misses=cache.misses)
+
+        response_text = await self.chat(messages, model, ledger_fields=ledger_fields)
+        if cache:
+            await asyncio.to_thread(cache.put, model, prompt, response_text)
+        return ChatResponse(response_text, messages)
+
+    def _model_slots_async(self, model: str) -> asyncio.Semaphore:
+        """Get the semaphore capping in-flight requests for a model on this loop."""
+        if model not in self._async_slots:
+            limit = self.MODEL_CONCURRENCY.get(model, self.DEFAULT_MODEL_CONCURRENCY)
+            self._async_slots[model] = asyncio.Semaphore(limit)
+        return self._async_slots[model]
+
+    async def generate_many(self, prompts: List[str], model: str = None, max_concurrency: int = 4,
+                            max_retries: int = 3, base_delay: float = 2) -> List[Union[ChatResponse, Exception]]:
+        """Async version of HybridClient.generate_many (same ordering and failure isolation)."""
+        model = model or self.default_model
+        batch_id = uuid.uuid4().hex[:12]
+        batch_slots = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run_one(index: int, prompt: str) -> ChatResponse:
+            fields = {"batch_id": batch_id, "batch_index": index}
+
+            async def attempt():
+                async with batch_slots, self._model_slots_async(model):
+                    return await self.generate_content(prompt, model, ledger_fields=fields)
+            return await async_retry_with_backoff(attempt, max_retries, base_delay)
+
+        return await asyncio.gather(
+            *(run_one(i, prompt) for i, prompt in enumerate(prompts)),
+            return_exceptions=True
+        )
+
+
+class AsyncGenerativeModel:
+    """Async wrapper matching GenerativeModel's interface."""
+
+    def __init__(self, model_name: str, client: AsyncHybridClient, model_getter=None):
+        self.model_name = model_name
+        self.client = client
+        self.model_getter = model_getter
+
+    def start_chat(self, history: List = None) -> AsyncChatSession:
+        """Start a chat session."""
+        return self.client.start_chat(history, self.model_getter)
+
+    async def generate_content(self, prompt: str) -> ChatResponse:
+        """Generate content from a prompt."""
+        model = self.model_getter() if self.model_getter else self.model_name
+        return await self.client.generate_content(prompt, model)
@@ -0,0 +1,87 @@
+"""
+Benchmark: request body encoding time per turn for a long chat history.
+
+Compares re-encoding the whole payload every turn (what json= did) with the
+per-session HistoryEncoder, with and without gzip. No network or API key needed.
+
+    python bench_payload.py --messages 10000 --turns 20
+"""
+
+import argparse
+import gzip
+import json
+import random
+import string
+import time
+
+from payload import HistoryEncoder, encode_json, mark_cacheable
+
+MODEL = "anthropic/claude-opus-4.5"
+OPTIONS = {"model": MODEL, "stream": True, "usage": {"include": True}}
+
+
+def make_message(index: int, chars: int) -> dict:
+    words = " ".join(
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9)))
+        for _ in range(chars // 6)
+    )
+    return {"role": "user" if index % 2 == 0 else "assistant", "content": words[:chars]}
+
+
+def full_encode(messages, compress):
+    """Old path: mark breakpoints on a copy and encode everything."""
+    breakpoints = {0, len(messages) - 2}
+    marked = [mark_cacheable(m) if i in breakpoints else m for i, m in enumerate(messages)]
+    body = json.dumps(dict(OPTIONS, messages=marked)).encode("utf-8")
+    return gzip.compress(body, compresslevel=1) if compress else body
+
+
+def run(messages_count: int, turns: int, chars: int):
+    random.seed(0)
+    history = [make_message(i, chars) for i in range(messages_count - 2 * turns)]
+    encoder = HistoryEncoder()
+    gz_encoder = HistoryEncoder()
+    # Warm the encoders on the starting history, as a live session would be
+    encoder.encode(history, OPTIONS, breakpoints=True)
+    gz_encoder.encode(history, OPTIONS, breakpoints=True, compress=True)
+
+    rows = []
+    for turn in range(turns):
+        history.append(make_message(len(history), chars))  # user message
+        timings = []
+        for fn in (
+            lambda: full_encode(history, False),
+            lambda: encoder.encode(history, OPTIONS, breakpoints=True),
+            lambda: full_encode(history, True),
+            lambda: gz_encoder.encode(history, OPTIONS, breakpoints=True, compress=True),
+        ):
+            start = time.perf_counter()
+            body = fn()
+            timings.append((time.perf_counter() - start, len(body)))
+        rows.append((len(history), timings))
+        history.append(make_message(len(history), chars))  # assistant reply
+
+    print(f"\n=== Request encoding per turn ({chars} chars/message) ===")
+    print(f"{'messages':>9} {'full ms':>9} {'incr ms':>9} {'full+gz ms':>11} {'incr+gz ms':>11} {'body MB':>8} {'gz MB':>7}")
+    for count, t in rows:
+        print(f"{count:>9} {t[0][0] * 1000:>9.2f} {t[1][0] * 1000:>9.2f} "
+              f"{t[2][0] * 1000:>11.2f} {t[3][0] * 1000:>11.2f} "
+              f"{t[1][1] / 1e6:>8.2f} {t[3][1] / 1e6:>7.2f}")
+
+    avg = [sum(t[i][0] for _, t in rows) / len(rows) * 1000 for i in range(4)]
+    print("-" * 70)
+    print(f"{'average':>9} {avg[0]:>9.2f} {avg[1]:>9.2f} {avg[2]:>11.2f} {avg[3]:>11.2f}")
+    print(f"Speedup: {avg[0] / avg[1]:.1f}x uncompressed, {avg[2] / avg[3]:.1f}x gzip")
+
+    # Sanity check: both paths produce the same request
+    same = json.loads(encoder.encode(history, OPTIONS, breakpoints=True)) == json.loads(full_encode(history, False))
+    print(f"Bodies equivalent: {same}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark incremental request encoding")
+    parser.add_argument("--messages", type=int, default=10000, help="History length at the last turn")
+    parser.add_argument("--turns", type=int, default=20, help="Turns to time")
+    parser.add_argument("--chars", type=int, default=400, help="Characters per message")
+    args = parser.parse_args()
+    run(args.messages, args.turns, args.chars)
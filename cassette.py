@@ -0,0 +1,146 @@
+"""
+Record/Replay Cassettes for Crow
+- record: every chat completion a HybridClient makes is appended to a
+  gzipped JSON-lines cassette (request hash, model, response text/deltas)
+- replay: the same calls are answered from the cassette with no network,
+  so a recorded session can be re-run through run_session, save_history,
+  compact_history and execute_action at full local speed
+
+Requests are matched by hash of model + messages; a request that changed
+since recording (e.g. a timestamp in a command's output) gets the next
+unused recording in order instead.
+
+Enable for a whole run with:
+    CROW_CASSETTE=runs/session.jsonl.gz CROW_CASSETTE_MODE=record python main.py -a
+    CROW_CASSETTE=runs/session.jsonl.gz CROW_CASSETTE_MODE=replay python main.py -a
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MODES = ("record", "replay")
+
+
+class CassetteMiss(Exception):
+    """Replay ran out of recorded responses."""
+
+
+class Cassette:
+    """One cassette file, opened for recording (appends) or replay (read once)."""
+
+    def __init__(self, path: Path, mode: str = "replay"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = []
+        self._by_key = defaultdict(deque)  # key -> indexes of unused entries
+        self._used = set()
+        self._cursor = 0
+        if mode == "replay":
+            self._load()
+        else:
+            atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """Cassette configured by CROW_CASSETTE / CROW_CASSETTE_MODE, if any."""
+        path = os.environ.get("CROW_CASSETTE")
+        if not path:
+            return None
+        return cls(path, os.environ.get("CROW_CASSETTE_MODE", "replay"))
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(messages: List[Dict], model: str) -> str:
+        """Request hash over the model and each message's role and text."""
+        digest = hashlib.sha256(model.encode("utf-8"))
+        for msg in messages:
+            digest.update(b"\0" + str(msg.get("role", "")).encode("utf-8") + b"\0")
+            content = msg.get("content")
+            if isinstance(content, str):
+                digest.update(content.encode("utf-8"))
+            elif hasattr(content, "parts"):
+                for part in content.parts():  # StreamedPrompt - hashed without joining
+                    digest.update(part.encode("utf-8"))
+            else:
+                digest.update(json.dumps(content, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load(self):
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._entries.append(json.loads(line))
+        except EOFError:
+            pass  # Recording process died before closing the file - keep what was flushed
+        for index, entry in enumerate(self._entries):
+            self._by_key[entry["key"]].append(index)
+
+    def record(self, messages: List[Dict], model: str, text: str, deltas: List[str] = None,
+               seconds: float = None):
+        """Append one request/response pair (flushed immediately, so crashes keep it)."""
+        entry = {"key": self.key(messages, model), "model": model, "text": text}
+        if deltas is not None:
+            entry["deltas"] = deltas
+        if seconds is not None:
+            entry["seconds"] = round(seconds, 3)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.recorded += 1
+
+    def replay(self, messages: List[Dict], model: str) -> Dict:
+        """Recorded entry for this request, or the next unused one if it changed."""
+        key = self.key(messages, model)
+        with self._lock:
+            matches = self._by_key.get(key)
+            while matches and matches[0] in self._used:
+                matches.popleft()
+            if matches:
+                index = matches.popleft()
+            else:
+                self.misses += 1
+                while self._cursor < len(self._entries) and self._cursor in self._used:
+                    self._cursor += 1
+                if self._cursor >= len(self._entries):
+                    raise CassetteMiss(f"No recorded response left in {self.path} for {model}")
+                index = self._cursor
+            self._used.add(index)
+            self.replayed += 1
+            return self._entries[index]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "entries": len(self._entries),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
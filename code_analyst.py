@@ -1,16 +1,34 @@
 from typing import Dict
 import argparse
 import os
+import sys
 from pathlib import Path
 import json
 import requests  # Import requests for the client call
-from openrouter_client import HybridClient, ChatResponse # Assuming HybridClient is aliased as OpenRouterClient
 from main import fatigue # Access to fatigue manager for model selection
+from main import openrouter_client as client  # Share main's pooled client (one connection pool per process)
+from ledger import ledger_context
+
+def build_prompt_messages(file_path: Path, code_content: str) -> list:
+    """Construct the prompt for code analysis."""
+    return [
+        {"role": "system", "content": "You are an expert Code Analyst AI. Your task is to review Python code for quality, best practices, potential bugs, performance issues, security risks, and adherence to common Python conventions (like PEP 8). Provide clear, actionable suggestions and where appropriate, code examples for fixes. Format your response as a structured Markdown report."},
+        {"role": "user", "content": f"Please analyze the following Python code for improvements. Focus on all aspects of code quality, performance, security, and best practices. Provide specific recommendations and code examples where possible. Also, mention the model you used for this analysis.\n\nFile: {file_path}\n\n```python\n{code_content}\n```"}
+    ]
 
-# Initialize the HybridClient
-# The HybridClient will automatically pick up OPENROUTER_API_KEY from environment variables
-client = HybridClient()
 
+def read_code(file_path: Path):
+    """Read a code file, returning (content, error)."""
+    if not file_path.is_file():
+        return None, {"error": f"File not found: {file_path}"}
+
+    try:
+        return file_path.read_text(encoding='utf-8'), None
+    except UnicodeDecodeError:
+        return None, {"error": f"Could not read file {file_path}. Is it a text file?"}
+
+
+@ledger_context(subsystem="code_analyze")
 def analyze_code(file_path: Path, verbose: bool = False) -> Dict:
     """
     Analyzes a single Python code file for improvements using an LLM.
@@ -22,22 +40,13 @@ def analyze_code(file_path: Path, verbose: bool = False) -> Dict:
     Returns:
         A dictionary containing the analysis report.
     """
-    if not file_path.is_file():
-        return {"error": f"File not found: {file_path}"}
-
-    try:
-        code_content = file_path.read_text(encoding='utf-8')
-    except UnicodeDecodeError:
-        return {"error": f"Could not read file {file_path}. Is it a text file?"}
+    code_content, error = read_code(file_path)
+    if error:
+        return error
 
     # Get the current model from the fatigue manager
     current_model = fatigue.get_model()
-    
-    # Construct the prompt for code analysis
-    prompt_messages = [
-        {"role": "system", "content": "You are an expert Code Analyst AI. Your task is to review Python code for quality, best practices, potential bugs, performance issues, security risks, and adherence to common Python conventions (like PEP 8). Provide clear, actionable suggestions and where appropriate, code examples for fixes. Format your response as a structured Markdown report."},
-        {"role": "user", "content": f"Please analyze the following Python code for improvements. Focus on all aspects of code quality, performance, security, and best practices. Provide specific recommendations and code examples where possible. Also, mention the model you used for this analysis.\n\nFile: {file_path}\n\n```python\n{code_content}\n```"}
-    ]
+    prompt_messages = build_prompt_messages(file_path, code_content)
 
     if verbose:
         print(f"Analyzing file: {file_path}")
@@ -46,13 +55,7 @@ def analyze_code(file_path: Path, verbose: bool = False) -> Dict:
 
     try:
         # Use the client to chat with the LLM
-        # The client automatically handles fatigue-based model switching as per HybridClient logic
-        chat_session = client.start_chat()
-        response_text = chat_session.send_message(prompt_messages[1]['content']) # Sending the user message part
-        
-        # NOTE: The _chat_openrouter method in HybridClient already handles logging token usage and cost
-        # So we don't need to explicitly do it here, but we can retrieve it if the client were to expose it.
-        # For now, just rely on the ledger.log for overall cost tracking.
+        response_text = client.generate_content(prompt_messages[1]['content'], current_model).text # Sending the user message part
 
         return {
             "file": str(file_path),
@@ -63,25 +66,55 @@ def analyze_code(file_path: Path, verbose: bool = False) -> Dict:
         return {"error": f"Error during AI analysis: {e}"}
 
 
+@ledger_context(subsystem="code_analyze")
+def analyze_directory(dir_path: Path, verbose: bool = False, max_concurrency: int = 4) -> Dict:
+    """
+    Analyzes every Python file under a directory, sending the prompts as one parallel batch.
+
+    Returns:
+        A dictionary mapping file path to its analysis result (same shape as analyze_code).
+    """
+    current_model = fatigue.get_model()
+    results = {}
+    files = []
+    prompts = []
+
+    for file in sorted(dir_path.rglob("*.py")):
+        code_content, error = read_code(file)
+        if error:
+            results[str(file)] = error
+            continue
+        files.append(file)
+        prompts.append(build_prompt_messages(file, code_content)[1]['content'])
+
+    if verbose:
+        print(f"Analyzing {len(files)} files with {current_model} (max {max_concurrency} in parallel)")
+
+    responses = client.generate_many(prompts, current_model, max_concurrency=max_concurrency)
+    for file, response in zip(files, responses):
+        if isinstance(response, Exception):
+            results[str(file)] = {"error": f"Error during AI analysis: {response}"}
+        else:
+            results[str(file)] = {
+                "file": str(file),
+                "model_used": current_model,
+                "analysis_report": response.text
+            }
+
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(description="Crow's Code Analyst Service.")
     parser.add_argument("file_path", type=str, help="Path to the Python file or directory to analyze.")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose output.")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Max files analyzed in parallel (directories only).")
     args = parser.parse_args()
 
     target_path = Path(args.file_path)
 
     if target_path.is_dir():
-        # Future: Implement directory scanning
-        print(f"Directory analysis for '{target_path}' is not yet implemented. Please provide a single file.")
-        # For now, we'll just implement single file analysis
-        results = {}
-        for file in target_path.rglob("*.py"):
-            print(f"Analyzing {file}...")
-            analysis_result = analyze_code(file, args.verbose)
-            results[str(file)] = analysis_result
-            # Stop after first file for MVP
-            break
+        results = analyze_directory(target_path, args.verbose, args.concurrency)
 
     elif target_path.is_file():
         results = analyze_code(target_path, args.verbose)
@@ -96,7 +129,7 @@ def main():
     elif isinstance(results, dict) and "error" in results:
         print(f"Error: {results['error']}")
     else:
-        # If it was a directory analysis (future) results could be a dict of dicts
+        # Directory analysis: dict of per-file results
         json.dump(results, sys.stdout, indent=2)
 
 
@@ -0,0 +1,193 @@
+"""
+Live Context Management for Crow
+- Keeps a running ChatSession's history inside the current model's context
+  budget, so long autonomous sessions don't need a restart to shrink
+- After each turn the estimated prompt size is checked against a high-water
+  mark; crossing it folds the oldest messages into a summary in place, down
+  to a low-water mark
+- From a soft threshold on, the window the next compaction will fold is
+  summarized ahead of time on a background worker (sized for the turn that
+  will cross the high-water mark); at the high-water mark the ready summary
+  is swapped in if the window's hash still matches
+"""
+
+import contextvars
+import hashlib
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from history_buffer import HistoryBuffer
+from tokens import TokenCounter, get_token_counter
+
+
+def compaction_text(count: int, summary: str) -> str:
+    """Text of the user message that stands in for `count` summarized messages."""
+    return f"[COMPACTED HISTORY - {count} messages summarized]\n{summary}\n[END SUMMARY]"
+
+
+def window_digest(messages: List[Dict]) -> str:
+    """Hash of the roles and text of a run of messages (what a summary of them depends on)."""
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(b"\0" + str(msg.get("role", "")).encode("utf-8") + b"\0")
+        content = " ".join(str(part) for part in msg["parts"]) if "parts" in msg else msg.get("content", "")
+        if isinstance(content, str):
+            digest.update(content.encode("utf-8"))
+        elif hasattr(content, "parts"):
+            for part in content.parts():  # StreamedPrompt
+                digest.update(part.encode("utf-8"))
+        else:
+            digest.update(json.dumps(content, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ContextManager:
+    """
+    Compacts a live session's history when it outgrows the context budget.
+
+    budget() returns the token budget for the current model; summarize(messages)
+    returns a summary of chat-format ({role, content}) messages. Compaction
+    runs at high_water x budget and folds the oldest messages until the rest
+    fits in low_water x budget, always keeping the last keep_recent messages.
+
+    Once the history passes soft_water x budget, the window that compaction
+    would fold is summarized on a background worker (background=False turns
+    this off), so crossing the high-water mark usually costs no model call.
+    The window is sized for a history one turn past high water, and a window
+    that falls short is still used as long as folding it gets the history
+    back under high water.
+    """
+
+    HIGH_WATER = 0.90
+    LOW_WATER = 0.60
+    SOFT_WATER = 0.60
+    KEEP_RECENT = 6
+
+    def __init__(
+        self,
+        budget: Callable[[], int],
+        summarize: Callable[[List[Dict]], str],
+        model_getter: Callable[[], str] = None,
+        tokens: TokenCounter = None,
+        high_water: float = HIGH_WATER,
+        low_water: float = LOW_WATER,
+        keep_recent: int = KEEP_RECENT,
+        soft_water: float = SOFT_WATER,
+        background: bool = True,
+        on_compact: Callable[[int, int, int], None] = None,
+        on_error: Callable[[Exception], None] = None
+    ):
+        if not 0 < low_water < high_water:
+            raise ValueError("low_water must be between 0 and high_water")
+        if not 0 < soft_water < high_water:
+            raise ValueError("soft_water must be between 0 and high_water")
+        self.budget = budget
+        self.summarize = summarize
+        self.model_getter = model_getter
+        self.tokens = tokens or get_token_counter()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.keep_recent = keep_recent
+        self.on_compact = on_compact  # (messages folded, tokens before, tokens after)
+        self.soft_water = soft_water
+        self.background = background
+        self.on_error = on_error
+        self.compactions = 0
+        self.presummarized = 0  # Compactions served by a background summary
+        self._executor = None
+        self._pending = None  # (count, digest, Future) for the next window
+        self._last_total = None
+        self._turn_growth = 0  # Tokens the last turn added (headroom for the background window)
+
+    def _model(self) -> Optional[str]:
+        return self.model_getter() if self.model_getter else None
+
+    def size(self, history: List[Dict]) -> int:
+        """Estimated prompt tokens for the history (O(1) for a HistoryBuffer, else cached per message)."""
+        if isinstance(history, HistoryBuffer):
+            return history.tokens(self._model())
+        return self.tokens.count_messages(history, self._model())
+
+    def after_turn(self, session) -> bool:
+        """Check the session against the high-water mark; compact in place if crossed."""
+        budget = self.budget()
+        total = self.size(session.history)
+        if self._last_total is not None and total > self._last_total:
+            self._turn_growth = total - self._last_total
+        self._last_total = total
+        if total <= budget * self.high_water:
+            if self.background and total > budget * self.soft_water and self._pending is None:
+                self._presummarize(session.history, budget)
+            return False
+        try:
+            return self.compact(session, total, budget)
+        except Exception as e:
+            # Keep the session usable - the next turn tries again
+            if self.on_error:
+                self.on_error(e)
+            return False
+
+    def _presummarize(self, history: List[Dict], budget: int):
+        """Start summarizing the window the next compaction will fold (sized for the turn that crosses high water)."""
+        count = self._window(history, budget * self.high_water + self._turn_growth, budget * self.low_water)
+        if count < 2:
+            return
+        window = list(history[:count])
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="presummarize")
+        future = self._executor.submit(contextvars.copy_context().run, self.summarize, window)
+        self._pending = (count, window_digest(window), future)
+
+    def _take_pending(self, history: List[Dict], needed: int) -> Optional[Tuple[int, Future]]:
+        """The background summary job, if it covers at least `needed` messages that haven't changed."""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return None
+        count, digest, future = pending
+        if count < needed or count > len(history) - self.keep_recent \
+                or window_digest(history[:count]) != digest:
+            future.cancel()
+            return None
+        return count, future
+
+    def _window(self, history: List[Dict], total: int, target: float) -> int:
+        """How many of the oldest messages to fold so the rest fits in target tokens."""
+        model = self._model()
+        count, remaining = 0, total
+        limit = len(history) - self.keep_recent
+        while count < limit and remaining > target:
+            if isinstance(history, HistoryBuffer):
+                remaining -= history.message_tokens(count, model)
+            else:
+                remaining -= self.tokens.count_message(history[count], model)
+            count += 1
+        return count
+
+    def compact(self, session, total: int, budget: int) -> bool:
+        """Replace the oldest messages with one summary message (precomputed if still valid)."""
+        history = session.history
+        needed = self._window(history, total, budget * self.low_water)
+        if needed < 2:
+            return False  # Nothing worth folding (the recent messages alone are over budget)
+
+        # A shorter background window still serves if it gets the rest under high water
+        summary = None
+        pending = self._take_pending(history, self._window(history, total, budget * self.high_water))
+        if pending is not None:
+            count, future = pending
+            try:
+                summary = future.result()  # Usually done already; otherwise still ahead of a fresh call
+                self.presummarized += 1
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+        if summary is None:
+            count = needed
+            summary = self.summarize(history[:count])
+        history[:count] = [{"role": "user", "content": compaction_text(count, summary)}]
+        self.compactions += 1
+        if self.on_compact:
+            self.on_compact(count, total, self.size(history))
+        self._last_total = self.size(history)
+        return True
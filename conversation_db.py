@@ -0,0 +1,236 @@
+"""
+Conversation Database for Crow
+- SQLite store with one row per message (session, turn, role, timestamp)
+- FTS5 full-text index over message content (falls back to LIKE scans
+  when the SQLite build has no FTS5)
+- Query API so SEARCH_HISTORY and the Dreamer can pull the relevant past
+  turns locally instead of shipping whole conversation files to a model
+- Summary trees from hierarchical compaction: only the top summary stays in
+  context, the lower levels are kept here for retrieval
+- Compaction summaries memoized by message-block hash, so a restart that
+  compacts the same block again reuses the paid-for summary
+"""
+
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session TEXT,
+    turn INTEGER,
+    role TEXT NOT NULL,
+    ts TEXT,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_role_ts ON messages(role, ts);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages(ts);
+CREATE INDEX IF NOT EXISTS messages_session_turn ON messages(session, turn);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    tree INTEGER,
+    level INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    messages INTEGER,
+    ts TEXT,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS summaries_tree ON summaries(tree, level, position);
+CREATE TABLE IF NOT EXISTS compaction_summaries (
+    digest TEXT PRIMARY KEY,
+    messages INTEGER,
+    ts TEXT,
+    summary TEXT NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+SNIPPET_TOKENS = 24  # Words of context around each match
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: any of its words, each quoted (no syntax errors)."""
+    words = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+
+
+class ConversationDB:
+    """One-row-per-message conversation store, safe to share between threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            try:
+                self._conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False  # SQLite built without FTS5 - search with LIKE
+
+    @staticmethod
+    def _content(record: Dict) -> str:
+        """Text of a stored ({role, parts}) or chat ({role, content}) message."""
+        if "parts" in record:
+            return "\n".join(str(part) for part in record["parts"])
+        return str(record.get("content", ""))
+
+    def add_messages(self, records: Iterable[Dict], session: str = None, turn: int = None) -> int:
+        """Insert messages; each record may carry its own ts / session / turn."""
+        now = datetime.now().isoformat()
+        rows = [
+            (record.get("session", session), record.get("turn", turn),
+             "assistant" if record.get("role") == "model" else record.get("role", "user"),
+             record.get("ts", now), self._content(record))
+            for record in records
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (session, turn, role, ts, content) VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def backfill(self, records: Iterable[Dict], session: str = "imported", batch: int = 1000) -> int:
+        """Import existing history into an empty database (no-op once it has rows)."""
+        if self.count():
+            return 0
+        total = 0
+        pending = []
+        for record in records:
+            pending.append(record)
+            if len(pending) >= batch:
+                total += self.add_messages(pending, session)
+                pending = []
+        return total + self.add_messages(pending, session)
+
+    def _filters(self, role: Optional[str], session: Optional[str], since: Optional[str]):
+        clauses, params = [], []
+        for column, value, op in (("role", role, "="), ("session", session, "="), ("ts", since, ">=")):
+            if value:
+                clauses.append(f"m.{column} {op} ?")
+                params.append(value)
+        return clauses, params
+
+    def search(self, query: str, limit: int = 10, role: str = None, session: str = None,
+               since: str = None) -> List[Dict]:
+        """
+        Best-matching messages for free text, most relevant first.
+
+        Each result has id, session, turn, role, ts and a snippet around the match.
+        """
+        clauses, params = self._filters(role, session, since)
+        match = fts_query(query)
+        if not match:
+            return self.recent(limit, role, session, since)
+
+        with self._lock:
+            if self.fts:
+                where = " AND ".join(["messages_fts MATCH ?"] + clauses)
+                rows = self._conn.execute(
+                    f"SELECT m.id, m.session, m.turn, m.role, m.ts, "
+                    f"snippet(messages_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet "
+                    f"FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                    f"WHERE {where} ORDER BY bm25(messages_fts) LIMIT ?",
+                    [match] + params + [limit]
+                ).fetchall()
+            else:
+                words = re.findall(r"\w+", query.lower())
+                where = " AND ".join([f"({' OR '.join(['m.content LIKE ?'] * len(words))})"] + clauses)
+                rows = self._conn.execute(
+                    f"SELECT m.id, m.session, m.turn, m.role, m.ts, substr(m.content, 1, 300) AS snippet "
+                    f"FROM messages m WHERE {where} ORDER BY m.id DESC LIMIT ?",
+                    [f"%{word}%" for word in words] + params + [limit]
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recent(self, limit: int = 10, role: str = None, session: str = None, since: str = None) -> List[Dict]:
+        """The latest messages, newest first."""
+        clauses, params = self._filters(role, session, since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT m.id, m.session, m.turn, m.role, m.ts, substr(m.content, 1, 300) AS snippet "
+                f"FROM messages m {where} ORDER BY m.id DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def around(self, message_id: int, before: int = 2, after: int = 2) -> List[Dict]:
+        """Full messages surrounding one search hit, in order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, session, turn, role, ts, content FROM messages WHERE id BETWEEN ? AND ? ORDER BY id",
+                (message_id - before, message_id + after)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_summary_tree(self, levels: List[List[str]], messages: int) -> int:
+        """Store every level of a hierarchical summary; returns the tree id (the top summary's row)."""
+        now = datetime.now().isoformat()
+        top = len(levels) - 1
+        with self._lock, self._conn:
+            tree = self._conn.execute(
+                "INSERT INTO summaries (level, position, messages, ts, content) VALUES (?, 0, ?, ?, ?)",
+                (top, messages, now, levels[top][0])
+            ).lastrowid
+            self._conn.execute("UPDATE summaries SET tree = ? WHERE id = ?", (tree, tree))
+            self._conn.executemany(
+                "INSERT INTO summaries (tree, level, position, messages, ts, content) VALUES (?, ?, ?, ?, ?, ?)",
+                [(tree, level, position, messages, now, content)
+                 for level in range(top) for position, content in enumerate(levels[level])]
+            )
+        return tree
+
+    def summary_tree(self, tree: int) -> List[Dict]:
+        """Every summary in a tree, top level first, oldest part first within a level."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, level, position, messages, ts, content FROM summaries "
+                "WHERE tree = ? ORDER BY level DESC, position",
+                (tree,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def compaction_summary(self, digest: str) -> Optional[str]:
+        """Summary stored for this message block, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM compaction_summaries WHERE digest = ?", (digest,)
+            ).fetchone()
+        return row["summary"] if row else None
+
+    def add_compaction_summary(self, digest: str, messages: int, summary: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO compaction_summaries (digest, messages, ts, summary) VALUES (?, ?, ?, ?)",
+                (digest, messages, datetime.now().isoformat(), summary)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,164 @@
+"""
+Conversation Log for Crow
+- Append-only JSON-lines storage for the complete conversation history
+  (replaces rewriting conversation_full.json in full every turn)
+- Each save appends only the messages added since the last one
+- Split into segments by size (and optionally by day); closed segments are
+  zstd-compressed when the zstandard package is installed
+- Reader API (iter_messages / read_all) for a full-history view
+"""
+
+import io
+import json
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})-(\d{8})\.jsonl(\.zst)?$")
+MAX_SEGMENT_BYTES = 8 * 1024 * 1024
+ZSTD_LEVEL = 10
+
+
+class ConversationLog:
+    """
+    Segmented, append-only message log in one directory.
+
+    sync() finds new messages by the identity of the last message it
+    persisted, so a turn costs O(new messages) no matter how long the
+    session is. Only the newest segment is ever appended to.
+    """
+
+    def __init__(self, directory: Path, max_segment_bytes: int = MAX_SEGMENT_BYTES,
+                 rotate_daily: bool = False, compress: bool = True):
+        self.directory = Path(directory)
+        self.max_segment_bytes = max_segment_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress and zstandard is not None
+        self._last = None  # Last message object persisted by sync()
+        self._lock = threading.Lock()
+
+    def segments(self) -> List[Path]:
+        """Segment files, oldest first."""
+        if not self.directory.exists():
+            return []
+        found = [p for p in self.directory.iterdir() if SEGMENT_PATTERN.match(p.name)]
+        return sorted(found, key=lambda p: int(SEGMENT_PATTERN.match(p.name).group(1)))
+
+    def _open_segment(self) -> Path:
+        """The segment to append to, rotating (and compressing) the current one if it is full."""
+        segments = self.segments()
+        today = datetime.now().strftime("%Y%m%d")
+        current = segments[-1] if segments else None
+        if current is not None and not current.name.endswith(".zst"):
+            match = SEGMENT_PATTERN.match(current.name)
+            full = current.stat().st_size >= self.max_segment_bytes
+            stale = self.rotate_daily and match.group(2) != today
+            if not (full or stale):
+                return current
+            self._close_segment(current)
+
+        index = int(SEGMENT_PATTERN.match(current.name).group(1)) + 1 if current else 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / f"segment-{index:06d}-{today}.jsonl"
+
+    def _close_segment(self, path: Path):
+        if not self.compress:
+            return
+        target = path.with_name(path.name + ".zst")
+        tmp = target.with_name(target.name + ".tmp")
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+        os.replace(tmp, target)
+        path.unlink()
+
+    def append(self, records: List[Dict]) -> List[Dict]:
+        """Append stored-format records ({"role", "parts"}); returns them stamped with the time written."""
+        if not records:
+            return []
+        ts = datetime.now().isoformat()
+        records = [dict(record, ts=record.get("ts", ts)) for record in records]
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        data = lines.encode("utf-8")
+        with self._lock:
+            with open(self._open_segment(), "a+b") as f:
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        data = b"\n" + data  # Don't glue onto a line torn by a crash
+                f.write(data)
+        return records
+
+    def _new_from(self, history: Sequence) -> int:
+        """Index of the first message not yet persisted."""
+        if self._last is None:
+            return 0
+        for i in range(len(history) - 1, -1, -1):
+            if history[i] is self._last:
+                return i + 1
+        # History was rebuilt (e.g. reloaded) - fall back to matching by value
+        for i in range(len(history) - 1, -1, -1):
+            if history[i] == self._last:
+                return i + 1
+        return 0
+
+    def sync(self, history: Sequence, to_record: Callable[[object], Dict] = None) -> List[Dict]:
+        """Append the messages added to `history` since the last sync; returns the records written."""
+        start = self._new_from(history)
+        new = [history[i] for i in range(start, len(history))]
+        written = self.append([to_record(item) for item in new] if to_record else new)
+        if len(history):
+            self._last = history[len(history) - 1]
+        return written
+
+    def mark_synced(self, history: Sequence):
+        """Treat everything currently in `history` as already persisted (e.g. after loading it)."""
+        self._last = history[len(history) - 1] if len(history) else None
+
+    def migrate(self, legacy_file: Path) -> int:
+        """Import a legacy conversation_full.json into an empty log and remove it."""
+        legacy_file = Path(legacy_file)
+        if not legacy_file.exists() or self.segments():
+            return 0
+        with open(legacy_file) as f:
+            records = json.load(f)
+        self.append(records)
+        legacy_file.unlink()
+        return len(records)
+
+    def iter_messages(self) -> Iterator[Dict]:
+        """Every stored message, oldest first (one segment in memory at a time at most)."""
+        for path in self.segments():
+            if path.name.endswith(".zst"):
+                if zstandard is None:
+                    raise RuntimeError(f"{path.name} is zstd-compressed; install zstandard to read it")
+                with open(path, "rb") as raw:
+                    reader = zstandard.ZstdDecompressor().stream_reader(raw)
+                    yield from self._parse(io.TextIOWrapper(reader, encoding="utf-8"))
+            else:
+                with open(path, encoding="utf-8") as f:
+                    yield from self._parse(f)
+
+    @staticmethod
+    def _parse(lines) -> Iterator[Dict]:
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # Torn final line from a crash mid-write
+
+    def read_all(self) -> List[Dict]:
+        """The full history as one list (the shape conversation_full.json had)."""
+        return list(self.iter_messages())
+
+    def tail(self, count: int) -> List[Dict]:
+        """The last `count` messages."""
+        return list(deque(self.iter_messages(), maxlen=count))
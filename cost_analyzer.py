@@ -4,7 +4,10 @@ from pathlib import Path
 
 def analyze_costs(ledger_path: Path):
     total_cost_usd = 0.0
-    model_stats = defaultdict(lambda: {"total_tokens": 0, "total_cost_usd": 0.0, "calls": 0})
+    # Per-subsystem call timings: where a slow turn's time went (model vs payload vs queueing)
+    latency_stats = defaultdict(lambda: {"calls": 0, "wall_ms": 0.0, "ttfb_ms": 0.0, "rate_wait_ms": 0.0,
+                                         "request_bytes": 0, "response_bytes": 0})
+    model_stats = defaultdict(lambda: {"total_tokens": 0, "total_cost_usd": 0.0, "calls": 0, "cache_hits": 0, "cached_prompt_tokens": 0, "hedge_calls": 0, "hedge_cost_usd": 0.0})
     
     if not ledger_path.exists():
         print(f"Ledger file not found at {ledger_path}")
@@ -15,6 +18,10 @@ def analyze_costs(ledger_path: Path):
             try:
                 entry = json.loads(line)
                 model = entry.get("model", "unknown")
+                if entry.get("cache") == "hit":
+                    # Served from the response cache - nothing billed
+                    model_stats[model]["cache_hits"] += 1
+                    continue
                 cost_usd = entry.get("cost_usd")
                 total_tokens = entry.get("total_tokens", 0)
 
@@ -23,7 +30,17 @@ def analyze_costs(ledger_path: Path):
                     model_stats[model]["total_cost_usd"] += cost_usd
                 
                 model_stats[model]["total_tokens"] += total_tokens
+                model_stats[model]["cached_prompt_tokens"] += entry.get("cached_prompt_tokens", 0)
                 model_stats[model]["calls"] += 1
+                if entry.get("wall_ms") is not None:
+                    stats = latency_stats[entry.get("subsystem", "unknown")]
+                    stats["calls"] += 1
+                    for field in ("wall_ms", "ttfb_ms", "rate_wait_ms", "request_bytes", "response_bytes"):
+                        stats[field] += entry.get(field) or 0
+                if entry.get("hedge_role") == "backup":
+                    # Extra request sent because a hedged call's first byte was slow
+                    model_stats[model]["hedge_calls"] += 1
+                    model_stats[model]["hedge_cost_usd"] += cost_usd or 0.0
 
             except json.JSONDecodeError as e:
                 print(f"Error decoding JSON from ledger: {e} - Line: {line.strip()}")
@@ -36,12 +53,30 @@ def analyze_costs(ledger_path: Path):
     for model, stats in model_stats.items():
         print(f"Model: {model}")
         print(f"  Total Calls: {stats['calls']}")
+        if stats['cache_hits']:
+            print(f"  Cache Hits: {stats['cache_hits']}")
         print(f"  Total Tokens: {stats['total_tokens']:,}")
+        if stats['cached_prompt_tokens']:
+            print(f"  Prompt Tokens Read From Cache: {stats['cached_prompt_tokens']:,}")
+        if stats['hedge_calls']:
+            print(f"  Hedge Duplicates: {stats['hedge_calls']} calls, ${stats['hedge_cost_usd']:.6f}")
         print(f"  Total Cost (USD): ${stats['total_cost_usd']:.6f}")
         if stats['calls'] > 0:
             print(f"  Average Cost per Call: ${stats['total_cost_usd'] / stats['calls']:.6f}")
         print("-" * 20)
 
+    if latency_stats:
+        print("\n--- Call Latency by Subsystem (averages) ---")
+        for subsystem, stats in sorted(latency_stats.items()):
+            calls = stats["calls"]
+            print(f"Subsystem: {subsystem}")
+            print(f"  Calls: {calls}")
+            print(f"  Wall Time: {stats['wall_ms'] / calls:,.0f} ms "
+                  f"(first byte {stats['ttfb_ms'] / calls:,.0f} ms, rate-limit wait {stats['rate_wait_ms'] / calls:,.0f} ms)")
+            print(f"  Request Size: {stats['request_bytes'] / calls / 1024:,.1f} KB, "
+                  f"Response Size: {stats['response_bytes'] / calls / 1024:,.1f} KB")
+            print("-" * 20)
+
 if __name__ == "__main__":
     current_dir = Path(__file__).parent
     ledger_file = current_dir / "logs" / "ledger.log"
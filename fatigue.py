@@ -50,7 +50,9 @@ class FatigueManager:
             "warning_threshold": 0.80,
             "auto_sleep": True,
             "context_utilization": 0.80,
-            "chars_per_token": 4
+            "chars_per_token": 4,
+            "failover": {"after_failures": 2, "latency_slo_seconds": 90, "fallbacks": {}},
+            "hedge": {"cheaper_tier": True, "after_seconds": 20}
         }
 
         # Save default config
@@ -134,6 +136,65 @@ class FatigueManager:
         utilization = self.config.get("context_utilization", 0.80)
         return int(self.get_context_chars() * utilization)
 
+    def get_context_token_budget(self) -> int:
+        """Get the target context budget (tokens) accounting for utilization target."""
+        utilization = self.config.get("context_utilization", 0.80)
+        return int(self.get_context_tokens() * utilization)
+
+    def get_failover_config(self) -> Dict:
+        """Failover policy: failures / latency SLO before rerouting, plus optional explicit chains."""
+        return self.config.get("failover", {})
+
+    def get_fallback_chain(self, model: str) -> List[str]:
+        """
+        Models to fail over to when `model` is degraded.
+
+        Uses the configured chain (failover.fallbacks[model]) if there is one,
+        otherwise the models of the tiers after the one using `model`.
+        """
+        configured = self.get_failover_config().get("fallbacks", {}).get(model)
+        if configured is not None:
+            return [m for m in configured if m != model]
+
+        tier_models = [tier["model"] for tier in self.config["tiers"]]
+        if model not in tier_models:
+            return []
+        chain = []
+        for candidate in tier_models[tier_models.index(model) + 1:]:
+            if candidate != model and candidate not in chain:
+                chain.append(candidate)
+        return chain
+
+    def get_hedge_config(self) -> Dict:
+        """Hedged-request policy: whether duplicates go to a cheaper tier, default delay."""
+        return self.config.get("hedge", {})
+
+    def get_hedge_model(self, model: str) -> str:
+        """Model for the duplicate of a slow hedged call: the next tier if configured, else the same model."""
+        if self.get_hedge_config().get("cheaper_tier", True):
+            chain = self.get_fallback_chain(model)
+            if chain:
+                return chain[0]
+        return model
+
+    def record_failover(self, from_model: str, to_model: str, reason: str):
+        """Remember a failover so the turn's fatigue status can show it."""
+        self.state["last_failover"] = {
+            "turn": self.state["current_turn"],
+            "from": from_model,
+            "to": to_model,
+            "reason": reason,
+            "timestamp": datetime.now().isoformat()
+        }
+        self._save_state()
+
+    def get_recent_failover(self) -> Optional[Dict]:
+        """Failover that happened during the previous or current turn, if any."""
+        failover = self.state.get("last_failover")
+        if failover and failover.get("turn", -1) >= self.state["current_turn"] - 1:
+            return failover
+        return None
+
     def get_tier_info(self) -> Tuple[str, int, int]:
         """Get current tier info: (model_name, tier_turn, tier_total)."""
         turn = self.state["current_turn"]
@@ -188,20 +249,26 @@ class FatigueManager:
             "status_level": self.get_status_level(),
             "status_message": self.get_status_message(),
             "context_tokens": context_tokens,
-            "context_k": f"{context_tokens // 1000}k"
+            "context_k": f"{context_tokens // 1000}k",
+            "failover": self.get_recent_failover()
         }
 
     def format_status_block(self) -> str:
         """Format fatigue status as a block for prompt injection."""
         status = self.get_status()
 
-        return f"""[FATIGUE STATUS]
+        block = f"""[FATIGUE STATUS]
 Turn: {status['turn']}/{status['total_turns']}
 Fatigue: {status['fatigue_percent']}%
 Model: {status['model_short']} ({status['context_k']} context)
 Turns remaining: {status['turns_remaining']}
 Status: {status['status_message']}"""
 
+        failover = status["failover"]
+        if failover:
+            block += f"\nFailover: {failover['from'].split('/')[-1]} -> {failover['to'].split('/')[-1]} ({failover['reason']})"
+        return block
+
     def increment_turn(self) -> bool:
         """
         Increment turn counter and save state.
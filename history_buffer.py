@@ -0,0 +1,169 @@
+"""
+History Buffer for Crow
+- List-like conversation history that keeps running character and token
+  totals, so budget checks are O(1) instead of a rescan of every message
+- Dropping from the front is O(1) (an offset into the backing list, which is
+  trimmed once the dead prefix outgrows the live part)
+- Used from load_history through the live ChatSession, so compaction loops
+  and the per-turn context check never re-count the whole history
+- Per-message token counts can be saved with the history and handed back on
+  load, so a restart doesn't re-tokenize every message
+"""
+
+from collections.abc import MutableSequence
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from tokens import TokenCounter, get_token_counter
+
+
+def message_chars(msg: Dict) -> int:
+    """Characters of text in a chat ({role, content}) or stored ({role, parts}) message."""
+    content = msg.get("content")
+    if content is None:
+        return sum(len(str(part)) for part in msg.get("parts") or [])
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(len(block.get("text", "")) if isinstance(block, dict) else len(str(block)) for block in content)
+    return len(str(content))
+
+
+class HistoryBuffer(MutableSequence):
+    """
+    Message list with running size totals.
+
+    Sizes are taken when a message is added, so messages should be replaced
+    (not edited in place) for the totals to stay exact. Token totals are kept
+    unscaled and scaled per model on query, like TokenCounter.count_messages.
+    """
+
+    def __init__(self, messages: Iterable[Dict] = (), tokens: TokenCounter = None):
+        self.counter = tokens or get_token_counter()
+        self._items: List[Dict] = []
+        self._sizes: List[Tuple[int, int]] = []  # (chars, unscaled tokens) per message
+        self._start = 0
+        self.chars = 0
+        self.base_tokens = 0
+        self.extend(messages)
+
+    def _size(self, msg: Dict, base_tokens: int = None) -> Tuple[int, int]:
+        if base_tokens is None:
+            base_tokens = self.counter.count_base((msg,))
+        return message_chars(msg), base_tokens
+
+    def tokens(self, model: str = None) -> int:
+        """Estimated prompt tokens for `model` (same as TokenCounter.count_messages, in O(1))."""
+        return round(self.base_tokens * self.counter.scale(model))
+
+    def message_tokens(self, index: int, model: str = None) -> int:
+        """Estimated tokens of one message, from its recorded size."""
+        return round(self._sizes[self._index(index)][1] * self.counter.scale(model))
+
+    def base_token_sizes(self) -> List[int]:
+        """Unscaled token count of each message, oldest first (what append(..., base_tokens) takes back)."""
+        return [tokens for _, tokens in self._sizes[self._start:]]
+
+    def _add(self, sizes: Iterable[Tuple[int, int]], sign: int):
+        for chars, tokens in sizes:
+            self.chars += sign * chars
+            self.base_tokens += sign * tokens
+
+    def _trim(self):
+        """Drop the dead prefix from the backing lists (amortized O(1) per popleft)."""
+        if self._start:
+            del self._items[:self._start]
+            del self._sizes[:self._start]
+            self._start = 0
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        return self._start + index
+
+    def __len__(self) -> int:
+        return len(self._items) - self._start
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._start, len(self._items)):
+            yield self._items[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step > 0:
+                return self._items[self._start + start:self._start + stop:step]  # A plain list
+            return list(self)[index]
+        return self._items[self._index(index)]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self._trim()
+            value = list(value)
+            sizes = [self._size(msg) for msg in value]
+            self._add(self._sizes[index], -1)
+            self._items[index] = value
+            self._sizes[index] = sizes
+            self._add(sizes, 1)
+            return
+        i = self._index(index)
+        size = self._size(value)
+        self._add((self._sizes[i],), -1)
+        self._items[i], self._sizes[i] = value, size
+        self._add((size,), 1)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            self._trim()
+            self._add(self._sizes[index], -1)
+            del self._items[index]
+            del self._sizes[index]
+            return
+        if index in (0, -len(self)) and len(self):
+            self.popleft()
+            return
+        i = self._index(index)
+        self._add((self._sizes[i],), -1)
+        del self._items[i]
+        del self._sizes[i]
+
+    def insert(self, index: int, value: Dict):
+        self._trim()
+        size = self._size(value)
+        self._items.insert(index, value)
+        self._sizes.insert(index, size)
+        self._add((size,), 1)
+
+    def append(self, value: Dict, base_tokens: int = None):
+        """Add a message; base_tokens is its known unscaled count (e.g. saved with the history)."""
+        size = self._size(value, base_tokens)
+        self._items.append(value)
+        self._sizes.append(size)
+        self._add((size,), 1)
+
+    def extend(self, values: Iterable[Dict]):
+        for value in values:
+            self.append(value)
+
+    def pop(self, index: int = -1) -> Dict:
+        if index in (0, -len(self)):
+            return self.popleft()
+        value = self[index]
+        del self[index]
+        return value
+
+    def popleft(self) -> Dict:
+        """Remove and return the oldest message in O(1)."""
+        if not len(self):
+            raise IndexError("pop from empty history")
+        value, size = self._items[self._start], self._sizes[self._start]
+        self._items[self._start] = None  # Let it be freed before the next trim
+        self._start += 1
+        self._add((size,), -1)
+        if self._start > len(self):
+            self._trim()
+        return value
+
+    def __repr__(self) -> str:
+        return f"HistoryBuffer({len(self)} messages, {self.chars:,} chars, {self.base_tokens:,} tokens)"
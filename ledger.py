@@ -0,0 +1,281 @@
+"""
+Ledger Writer for Crow
+- Write-behind, batched appends to logs/ledger.log and logs/openrouter_errors.log
+- A background thread flushes every flush_interval seconds or max_batch entries,
+  so request paths (sync, async, batch jobs) never wait on file I/O
+- Bounded queue with a backpressure policy; drained at exit (including
+  sys.exit(42) restarts and uncaught exceptions) via atexit
+- Per-call instrumentation: CallMetrics (timings, payload sizes) and
+  ledger_context (calling subsystem, retry attempt) merged into every entry
+"""
+
+import atexit
+import contextvars
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Union
+
+LOGS_DIR = Path(__file__).parent / "logs"
+LEDGER_FILE = "ledger.log"
+ERROR_FILE = "openrouter_errors.log"
+
+
+class LedgerWriter:
+    """
+    Batched, write-behind appender for JSON-lines ledgers and plain-text logs.
+
+    Backpressure when the queue is full:
+      "block" - wait up to put_timeout for space, then write inline (nothing is lost)
+      "drop"  - discard the entry and count it (reported in stats and the error log)
+    """
+
+    def __init__(
+        self,
+        directory: Path = None,
+        flush_interval: float = 1.0,
+        max_batch: int = 200,
+        max_queue: int = 10000,
+        backpressure: str = "block",
+        put_timeout: float = 1.0
+    ):
+        if backpressure not in ("block", "drop"):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        self.directory = Path(directory or LOGS_DIR)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.backpressure = backpressure
+        self.put_timeout = put_timeout
+
+        self.written = 0
+        self.dropped = 0
+        self.inline_writes = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._write_lock = threading.Lock()  # Worker and inline writes never interleave
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, entry: Dict, filename: str = LEDGER_FILE):
+        """Queue one JSON line (returns immediately unless the queue is full)."""
+        self._enqueue(filename, json.dumps(entry) + "\n")
+
+    def error(self, message: str, filename: str = ERROR_FILE):
+        """Queue a timestamped line for the error log."""
+        self._enqueue(filename, f"[{datetime.now().isoformat()}] {message}\n")
+
+    def _enqueue(self, filename: str, line: str):
+        if self._closed:
+            self._write({filename: [line]})
+            return
+        try:
+            self._queue.put_nowait((filename, line))
+            return
+        except queue.Full:
+            pass
+
+        if self.backpressure == "drop":
+            self.dropped += 1
+            return
+        try:
+            self._queue.put((filename, line), timeout=self.put_timeout)
+        except queue.Full:
+            # Writer can't keep up - write in the caller rather than lose a cost record
+            self.inline_writes += 1
+            self._write({filename: [line]})
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until everything queued so far is on disk. Returns False on timeout."""
+        if self._closed or not self._thread.is_alive():
+            self._drain()
+            return True
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Flush and stop the writer thread; later entries are written inline."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._drain()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            # Collect a batch: up to max_batch lines or flush_interval seconds
+            batch = {}
+            waiters = []
+            count = 0
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                filename, line = item
+                if filename is None:
+                    waiters.append(line)
+                    break  # Flush request - write what we have now
+                batch.setdefault(filename, []).append(line)
+                count += 1
+                if count >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _drain(self):
+        """Write whatever is still queued, in the calling thread."""
+        batch = {}
+        while True:
+            try:
+                filename, line = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if filename is None:
+                line.set()
+            else:
+                batch.setdefault(filename, []).append(line)
+        self._write(batch)
+
+    def _write(self, batch: Dict[str, list]):
+        if not batch:
+            return
+        with self._write_lock:
+            if self.dropped:
+                batch.setdefault(ERROR_FILE, []).append(
+                    f"[{datetime.now().isoformat()}] Ledger queue full: dropped {self.dropped} entries\n"
+                )
+                self.dropped = 0
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                for filename, lines in batch.items():
+                    with open(self.directory / filename, "a") as f:
+                        f.write("".join(lines))
+                    self.written += len(lines)
+            except OSError:
+                pass  # Accounting must never take the process down
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "inline_writes": self.inline_writes
+        }
+
+
+_context = contextvars.ContextVar("ledger_context", default={})
+
+
+@contextmanager
+def ledger_context(**fields):
+    """
+    Tag every ledger entry written inside the block, e.g.
+    ledger_context(subsystem="compaction") or ledger_context(retries=2).
+
+    Context variables follow the calling thread/task; work handed to a
+    thread pool must be submitted with contextvars.copy_context().run.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def context_fields() -> Dict:
+    """Fields set by the enclosing ledger_context blocks."""
+    return dict(_context.get())
+
+
+def call_path(entry: Dict) -> str:
+    """How a call was served: direct, cache, failover, hedge or replay (combined with '+')."""
+    path = [name for name, taken in (
+        ("cache", entry.get("cache") == "hit"),
+        ("replay", bool(entry.get("replay"))),
+        ("failover", bool(entry.get("failover_from"))),
+        ("hedge", bool(entry.get("hedge_role"))),
+    ) if taken]
+    return "+".join(path) or "direct"
+
+
+class CallMetrics:
+    """Timing and payload-size measurements for one API call."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rate_wait = 0.0
+        self.first_byte = None
+        self.first_token = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.estimated_prompt_tokens = None  # Local estimate, checked against the reported usage
+        self.token_scale = None
+
+    def count_request(self, body: Union[bytes, Iterable[bytes]]) -> Union[bytes, Iterator[bytes]]:
+        """Record the request size; a chunked body is wrapped and counted as it is sent."""
+        if isinstance(body, bytes):
+            self.request_bytes = len(body)
+            return body
+        return self._counted(body)
+
+    def _counted(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.request_bytes += len(chunk)
+            yield chunk
+
+    def mark_first_byte(self):
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def fields(self) -> Dict:
+        def ms(at):
+            return round((at - self.started) * 1000, 1) if at is not None else None
+
+        fields = {
+            "wall_ms": ms(time.monotonic()),
+            "rate_wait_ms": round(self.rate_wait * 1000, 1),
+            "ttfb_ms": ms(self.first_byte),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes
+        }
+        if self.first_token is not None:
+            fields["ttft_ms"] = ms(self.first_token)
+        if self.estimated_prompt_tokens is not None:
+            fields["estimated_prompt_tokens"] = self.estimated_prompt_tokens
+            fields["token_scale"] = round(self.token_scale, 4)
+        return fields
+
+
+_default_ledger = None
+_default_lock = threading.Lock()
+
+
+def get_ledger() -> LedgerWriter:
+    """Process-wide ledger writer, flushed automatically at exit."""
+    global _default_ledger
+    with _default_lock:
+        if _default_ledger is None:
+            _default_ledger = LedgerWriter()
+            atexit.register(_default_ledger.close)
+        return _default_ledger
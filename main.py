@@ -12,15 +12,26 @@ import select
 import subprocess
 import threading
 from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 import time
-import random
 
 # Crow's fatigue and model management
 from fatigue import FatigueManager
 from openrouter_client import OpenRouterClient, GenerativeModel
+from rate_limit import CircuitOpenError, is_retryable, retry_delay
+from response_cache import ResponseCache
+from payload import StreamedPrompt
+from ledger import ledger_context
+from tokens import get_token_counter
+from cassette import Cassette
+from conversation_log import ConversationLog
+from conversation_db import ConversationDB
+from context_manager import ContextManager, compaction_text, window_digest
+from summarizer import HierarchicalSummarizer, SummaryError, message_text
+from history_buffer import HistoryBuffer
 
 # Load .env from Crow root
 load_dotenv(Path(__file__).parent / '.env')
@@ -41,15 +52,20 @@ MODE_FILE = WORKSPACE / ".mode"
 
 # Conversation history files
 HISTORY_FILE = WORKSPACE / "conversation.json"  # Compacted for loading
-HISTORY_FULL_FILE = WORKSPACE / "conversation_full.json"  # Complete history for posterity
+HISTORY_FULL_FILE = WORKSPACE / "conversation_full.json"  # Legacy full history (migrated into the log)
+HISTORY_LOG_DIR = WORKSPACE / "conversation_full"  # Complete history for posterity (append-only segments)
+HISTORY_DB = WORKSPACE / "conversation.db"  # Searchable index of every message (SQLite + FTS5)
+SEARCH_HISTORY_LIMIT = 10  # Matches returned per SEARCH_HISTORY
+SUMMARY_TREE_QUERY = re.compile(r"^\s*summary\s+#?(\d+)\s*$", re.IGNORECASE)  # SEARCH_HISTORY summary <id>
 
 # Dreams directory
 DREAMS_DIR = WORKSPACE / "memory" / "dreams"
 DREAMS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Context budget - now dynamic per model via fatigue system
-# These are fallback defaults; actual values come from fatigue.get_context_budget()
-DEFAULT_CONTEXT_CHARS = 4000000  # Fallback for 1M token models
+# These are fallback defaults; actual values come from fatigue.get_context_token_budget()
+DEFAULT_CONTEXT_TOKENS = 1000000  # Fallback for 1M token models
+DEFAULT_CONTEXT_CHARS = 4000000   # Size guard for one-shot prompts (repo dumps)
 COMPACTION_RATIO = 0.20          # Compact this % of oldest history when triggered
 
 # ANSI colors
@@ -64,8 +80,21 @@ class C:
     RESET = '\033[0m'
 
 # Directories and patterns to skip when gathering repo
-SKIP_DIRS = {'.git', '__pycache__', 'node_modules', 'logs', '.venv', 'venv', '.env', 'dist', 'build', 'backup'}
-SKIP_EXTENSIONS = {'.pyc', '.pyo', '.so', '.dylib', '.dll', '.exe', '.bin', '.pkl', '.pickle', '.jpg', '.jpeg', '.png', '.gif', '.ico', '.pdf', '.zip', '.tar', '.gz'}
+SKIP_DIRS = {'.git', '__pycache__', 'node_modules', 'logs', '.venv', 'venv', '.env', 'dist', 'build', 'backup', '.cache'}
+SKIP_EXTENSIONS = {'.pyc', '.pyo', '.so', '.dylib', '.dll', '.exe', '.bin', '.pkl', '.pickle', '.jpg', '.jpeg', '.png', '.gif', '.ico', '.pdf', '.zip', '.tar', '.gz', '.zst', '.db', '.db-wal', '.db-shm'}
+
+# Actions Crow can respond with (see system_instructions.txt)
+VALID_ACTIONS = ['THINK', 'TALK_TO_USER', 'RUN_COMMAND', 'INTERNAL_QUERY', 'SEARCH_HISTORY', 'CODE_ANALYZE', 'RESTART_SELF', 'DREAM']
+
+# Streaming: print THINK/TALK_TO_USER text as it arrives (disable with --no-stream)
+STREAM = "--no-stream" not in sys.argv
+STREAM_DISPLAY = {"THINK": C.THINK, "TALK_TO_USER": C.CROW}
+
+# Hedged requests: in interactive mode, duplicate a turn whose first byte is slow (enable with --hedge)
+HEDGE = "--hedge" in sys.argv
+
+# Actions that may start running while the rest of the response is still streaming
+EAGER_ACTIONS = {"RUN_COMMAND", "INTERNAL_QUERY"}
 
 # Mode and message queue
 MODE = "interactive"  # "interactive" or "autonomous"
@@ -226,38 +255,276 @@ def get_queued_messages():
     return messages
 
 
-def log(msg=""):
-    """Print and log to file."""
-    print(msg)
+def log(msg="", echo=True):
+    """Print and log to file (echo=False for text already shown by streaming)."""
+    if echo:
+        print(msg)
     with open(LOG_FILE, "a") as f:
         f.write(msg + "\n")
 
 
-def retry_with_backoff(func, max_retries=10, base_delay=2):
-    """Retry a function with exponential backoff on transient errors."""
+def sleep_with_heartbeat(seconds):
+    """Sleep without looking stalled to run.py."""
+    deadline = time.time() + seconds
+    while True:
+        heartbeat()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 10))
+
+
+def retry_with_backoff(func, max_retries=6, base_delay=2, max_delay=30, max_total_wait=120):
+    """
+    Retry a function on transient API errors.
+
+    Errors are classified by HTTP status / exception type (rate_limit.is_retryable),
+    the server's Retry-After is honoured, and total waiting is capped at
+    max_total_wait seconds so a provider incident can't stall a turn for minutes.
+    """
+    waited = 0.0
     for attempt in range(max_retries):
         try:
-            return func()
+            with ledger_context(retries=attempt):
+                return func()
         except Exception as e:
-            error_str = str(e).lower()
-            # Check for retryable errors: rate limits, server errors, network issues, SSL errors
-            retryable_keywords = [
-                "429", "500", "503", "internal", "malformed", "function_call",
-                "quota", "rate", "unavailable", "overloaded",
-                "ssl", "connection", "timeout", "reset", "broken pipe",
-                "temporary", "retry", "network", "eof", "handshake"
-            ]
-            is_retryable = any(kw in error_str for kw in retryable_keywords)
-            if is_retryable:
-                if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                    log(f"{C.SYSTEM}[Network/API error, waiting {delay:.1f}s before retry {attempt + 2}/{max_retries}]{C.RESET}")
-                    time.sleep(delay)
-                else:
-                    log(f"{C.ERROR}[Max retries exceeded]{C.RESET}")
-                    raise
-            else:
+            if not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt, base_delay, max_delay)
+            if attempt >= max_retries - 1 or waited + delay > max_total_wait:
+                log(f"{C.ERROR}[Max retries exceeded after {waited:.0f}s: {e}]{C.RESET}")
+                log(f"{C.SYSTEM}[Limiter state: {json.dumps(openrouter_client.limiter_state())}]{C.RESET}")
                 raise
+            reason = "circuit open" if isinstance(e, CircuitOpenError) else f"{type(e).__name__}"
+            status = getattr(e, "status_code", None)
+            if status:
+                reason += f" {status}"
+            log(f"{C.SYSTEM}[API error ({reason}), waiting {delay:.1f}s before retry {attempt + 2}/{max_retries}]{C.RESET}")
+            sleep_with_heartbeat(delay)
+            waited += delay
+
+
+class StreamPrinter:
+    """Echo THINK/TALK_TO_USER content to the console while a response streams in."""
+
+    def __init__(self):
+        self.action = None     # Action block currently being streamed
+        self.line = ""         # Current (incomplete) line
+        self.printed = 0       # Chars of self.line already echoed
+        self.started = False   # Whether the current block has printed content
+        self.blank_lines = 0   # Blank lines held back until more content arrives
+        self.last_heartbeat = time.time()
+
+    def feed(self, delta):
+        """Consume a text delta."""
+        self.line += delta
+        while "\n" in self.line:
+            line, self.line = self.line.split("\n", 1)
+            self._end_line(line)
+        self._echo_partial()
+
+        # Long generations shouldn't look like a stall to run.py
+        if time.time() - self.last_heartbeat > 5:
+            heartbeat()
+            self.last_heartbeat = time.time()
+
+    def close(self):
+        """Flush the final line once the stream ends."""
+        if self.line:
+            self._end_line(self.line)
+            self.line = ""
+        self._end_block()
+
+    def _end_block(self):
+        if self.started:
+            print(C.RESET, end="", flush=True)
+        self.started = False
+        self.blank_lines = 0
+
+    def _end_line(self, line):
+        if line.strip() in VALID_ACTIONS:
+            self._end_block()
+            self.action = line.strip()
+        elif self.action in STREAM_DISPLAY:
+            if line.strip() or self.printed:
+                self._echo(line[self.printed:] + "\n")
+            elif self.started:
+                self.blank_lines += 1
+        self.printed = 0
+
+    def _echo_partial(self):
+        if self.action not in STREAM_DISPLAY:
+            return
+        pending = self.line.strip()
+        # Hold back anything that could still turn out to be an action header
+        if not pending or any(a.startswith(pending) for a in VALID_ACTIONS):
+            return
+        self._echo(self.line[self.printed:])
+        self.printed = len(self.line)
+
+    def _echo(self, text):
+        if not self.started:
+            if self.action == "THINK":
+                print(f"{C.THINK}    💭 ", end="")
+            else:
+                print(f"\n{C.CROW}[{timestamp()}] {C.BOLD}🐦‍⬛ Crow:{C.RESET} ", end="")
+            self.started = True
+        text = "\n" * self.blank_lines + text
+        self.blank_lines = 0
+        print(f"{STREAM_DISPLAY[self.action]}{text}", end="", flush=True)
+
+
+class ActionStreamParser:
+    """
+    Incrementally split a streaming response into action blocks.
+
+    A block is complete once the next action header line (or the end of the
+    stream) arrives; on_action(action, content) is then called with the same
+    (action, content) pair parse_response would produce.
+    """
+
+    def __init__(self, on_action):
+        self.on_action = on_action
+        self.line = ""
+        self.action = None
+        self.content = []
+
+    def feed(self, delta):
+        """Consume a text delta."""
+        self.line += delta
+        while "\n" in self.line:
+            line, self.line = self.line.split("\n", 1)
+            self._end_line(line)
+
+    def close(self):
+        """Emit the final block once the stream ends."""
+        if self.line:
+            self._end_line(self.line)
+            self.line = ""
+        self._emit()
+
+    def _end_line(self, line):
+        if line.strip() in VALID_ACTIONS:
+            self._emit()
+            self.action = line.strip()
+        elif self.action:
+            self.content.append(line)
+
+    def _emit(self):
+        if self.action:
+            self.on_action(self.action, '\n'.join(self.content).strip())
+        self.action = None
+        self.content = []
+
+
+class EagerDispatcher:
+    """
+    Run RUN_COMMAND/INTERNAL_QUERY blocks as soon as they are complete.
+
+    Actions run one at a time, in response order, on a single worker. Only the
+    leading run of THINK/eager actions is dispatched - anything after a
+    TALK_TO_USER, CODE_ANALYZE, RESTART_SELF or DREAM waits for the normal loop,
+    as does everything after a failed action (the chain gets aborted there).
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.blocks = []      # (action, content, future or None), in response order
+        self.accepting = True
+        self.failed = False
+
+    def on_action(self, action, content):
+        future = None
+        if self.accepting and action in EAGER_ACTIONS:
+            future = self.executor.submit(self._run, action, content)
+        elif action != "THINK":
+            self.accepting = False
+        self.blocks.append((action, content, future))
+
+    def _run(self, action, content):
+        if self.failed:
+            return None
+        result = execute_action(action, content)
+        if "Error:" in result or "INTERNAL_ERROR" in result:
+            self.failed = True
+        return result
+
+    def take(self, index, action, content):
+        """Return the result of an already-dispatched block, or None to run it normally."""
+        if index >= len(self.blocks):
+            return None
+        block_action, block_content, future = self.blocks[index]
+        if future is None or block_action != action or block_content != content:
+            return None
+        return future.result()
+
+    def shutdown(self):
+        """Drop anything not yet started (e.g. when the stream fails)."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def salvage(self):
+        """
+        After a failed stream: the reply text up to the last action that actually
+        started (call shutdown() first), or None if no eager action ran. Later
+        blocks - including any that were queued but cancelled - are dropped.
+        """
+        last = None
+        for index, (_, _, future) in enumerate(self.blocks):
+            if future is not None and not future.cancelled():
+                last = index
+        if last is None:
+            return None
+        del self.blocks[last + 1:]
+        return "\n\n".join(f"{action}\n{content}" for action, content, _ in self.blocks)
+
+
+class PartialResponse:
+    """The complete blocks of a reply whose stream failed after eager actions had run."""
+
+    def __init__(self, text, dispatcher, error):
+        self.text = text
+        self.dispatcher = dispatcher
+        self.interrupted = error
+
+
+@ledger_context(subsystem="main_turn")
+def send_and_display(chat_session, message):
+    """
+    Send a message with retries, streaming THINK/TALK_TO_USER text to the console.
+
+    While streaming, complete RUN_COMMAND/INTERNAL_QUERY blocks are started
+    early; their results are collected via response.dispatcher.
+
+    A stream that fails before any eager action started is retried as usual.
+    Once one has run, the turn is not re-sent (the model could run the command
+    again): the blocks up to the last started action come back as a
+    PartialResponse and are kept in the history.
+    """
+    def attempt():
+        response = chat_session.send_message(message, stream=STREAM, hedge=HEDGE and MODE == "interactive")
+        if STREAM:
+            printer = StreamPrinter()
+            dispatcher = EagerDispatcher()
+            parser = ActionStreamParser(dispatcher.on_action)
+            try:
+                for delta in response:
+                    printer.feed(delta)
+                    parser.feed(delta)
+                parser.close()
+            except Exception as e:
+                dispatcher.shutdown()
+                partial = dispatcher.salvage()
+                if partial is None:
+                    raise
+                log(f"{C.ERROR}[Stream failed after eager actions ran ({e}) - keeping the partial reply, not retrying]{C.RESET}")
+                chat_session.record_partial_turn(message, partial)
+                return PartialResponse(partial, dispatcher, e)
+            finally:
+                printer.close()
+            response.dispatcher = dispatcher
+        return response
+
+    return retry_with_backoff(attempt)
 
 
 def get_response_text(response):
@@ -274,162 +541,251 @@ def get_response_text(response):
         return "THINK\nI need to respond with a valid action format."
 
 
-def save_history(chat):
-    """Save conversation history to both full and working files."""
-    history = []
-    for item in chat.history:
-        # Handle both dict format (OpenRouter) and object format
-        if isinstance(item, dict):
-            role = item.get("role", "user")
-            content = item.get("content", "")
-            # Convert to Gemini-compatible format for storage
-            history.append({
-                "role": "model" if role == "assistant" else role,
-                "parts": [content]
-            })
-        else:
-            # Legacy Gemini format
-            history.append({
-                "role": item.role,
-                "parts": [part.text for part in item.parts if hasattr(part, 'text')]
-            })
+def stored_message(item):
+    """Convert a chat history item to the stored (Gemini-compatible) format."""
+    # Handle both dict format (OpenRouter) and object format
+    if isinstance(item, dict):
+        role = item.get("role", "user")
+        content = item.get("content", "")
+        return {
+            "role": "model" if role == "assistant" else role,
+            "parts": [content]
+        }
+    # Legacy Gemini format
+    return {
+        "role": item.role,
+        "parts": [part.text for part in item.parts if hasattr(part, 'text')]
+    }
 
-    # Always save complete history for posterity
-    with open(HISTORY_FULL_FILE, "w") as f:
-        json.dump(history, f, indent=2)
 
-    # Save working copy (will be compacted on load if needed)
+def save_history(chat):
+    """Append new messages to the full log and save the working file."""
+    # Complete history for posterity - only messages added since the last save are written
+    new_records = conversation_log.sync(chat.history, stored_message)
+    try:
+        conversation_db.add_messages(new_records, session=LOG_FILE.stem, turn=fatigue.state["current_turn"])
+    except Exception as e:
+        log_error(f"Could not index messages in {HISTORY_DB.name}: {e}")
+
+    # Save working copy (will be compacted on load if needed), with each message's token count for the next load
+    history = [stored_message(item) for item in chat.history]
+    if isinstance(chat.history, HistoryBuffer):
+        tokenizer = token_counter.tokenizer
+        for record, tokens in zip(history, chat.history.base_token_sizes()):
+            record["tokens"] = tokens
+            record["tokenizer"] = tokenizer  # Counts are only reused by the same tokenizer
     with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+        json.dump(history, f)
 
 
-def estimate_chars(history_data):
-    """Estimate character count of history."""
-    total = 0
-    for item in history_data:
-        for part in item.get("parts", []):
-            total += len(part)
-    return total
+def estimate_tokens(history_data, model_name: str = None):
+    """Estimate prompt tokens of history for the current model (O(1) for a HistoryBuffer, else cached per message)."""
+    if model_name is None:
+        try:
+            model_name = fatigue.get_model()
+        except:
+            model_name = None
+    if isinstance(history_data, HistoryBuffer):
+        return history_data.tokens(model_name)
+    return token_counter.count_messages(history_data, model_name)
 
 
+@ledger_context(subsystem="compaction")
 def summarize_messages(messages):
-    """Use Gemini to summarize a chunk of conversation."""
-    text = ""
-    for msg in messages:
-        role = msg["role"]
-        parts = " ".join(msg.get("parts", []))
-        text += f"{role}: {parts[:500]}...\n" if len(parts) > 500 else f"{role}: {parts}\n"
+    """
+    Summarize a chunk of conversation (stored or chat-format messages).
+
+    Chunks are summarized in parallel and reduced to one summary; when there
+    is more than one level, the lower ones are kept in the conversation DB
+    and the returned summary says how to expand them.
+
+    Raises SummaryError (with a best-effort text) if any summary call failed.
+    """
+    try:
+        tree = summarizer.summarize_tree(messages)
+    except Exception as e:
+        text = "".join(f"{msg['role']}: {message_text(msg)}\n" for msg in messages)
+        raise SummaryError(f"Summary failed: {e}", f"[Summary failed: {e}] " + text[:1000]) from e
+    summary = tree.top
+    if tree.depth > 1:
+        try:
+            tree_id = conversation_db.add_summary_tree(tree.levels, tree.messages)
+            summary = f"{tree.top}\n(Detailed summaries of this part: SEARCH_HISTORY summary {tree_id})"
+        except Exception as e:
+            log_error(f"Failed to store summary tree: {e}")
+    if tree.failed:
+        raise SummaryError(f"{tree.failed} summary call(s) failed", summary)
+    return summary
+
 
-    prompt = f"""Summarize this conversation excerpt concisely, preserving key decisions, actions taken, and important context. Be brief but complete.
+def best_effort_summary(messages):
+    """summarize_messages, falling back to its partial text when a call failed (never stored)."""
+    try:
+        return summarize_messages(messages)
+    except SummaryError as e:
+        log_error(f"Compaction summary incomplete: {e}")
+        return e.text
 
-CONVERSATION:
-{text}
 
-SUMMARY:"""
+def cached_compaction_summary(messages):
+    """summarize_messages, memoized in the conversation DB by block hash (survives restarts)."""
+    digest = window_digest(messages)
+    try:
+        summary = conversation_db.compaction_summary(digest)
+    except Exception as e:
+        log_error(f"Compaction summary lookup failed: {e}")
+        summary = None
+    if summary is not None:
+        log(f"{C.SYSTEM}[Reusing stored summary of {len(messages)} messages]{C.RESET}")
+        return summary
 
     try:
-        response = retry_with_backoff(lambda: model.generate_content(prompt))
-        return get_response_text(response)
+        summary = summarize_messages(messages)
+    except SummaryError as e:
+        log_error(f"Compaction summary incomplete (not stored): {e}")
+        return e.text
+    try:
+        conversation_db.add_compaction_summary(digest, len(messages), summary)
     except Exception as e:
-        return f"[Summary failed: {e}] " + text[:1000]
+        log_error(f"Failed to store compaction summary: {e}")
+    return summary
 
 
 def compact_history(history_data, context_budget: int = None):
-    """Compact oldest % of messages into summary when approaching context limit."""
-    total_chars = estimate_chars(history_data)
+    """
+    Compact oldest % of messages into a summary, in place, when over the context budget (in tokens).
+
+    history_data may be a HistoryBuffer (sizes read from its running totals) or a plain list.
+    """
+    total_tokens = estimate_tokens(history_data)
 
     # Use dynamic context budget from fatigue system, or fallback to default
     if context_budget is None:
         try:
-            context_budget = fatigue.get_context_budget()
+            context_budget = fatigue.get_context_token_budget()
         except:
-            context_budget = int(DEFAULT_CONTEXT_CHARS * 0.80)
+            context_budget = int(DEFAULT_CONTEXT_TOKENS * 0.80)
 
-    if total_chars <= context_budget:
+    # Same thresholds as the live ContextManager, so a freshly loaded history isn't compacted again on turn one
+    if total_tokens <= context_budget * ContextManager.HIGH_WATER:
         return history_data  # No compaction needed
+    target = context_budget * ContextManager.LOW_WATER
 
-    log(f"{C.SYSTEM}[Compacting history: {total_chars:,} chars, budget {context_budget:,} chars ({fatigue.get_status()['context_k']} context)]{C.RESET}")
+    log(f"{C.SYSTEM}[Compacting history: {total_tokens:,} tokens, budget {context_budget:,} tokens ({fatigue.get_status()['context_k']} context)]{C.RESET}")
 
-    # Calculate how many messages to compact (oldest COMPACTION_RATIO %)
+    # Compact the oldest COMPACTION_RATIO % - or more, so one pass gets down to the low-water mark
     num_to_compact = max(1, int(len(history_data) * COMPACTION_RATIO))
+    model_name = fatigue.get_model()
+
+    def message_tokens(index):
+        if isinstance(history_data, HistoryBuffer):
+            return history_data.message_tokens(index, model_name)
+        return token_counter.count_message(history_data[index], model_name)
+
+    remaining = total_tokens - sum(message_tokens(i) for i in range(num_to_compact))
+    while remaining > target and num_to_compact < len(history_data) - 2:
+        remaining -= message_tokens(num_to_compact)
+        num_to_compact += 1
     to_compact = history_data[:num_to_compact]
-    to_keep = history_data[num_to_compact:]
 
     if not to_compact:
         return history_data
 
-    # Summarize the oldest messages
-    summary = summarize_messages(to_compact)
+    # Summarize the oldest messages - reusing the summary from an earlier start if this block was seen
+    summary = cached_compaction_summary(to_compact)
 
-    # Create compacted history with summary prefix
-    compacted = [{
+    # Replace them with the summary (O(1) size update on the buffer)
+    history_data[:num_to_compact] = [{
         "role": "user",
-        "parts": [f"[COMPACTED HISTORY - {num_to_compact} messages summarized]\n{summary}\n[END SUMMARY]"]
+        "content": compaction_text(num_to_compact, summary)
     }]
-    compacted.extend(to_keep)
 
-    log(f"{C.SYSTEM}[Compacted {num_to_compact} messages, now {estimate_chars(compacted)} chars]{C.RESET}")
-    return compacted
+    log(f"{C.SYSTEM}[Compacted {num_to_compact} messages, now {estimate_tokens(history_data):,} tokens]{C.RESET}")
+    return history_data
+
+
+def create_context_manager():
+    """Keep the live session inside the current model's token budget (compacts in place, no restart)."""
+    def on_compact(folded, before, after):
+        log(f"{C.SYSTEM}[Live compaction: folded {folded} messages, {before:,} -> {after:,} tokens]{C.RESET}")
+
+    def on_error(error):
+        log_error(f"Live compaction failed: {error}")
+
+    return ContextManager(
+        budget=fatigue.get_context_token_budget,
+        summarize=best_effort_summary,
+        model_getter=fatigue.get_model,
+        tokens=token_counter,
+        on_compact=on_compact,
+        on_error=on_error
+    )
 
 
 def load_history():
-    """Load and compact conversation history from file."""
+    """Load and compact conversation history from file (a HistoryBuffer in OpenRouter format)."""
     if not HISTORY_FILE.exists():
-        return []
+        return HistoryBuffer(tokens=token_counter)
     try:
         with open(HISTORY_FILE) as f:
             data = json.load(f)
 
+        # Convert to OpenRouter format (role + content), reusing the token counts saved with each message
+        # (recounted if they came from a different tokenizer, e.g. tiktoken installed since)
+        history = HistoryBuffer(tokens=token_counter)
+        tokenizer = token_counter.tokenizer
+        for item in data:
+            role = item["role"]
+            # OpenRouter uses "assistant" instead of "model"
+            if role == "model":
+                role = "assistant"
+
+            # Combine parts into single content string
+            content = " ".join(item.get("parts", []))
+            saved = item.get("tokens") if item.get("tokenizer") == tokenizer else None
+            history.append({"role": role, "content": content}, saved)
+        del data
+
         # Get current model's context budget
         try:
-            context_budget = fatigue.get_context_budget()
+            context_budget = fatigue.get_context_token_budget()
             context_k = fatigue.get_status()['context_k']
         except:
-            context_budget = int(DEFAULT_CONTEXT_CHARS * 0.80)
+            context_budget = int(DEFAULT_CONTEXT_TOKENS * 0.80)
             context_k = "default"
 
-        initial_chars = estimate_chars(data)
-        log(f"{C.SYSTEM}[History: {initial_chars:,} chars, budget: {context_budget:,} chars ({context_k})]{C.RESET}")
+        # Size checks below are O(1) - the buffer keeps running totals
+        initial_tokens = estimate_tokens(history)
+        log(f"{C.SYSTEM}[History: {initial_tokens:,} tokens, budget: {context_budget:,} tokens ({context_k})]{C.RESET}")
 
-        # Compact aggressively if needed for current model's context
+        # Compact aggressively if needed for current model's context (above the live high-water mark)
+        limit = context_budget * ContextManager.HIGH_WATER
         compact_rounds = 0
-        while estimate_chars(data) > context_budget and len(data) > 2 and compact_rounds < 10:
-            data = compact_history(data, context_budget)
+        while estimate_tokens(history) > limit and len(history) > 2 and compact_rounds < 10:
+            compact_history(history, context_budget)
             compact_rounds += 1
 
         # Final safety: if still too big, drop oldest messages until it fits
-        while estimate_chars(data) > context_budget and len(data) > 2:
+        while estimate_tokens(history) > limit and len(history) > 2:
             log(f"{C.SYSTEM}[Dropping oldest message to fit context]{C.RESET}")
-            data = data[1:]
+            history.popleft()
 
-        final_chars = estimate_chars(data)
-        if initial_chars != final_chars:
-            log(f"{C.SYSTEM}[Compacted: {initial_chars:,} -> {final_chars:,} chars]{C.RESET}")
-
-        # Convert to OpenRouter format (role + content)
-        history = []
-        for item in data:
-            role = item["role"]
-            # OpenRouter uses "assistant" instead of "model"
-            if role == "model":
-                role = "assistant"
-
-            # Combine parts into single content string
-            content = " ".join(item.get("parts", []))
-            history.append({
-                "role": role,
-                "content": content
-            })
+        final_tokens = estimate_tokens(history)
+        if initial_tokens != final_tokens:
+            log(f"{C.SYSTEM}[Compacted: {initial_tokens:,} -> {final_tokens:,} tokens]{C.RESET}")
         return history
     except Exception as e:
         log(f"{C.ERROR}[Failed to load history: {e}]{C.RESET}")
-        return []
+        return HistoryBuffer(tokens=token_counter)
 
 
 def gather_repo_contents():
     """Gather all text files in the repo, skipping obvious non-essentials."""
-    contents = []
+    return list(iter_repo_contents())
+
 
+def iter_repo_contents():
+    """Yield each text file in the repo (with its header), one file in memory at a time."""
     for path in WORKSPACE.rglob('*'):
         if not path.is_file():
             continue
@@ -447,28 +803,14 @@ def gather_repo_contents():
             text = path.read_text(encoding='utf-8')
             rel_path = path.relative_to(WORKSPACE)
             mtime = datetime.fromtimestamp(path.stat().st_mtime).strftime('%Y-%m-%d %H:%M')
-            file_content = f"=== {rel_path} (modified: {mtime}) ===\n{text}\n"
-
-            contents.append(file_content)
+            yield f"=== {rel_path} (modified: {mtime}) ===\n{text}\n"
         except (UnicodeDecodeError, PermissionError):
             continue  # Skip binary or unreadable files
 
-    return contents
-
-
-def execute_code_analyze(file_path: Path):
-    """Analyzes a single code file for improvements using an LLM."""
-    if not file_path.is_file():
-        return f"File not found: {file_path}"
-
-    try:
-        code_content = file_path.read_text(encoding='utf-8')
-    except UnicodeDecodeError:
-        return f"Could not read file {file_path}. Is it a text file?"
 
-    current_model_name = fatigue.get_model()
-    
-    analysis_prompt = f"""You are an expert Code Analyst AI. Review this Python code for:
+def build_analysis_prompt(file_path: Path, code_content: str) -> str:
+    """Build the CODE_ANALYZE prompt for one file."""
+    return f"""You are an expert Code Analyst AI. Review this Python code for:
 - Code quality and best practices
 - Potential bugs or issues
 - Performance improvements
@@ -484,20 +826,40 @@ File: {file_path}
 {code_content}
 ```"""
 
+
+def save_analysis_report(file_path: Path, response_text) -> Path:
+    """Save a CODE_ANALYZE report to memory/cortex."""
+    report_dir = WORKSPACE / "memory" / "cortex"
+    report_dir.mkdir(parents=True, exist_ok=True)
+    report_path = report_dir / f"analysis_report_{file_path.name}.md"
+
+    report_path.write_text(str(response_text).strip())
+    log(f"{C.SYSTEM}[CODE_ANALYZE] Report saved to: {report_path}{C.RESET}")
+    return report_path
+
+
+@ledger_context(subsystem="code_analyze")
+def execute_code_analyze(file_path: Path):
+    """Analyzes a code file (or every .py file in a directory) for improvements using an LLM."""
+    if file_path.is_dir():
+        return execute_code_analyze_batch(file_path)
+
+    if not file_path.is_file():
+        return f"File not found: {file_path}"
+
+    try:
+        code_content = file_path.read_text(encoding='utf-8')
+    except UnicodeDecodeError:
+        return f"Could not read file {file_path}. Is it a text file?"
+
+    current_model_name = fatigue.get_model()
+    analysis_prompt = build_analysis_prompt(file_path, code_content)
+
     log(f"{C.SYSTEM}[CODE_ANALYZE] Starting analysis of {file_path} using {current_model_name}...{C.RESET}")
 
     try:
         response = retry_with_backoff(lambda: model.generate_content(analysis_prompt))
-        response_text = get_response_text(response)
-        clean_response = str(response_text).strip()
-
-        # Save report to memory/cortex
-        report_dir = WORKSPACE / "memory" / "cortex"
-        report_dir.mkdir(parents=True, exist_ok=True)
-        report_path = report_dir / f"analysis_report_{file_path.name}.md"
-        
-        report_path.write_text(clean_response)
-        log(f"{C.SYSTEM}[CODE_ANALYZE] Report saved to: {report_path}{C.RESET}")
+        report_path = save_analysis_report(file_path, get_response_text(response))
         return f"Analysis complete. Report saved to: {report_path}"
 
     except Exception as e:
@@ -505,14 +867,49 @@ File: {file_path}
         return f"Error during analysis: {e}"
 
 
+@ledger_context(subsystem="code_analyze")
+def execute_code_analyze_batch(dir_path: Path, max_concurrency: int = 4):
+    """Analyze every .py file under a directory as one parallel batch."""
+    files = []
+    prompts = []
+    for path in sorted(dir_path.rglob("*.py")):
+        if any(skip in path.parts for skip in SKIP_DIRS):
+            continue
+        try:
+            prompts.append(build_analysis_prompt(path, path.read_text(encoding='utf-8')))
+            files.append(path)
+        except (UnicodeDecodeError, PermissionError):
+            continue
+
+    if not files:
+        return f"No Python files found in {dir_path}"
+
+    log(f"{C.SYSTEM}[CODE_ANALYZE] Starting batch analysis of {len(files)} files in {dir_path} using {fatigue.get_model()}...{C.RESET}")
+
+    responses = model.generate_many(prompts, max_concurrency=max_concurrency)
+    lines = []
+    for path, response in zip(files, responses):
+        if isinstance(response, Exception):
+            log(f"{C.ERROR}[CODE_ANALYZE] Error on {path}: {response}{C.RESET}")
+            lines.append(f"{path}: Error during analysis: {response}")
+        else:
+            lines.append(f"{path}: {save_analysis_report(path, get_response_text(response))}")
+
+    failed = sum(1 for r in responses if isinstance(r, Exception))
+    return f"Batch analysis complete ({len(files) - failed}/{len(files)} succeeded). Reports:\n" + "\n".join(lines)
+
+
 
+@ledger_context(subsystem="internal_query")
 def execute_internal_query(question):
-    """Send question + entire repo to Gemini Flash for comprehensive answer."""
-    repo_contents = gather_repo_contents()
-    repo_text = "\n".join(repo_contents)
+    """
+    Send question + entire repo to Gemini Flash for comprehensive answer.
 
+    The repo is never joined into one string: the prompt is a StreamedPrompt
+    that re-reads files one at a time into the chunked request body.
+    """
     # Check context usage
-    repo_chars = len(repo_text)
+    repo_chars = max(0, sum(len(content) + 1 for content in iter_repo_contents()) - 1)  # + "\n" separators
     max_chars = DEFAULT_CONTEXT_CHARS  # ~4M for Gemini Flash
     usage_pct = (repo_chars / max_chars) * 100
 
@@ -523,16 +920,29 @@ def execute_internal_query(question):
 
     if repo_chars > max_chars:
         log(f"{C.ERROR}[ERROR: Repo exceeds context limit ({repo_chars:,} > {max_chars:,}). Truncating.]{C.RESET}")
-        repo_text = repo_text[:max_chars]
 
-    prompt = f"""You are an internal knowledge system. Answer the following question as COMPREHENSIVELY as possible based on the repository contents below.
+    header = f"""You are an internal knowledge system. Answer the following question as COMPREHENSIVELY as possible based on the repository contents below.
 
 If you want specific files to be included verbatim in the response context, mark them with [INCLUDE: path/to/file] and they will be appended.
 
 QUESTION: {question}
 
 REPOSITORY CONTENTS:
-{repo_text}"""
+"""
+
+    def prompt_parts():
+        # Same text as header + "\n".join(contents)[:max_chars]
+        yield header
+        remaining = max_chars
+        for index, content in enumerate(iter_repo_contents()):
+            piece = content if index == 0 else "\n" + content
+            if len(piece) >= remaining:
+                yield piece[:remaining]
+                return
+            remaining -= len(piece)
+            yield piece
+
+    prompt = StreamedPrompt(prompt_parts)
 
     try:
         response = retry_with_backoff(lambda: query_model.generate_content(prompt))
@@ -557,6 +967,37 @@ REPOSITORY CONTENTS:
         return f"Error in internal query: {e}"
 
 
+def execute_search_history(query):
+    """Search every past message locally (full-text index) - no model call, no repo upload."""
+    match = SUMMARY_TREE_QUERY.match(query)
+    if match:
+        return expand_summary(int(match.group(1)))
+    try:
+        hits = conversation_db.search(query, limit=SEARCH_HISTORY_LIMIT)
+    except Exception as e:
+        return f"Error searching history: {e}"
+    if not hits:
+        return "No matching messages."
+    return "\n\n".join(
+        f"#{hit['id']} [{hit['ts']}] {hit['role']} (turn {hit['turn']}): {hit['snippet']}"
+        for hit in hits
+    )
+
+
+def expand_summary(tree_id):
+    """Every level of a compacted-history summary, most detailed last."""
+    try:
+        rows = conversation_db.summary_tree(tree_id)
+    except Exception as e:
+        return f"Error reading summary {tree_id}: {e}"
+    if not rows:
+        return f"No summary {tree_id}."
+    return "\n\n".join(
+        f"[summary {tree_id} level {row['level']} part {row['position'] + 1}]\n{row['content']}"
+        for row in rows
+    )
+
+
 # === THE DREAMER ===
 # A separate process/persona that runs when Crow enters the DREAM state
 # It witnesses, reflects, and surfaces what Crow cannot see about itself
@@ -586,6 +1027,9 @@ your reflections here
 INTERNAL_QUERY
 question about the entre repository and codebase (searches everything - use this freely)
 
+SEARCH_HISTORY
+words to look for in Crow's past conversations (instant local search - returns matching messages)
+
 RUN_COMMAND
 shell command (use sparingly, prefer INTERNAL_QUERY)
 
@@ -622,6 +1066,7 @@ Explore what Crow has been doing.
 """
 
 
+@ledger_context(subsystem="dream")
 def run_dream_loop():
     """Run the Dreamer's loop after Crow enters DREAM state."""
     log(f"\n{C.CROW}{'=' * 50}")
@@ -652,7 +1097,7 @@ def run_dream_loop():
         if len(actions) == 1 and actions[0][0] is None:
             log(f"{C.ERROR}[No valid dream action found]{C.RESET}")
             try:
-                response = retry_with_backoff(lambda: dream_chat.send_message("Please respond with a valid action: THINK, RUN_COMMAND, INTERNAL_QUERY, or WAKE."))
+                response = retry_with_backoff(lambda: dream_chat.send_message("Please respond with a valid action: THINK, RUN_COMMAND, INTERNAL_QUERY, SEARCH_HISTORY, or WAKE."))
             except Exception as e:
                 log(f"{C.ERROR}[Dream error: {e}]{C.RESET}")
                 save_dream(f"Dream interrupted by error: {e}")
@@ -689,6 +1134,10 @@ def run_dream_loop():
                 log(f"{C.ACTION}[DREAM: INTERNAL_QUERY]{C.RESET} {content}")
                 result = execute_internal_query(content)
 
+            elif action == "SEARCH_HISTORY":
+                log(f"{C.ACTION}[DREAM: SEARCH_HISTORY]{C.RESET} {content}")
+                result = execute_search_history(content)
+
             else:
                 log(f"{C.ACTION}[DREAM: {action}]{C.RESET}")
                 result = f"Unknown dream action: {action}"
@@ -717,7 +1166,7 @@ def run_dream_loop():
 def parse_dream_response(response):
     """Parse Dreamer actions."""
     lines = response.strip().split('\n')
-    valid_actions = ['THINK', 'RUN_COMMAND', 'INTERNAL_QUERY', 'WAKE']
+    valid_actions = ['THINK', 'RUN_COMMAND', 'INTERNAL_QUERY', 'SEARCH_HISTORY', 'WAKE']
 
     action_indices = []
     for i, line in enumerate(lines):
@@ -763,18 +1212,74 @@ def get_recent_dreams(max_dreams=1):
     return dreams_text
 
 
+# Record/replay of every model call (CROW_CASSETTE=path, CROW_CASSETTE_MODE=record|replay)
+cassette = Cassette.from_env()
+
 # OpenRouter setup with fatigue-based model selection
 openrouter_key = os.environ.get("OPENROUTER_API_KEY")
 if not openrouter_key:
-    raise ValueError("OPENROUTER_API_KEY not set")
+    if not (cassette and cassette.replaying):
+        raise ValueError("OPENROUTER_API_KEY not set")
+    openrouter_key = "replay"  # Replays never reach the network
 
 # Initialize fatigue manager (global so trigger_dream can access it)
 fatigue = FatigueManager()
 
+# Append-only full history; a legacy conversation_full.json is imported once
+conversation_log = ConversationLog(HISTORY_LOG_DIR)
+try:
+    migrated = conversation_log.migrate(HISTORY_FULL_FILE)
+    if migrated:
+        log(f"{C.SYSTEM}[Migrated {migrated:,} messages from {HISTORY_FULL_FILE.name} to {HISTORY_LOG_DIR.name}/]{C.RESET}")
+except (OSError, ValueError) as e:
+    log(f"{C.ERROR}[Could not migrate {HISTORY_FULL_FILE.name}: {e}]{C.RESET}")
+
+# Full-text index of the same history, filled from the log the first time
+conversation_db = ConversationDB(HISTORY_DB)
+try:
+    indexed = conversation_db.backfill(conversation_log.iter_messages())
+    if indexed:
+        log(f"{C.SYSTEM}[Indexed {indexed:,} past messages in {HISTORY_DB.name}]{C.RESET}")
+except Exception as e:
+    log(f"{C.ERROR}[Could not index past messages: {e}]{C.RESET}")
+
+# Token estimates for context budgeting, calibrated from the ledger's reported prompt_tokens
+token_counter = get_token_counter()
+
 # Create OpenRouter client and model wrapper
-openrouter_client = OpenRouterClient(openrouter_key)
+# One-shot calls (summaries, CODE_ANALYZE, INTERNAL_QUERY) are cached on disk unless --no-cache
+# (off with a cassette, so recordings and replays see the same calls)
+response_cache = None if ("--no-cache" in sys.argv or cassette) else ResponseCache()
+
+
+def handle_failover(from_model, to_model, reason):
+    """Record a failover so the next fatigue status block reports it."""
+    fatigue.record_failover(from_model, to_model, reason)
+    log(f"{C.SYSTEM}[Failover: {from_model} -> {to_model} ({reason})]{C.RESET}")
+
+
+# Degraded models (repeated failures, open circuit, latency SLO breach) fail over down the fatigue tiers
+failover_config = fatigue.get_failover_config()
+openrouter_client = OpenRouterClient(
+    openrouter_key,
+    cache=response_cache,
+    fallback_chain=fatigue.get_fallback_chain,
+    on_failover=handle_failover,
+    failover_after=failover_config.get("after_failures", 2),
+    latency_slo=failover_config.get("latency_slo_seconds"),
+    hedge_model=fatigue.get_hedge_model,
+    hedge_after=fatigue.get_hedge_config().get("after_seconds", 20),
+    tokens=token_counter,
+    cassette=cassette
+)
 model = GenerativeModel(model_name=fatigue.get_model(), client=openrouter_client)  # Uses fatigue-selected model
 query_model = GenerativeModel(model_name="google/gemini-2.0-flash-001", client=openrouter_client)  # For INTERNAL_QUERY
+summarizer = HierarchicalSummarizer(
+    model.generate_many,
+    text=get_response_text,
+    tokens=token_counter,
+    model_getter=fatigue.get_model
+)
 
 
 def get_extended_instructions():
@@ -812,8 +1317,8 @@ def inject_fatigue(message: str) -> str:
     return f"{status}\n\n{message}"
 
 
-def execute_action(action, content):
-    """Execute an action and return the result."""
+def execute_action(action, content, echoed=False):
+    """Execute an action and return the result (echoed=True if already streamed to console)."""
     content = content.strip()
 
     if action == "THINK":
@@ -821,7 +1326,7 @@ def execute_action(action, content):
 
     elif action == "TALK_TO_USER":
         ts = timestamp()
-        log(f"\n{C.CROW}[{ts}] {C.BOLD}🐦‍⬛ Crow:{C.RESET} {C.CROW}{content}{C.RESET}\n")
+        log(f"\n{C.CROW}[{ts}] {C.BOLD}🐦‍⬛ Crow:{C.RESET} {C.CROW}{content}{C.RESET}\n", echo=not echoed)
 
         if MODE == "interactive":
             user_input = input_with_heartbeat(f"{C.USER}{C.BOLD}You:{C.RESET} {C.USER}")
@@ -864,6 +1369,9 @@ def execute_action(action, content):
     elif action == "INTERNAL_QUERY":
         return execute_internal_query(content)
 
+    elif action == "SEARCH_HISTORY":
+        return execute_search_history(content)
+
     elif action == "CODE_ANALYZE":
         log(f"{C.ACTION}[CODE_ANALYZE]{C.RESET} {content}")
         return execute_code_analyze(Path(content))
@@ -889,12 +1397,11 @@ def execute_action(action, content):
 def parse_response(response):
     """Parse all actions from response - returns list of (action, content) tuples."""
     lines = response.strip().split('\n')
-    valid_actions = ['THINK', 'TALK_TO_USER', 'RUN_COMMAND', 'INTERNAL_QUERY', 'CODE_ANALYZE', 'RESTART_SELF', 'DREAM']
 
     # Find all action lines and their indices
     action_indices = []
     for i, line in enumerate(lines):
-        if line.strip() in valid_actions:
+        if line.strip() in VALID_ACTIONS:
             action_indices.append((i, line.strip()))
 
     if not action_indices:
@@ -954,6 +1461,8 @@ def run_session():
     # Load conversation history for continuity
     history = load_history()
     chat = model.start_chat(history=history)
+    conversation_log.mark_synced(chat.history)  # Already in the full log from earlier sessions
+    chat.context = create_context_manager()
 
     log(f"\n{C.CROW}{'=' * 50}")
     log(f"🐦‍⬛ Crow Session Starting ({MODE} mode)")
@@ -981,15 +1490,15 @@ def run_session():
                 wake_msg = inject_fatigue(f"{recent_dream}\n\n[Session resumed. User says: {user_input}]")
             else:
                 wake_msg = inject_fatigue(SEED_PROMPT + f"\n\n[User's first message: {user_input}]")
-            response = retry_with_backoff(lambda wm=wake_msg: chat.send_message(wm))
+            response = send_and_display(chat, wake_msg)
 
     # Autonomous mode - Crow wakes on its own
     if MODE == "autonomous":
         recent_dream = get_recent_dreams(max_dreams=1)
         if history:
-            response = retry_with_backoff(lambda: chat.send_message(inject_fatigue(f"{recent_dream}\n\n[Session resumed. Continue where you left off.]")))
+            response = send_and_display(chat, inject_fatigue(f"{recent_dream}\n\n[Session resumed. Continue where you left off.]"))
         else:
-            response = retry_with_backoff(lambda: chat.send_message(inject_fatigue(SEED_PROMPT)))
+            response = send_and_display(chat, inject_fatigue(SEED_PROMPT))
 
     turn = 0
     while True:
@@ -1005,29 +1514,35 @@ def run_session():
         log(f"\n{C.SYSTEM}[{ts}] --- Turn {turn} | {fatigue_status['model_short']} | Fatigue: {fatigue_status['fatigue_percent']}% ---{C.RESET}")
 
         actions = parse_response(text)
+        dispatcher = getattr(response, "dispatcher", None)
 
         # Check if no valid actions found
         if len(actions) == 1 and actions[0][0] is None:
             log(f"{C.ERROR}[No valid action found]{C.RESET}")
-            response = retry_with_backoff(lambda: chat.send_message("Please respond with a valid action."))
+            response = send_and_display(chat, "Please respond with a valid action.")
             continue
 
         # Execute all actions and collect results
         results = []
         break_for_user_response = False
-        for action, content in actions:
+        for index, (action, content) in enumerate(actions):
             if action == "THINK":
-                log(f"{C.THINK}    💭 {content}{C.RESET}")
+                log(f"{C.THINK}    💭 {content}{C.RESET}", echo=not STREAM)
             elif action == "RUN_COMMAND":
                 log(f"{C.ACTION}[RUN_COMMAND]{C.RESET} {content}")
             elif action == "INTERNAL_QUERY":
                 log(f"{C.ACTION}[INTERNAL_QUERY]{C.RESET} {content}")
+            elif action == "SEARCH_HISTORY":
+                log(f"{C.ACTION}[SEARCH_HISTORY]{C.RESET} {content}")
             elif action == "TALK_TO_USER":
                 pass  # execute_action handles the display
             else:
                 log(f"{C.ACTION}[{action}]{C.RESET}")
 
-            result = execute_action(action, content)
+            # Use the early result if this block already ran during streaming
+            result = dispatcher.take(index, action, content) if dispatcher else None
+            if result is None:
+                result = execute_action(action, content, echoed=STREAM)
             
             # CROW INTEGRITY: If a technical action fails, break the chain
             if action in ["RUN_COMMAND", "INTERNAL_QUERY", "RESTART_SELF"] and ("Error:" in result or "INTERNAL_ERROR" in result):
@@ -1054,6 +1569,13 @@ def run_session():
                     results.append(f"[SYSTEM]: User responded. {remaining_count} subsequent actions were CANCELLED and not executed: {skipped_actions}. Process the user's response now.")
                     break
 
+        if dispatcher:
+            dispatcher.shutdown()
+
+        interrupted = getattr(response, "interrupted", None)
+        if interrupted:
+            results.append(f"[SYSTEM]: Your last reply was cut off by a stream error ({interrupted}) after the actions above had run. The rest of it was lost - continue from these results.")
+
         # Check for queued user messages (autonomous mode)
         queued = get_queued_messages()
         if queued:
@@ -1072,7 +1594,7 @@ def run_session():
         # Send combined results back with fatigue status
         combined_results = "\n\n".join(results)
         message_with_fatigue = inject_fatigue(f"[{timestamp()}] Results:\n{combined_results}")
-        response = retry_with_backoff(lambda msg=message_with_fatigue: chat.send_message(msg))
+        response = send_and_display(chat, message_with_fatigue)
 
         # Save history for continuity
         save_history(chat)
@@ -0,0 +1,435 @@
+"""
+Mock OpenRouter Server for Crow
+- Local stand-in for the chat-completions endpoint, so HybridClient,
+  ChatSession and the run_session loop can be load-tested for free
+- Configurable latency distributions (overall and per model)
+- Error injection: HTTP statuses (429 with Retry-After, 500, ...), timeouts
+  (the request hangs) and disconnects (a stream cut off mid-way)
+- SSE streaming with usage, scripted action responses, and counters for
+  connections, requests and peak concurrency (GET /stats)
+
+    python mock_openrouter.py --port 8799 --latency lognormal:0.8,0.5 --errors 429=0.05,500=0.02
+    OPENROUTER_BASE_URL=http://127.0.0.1:8799/api/v1 OPENROUTER_API_KEY=mock python main.py -a
+
+In-process:
+
+    with MockOpenRouter(latency="fixed:0.05", errors="500=0.1") as mock:
+        client = HybridClient("mock", base_url=mock.base_url)
+"""
+
+import argparse
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from tokens import approximate_tokens
+
+DEFAULT_RESPONSE = "THINK\nMock response {n}: nothing to do yet."
+
+
+def parse_latency(spec: Union[str, float, None]) -> Callable[[random.Random], float]:
+    """
+    Latency sampler (seconds) from a spec:
+      "0.5" or "fixed:0.5"       - constant
+      "uniform:0.2,1.5"          - uniform between two bounds
+      "normal:1.0,0.3"           - mean, stdev (clamped at 0)
+      "lognormal:0.8,0.5"        - median, sigma (long right tail, like real TTFB)
+      "pareto:0.5,2.5"           - scale, alpha (heavy tail - for hedging tests)
+    """
+    if spec is None or spec == "":
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    try:
+        values = [float(v) for v in args.split(",")]
+        if kind == "fixed":
+            (value,) = values
+            return lambda rng: value
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if kind == "normal":
+            mean, stdev = values
+            return lambda rng: max(0.0, rng.gauss(mean, stdev))
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: median * math.exp(rng.gauss(0.0, sigma))
+        if kind == "pareto":
+            scale, alpha = values
+            return lambda rng: scale * rng.paretovariate(alpha)
+    except ValueError:
+        pass
+    raise ValueError(f"Bad latency spec: {spec!r}")
+
+
+def parse_errors(spec: Union[str, Dict, None]) -> Dict[Union[int, str], float]:
+    """Error probabilities from "429=0.05,500=0.02,timeout=0.01,disconnect=0.01"."""
+    if not spec:
+        return {}
+    if isinstance(spec, dict):
+        return dict(spec)
+    errors = {}
+    for item in spec.split(","):
+        kind, _, probability = item.partition("=")
+        kind = kind.strip()
+        errors[int(kind) if kind.isdigit() else kind] = float(probability)
+    for kind in errors:
+        if not isinstance(kind, int) and kind not in ("timeout", "disconnect"):
+            raise ValueError(f"Unknown error kind: {kind!r}")
+    return errors
+
+
+def load_script(path: Path) -> List[Dict]:
+    """
+    Scripted responses from a JSON list or JSON-lines file. Each entry is a
+    response string or an object:
+      {"content": "...", "match": "regex on the last user message",
+       "latency": 2.0, "error": 500 | "timeout" | "disconnect", "model": "..."}
+    """
+    text = Path(path).read_text()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [{"content": entry} if isinstance(entry, str) else entry for entry in entries]
+
+
+class Script:
+    """
+    Scripted responses: entries with "match" answer any request whose last
+    user message matches; the rest are served in order (cycling if loop).
+    """
+
+    def __init__(self, entries: List[Dict], loop: bool = False):
+        self.matched = [(re.compile(e["match"]), e) for e in entries if e.get("match")]
+        self.sequence = [e for e in entries if not e.get("match")]
+        self.loop = loop
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def next(self, model: str, prompt: str) -> Optional[Dict]:
+        for pattern, entry in self.matched:
+            if entry.get("model") in (None, model) and pattern.search(prompt):
+                return entry
+        with self._lock:
+            if not self.sequence or (self.position >= len(self.sequence) and not self.loop):
+                return None
+            entry = self.sequence[self.position % len(self.sequence)]
+            self.position += 1
+            return entry
+
+
+class MockOpenRouter:
+    """Threaded mock chat-completions server; start()/stop() or use as a context manager."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Union[str, float] = None,
+        errors: Union[str, Dict] = None,
+        model_latency: Dict[str, Union[str, float]] = None,
+        model_errors: Dict[str, Union[str, Dict]] = None,
+        script: Script = None,
+        chunk_delay: float = 0.0,
+        stream_chunks: int = 8,
+        retry_after: float = 1.0,
+        hang_seconds: float = 130.0,
+        seed: int = None
+    ):
+        self.latency = parse_latency(latency)
+        self.errors = parse_errors(errors)
+        self.model_latency = {m: parse_latency(s) for m, s in (model_latency or {}).items()}
+        self.model_errors = {m: parse_errors(s) for m, s in (model_errors or {}).items()}
+        self.script = script
+        self.chunk_delay = chunk_delay
+        self.stream_chunks = stream_chunks
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds  # Longer than the client's 120s timeout by default
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self) -> "MockOpenRouter":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.by_outcome = defaultdict(int)
+            self.by_model = defaultdict(int)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "by_outcome": dict(self.by_outcome),
+                "by_model": dict(self.by_model)
+            }
+
+    def _count(self, key: str, delta: int = 1, model: str = None):
+        with self._lock:
+            if key == "in_flight":
+                self.in_flight += delta
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            elif key in ("connections", "requests"):
+                setattr(self, key, getattr(self, key) + delta)
+            else:
+                self.by_outcome[key] += delta
+            if model:
+                self.by_model[model] += delta
+
+    def _sample_latency(self, model: str) -> float:
+        sampler = self.model_latency.get(model, self.latency)
+        with self._lock:
+            return sampler(self._rng)
+
+    def _pick_error(self, model: str) -> Optional[Union[int, str]]:
+        errors = self.model_errors.get(model, self.errors)
+        with self._lock:
+            roll = self._rng.random()
+        for kind, probability in errors.items():
+            if roll < probability:
+                return kind
+            roll -= probability
+        return None
+
+    def respond(self, payload: Dict) -> Dict:
+        """Decide how to answer one request: {"latency", "error", "content"}."""
+        model = payload.get("model", "")
+        messages = payload.get("messages") or []
+        prompt = next((_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        entry = (self.script.next(model, prompt) if self.script else None) or {}
+        with self._lock:
+            number = self.requests
+        return {
+            "latency": entry.get("latency", self._sample_latency(model)),
+            "error": entry.get("error", self._pick_error(model)),
+            "content": entry.get("content", DEFAULT_RESPONSE.format(n=number))
+        }
+
+
+def _text(msg: Dict) -> str:
+    content = msg.get("content") or ""
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse shows up in the counters
+
+    def setup(self):
+        super().setup()
+        self.server.mock._count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.mock.stats())
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "code": 404}})
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = self._read_body()
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "code": 404}})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "code": 400}})
+            return
+
+        model = payload.get("model", "")
+        mock._count("requests", model=model)
+        mock._count("in_flight")
+        try:
+            plan = mock.respond(payload)
+            time.sleep(plan["latency"])
+            error = plan["error"]
+            mock._count(str(error or "ok"))
+
+            if error == "timeout":
+                time.sleep(mock.hang_seconds)
+                self.close_connection = True
+                return
+            if isinstance(error, int):
+                headers = {"Retry-After": str(mock.retry_after)} if error == 429 else {}
+                self._send_json(error, {"error": {"message": f"Mock error {error}", "code": error}}, headers)
+                return
+
+            usage = {
+                "prompt_tokens": sum(approximate_tokens(_text(m)) + 4 for m in payload.get("messages") or []),
+                "completion_tokens": approximate_tokens(plan["content"])
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if payload.get("stream"):
+                self._send_stream(model, plan["content"], usage, disconnect=error == "disconnect")
+            elif error == "disconnect":
+                self.close_connection = True  # Drop the connection without answering
+            else:
+                self._send_json(200, {
+                    "id": f"gen-mock-{uuid.uuid4().hex[:12]}",
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": plan["content"]},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client gave up (e.g. a cancelled hedge)
+        finally:
+            mock._count("in_flight", -1)
+
+    def _read_body(self) -> bytes:
+        """Read a Content-Length or chunked body (streamed prompts), gunzipping if needed."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return bytes(body)
+
+    def _send_json(self, status: int, data: Dict, headers: Dict[str, str] = None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, model: str, content: str, usage: Dict, disconnect: bool = False):
+        mock = self.server.mock
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(data: str):
+            self._write_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+        generation = f"gen-mock-{uuid.uuid4().hex[:12]}"
+        self._write_chunk(b": OPENROUTER PROCESSING\n\n")  # Keep-alive comment, as OpenRouter sends
+        step = max(1, math.ceil(len(content) / max(1, mock.stream_chunks)))
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        for index, piece in enumerate(pieces):
+            if disconnect and index >= len(pieces) // 2:
+                self.close_connection = True  # Cut the stream mid-way, without a terminating chunk
+                return
+            event(json.dumps({"id": generation, "model": model,
+                              "choices": [{"index": 0, "delta": {"content": piece}}]}))
+            if mock.chunk_delay:
+                time.sleep(mock.chunk_delay)
+        event(json.dumps({"id": generation, "model": model,
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}))
+        event("[DONE]")
+        self._write_chunk(b"")  # Terminating chunk
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def _pairs(values: List[str]) -> Dict[str, str]:
+    """"model=spec" arguments -> {model: spec}."""
+    pairs = {}
+    for value in values or []:
+        model, _, spec = value.partition("=")
+        pairs[model] = spec
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the OpenRouter chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="Time to first byte distribution")
+    parser.add_argument("--errors", default="", help='Error rates, e.g. "429=0.05,500=0.02,timeout=0.01"')
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SPEC",
+                        help="Per-model latency (repeatable)")
+    parser.add_argument("--model-errors", action="append", metavar="MODEL=RATES",
+                        help='Per-model error rates, e.g. "anthropic/claude-opus-4.5=500=1.0" (repeatable)')
+    parser.add_argument("--script", type=Path, help="Scripted responses (JSON list or JSON lines)")
+    parser.add_argument("--loop", action="store_true", help="Cycle through the scripted responses")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429s")
+    parser.add_argument("--hang-seconds", type=float, default=130.0, help="How long a timeout hangs")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    mock = MockOpenRouter(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        errors=args.errors,
+        model_latency=_pairs(args.model_latency),
+        model_errors=_pairs(args.model_errors),
+        script=Script(load_script(args.script), loop=args.loop) if args.script else None,
+        chunk_delay=args.chunk_delay,
+        retry_after=args.retry_after,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed
+    )
+    print(f"Mock OpenRouter listening on {mock.base_url} (stats: {mock.base_url}/stats)")
+    print(f"Run Crow against it: OPENROUTER_BASE_URL={mock.base_url} OPENROUTER_API_KEY=mock python main.py")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
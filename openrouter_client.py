@@ -6,19 +6,35 @@ Hybrid API Client for Crow
 
 import os
 import json
+import time
+import uuid
+import contextvars
+import threading
 import requests
-from typing import List, Dict, Optional, Callable
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional, Callable, Iterator, Union, Tuple
 from datetime import datetime
 
 # Import Gemini SDK for direct access (when enabled)
 import google.generativeai as genai
 
+from response_cache import ResponseCache
+from ledger import LedgerWriter, CallMetrics, get_ledger, ledger_context, context_fields, call_path
+from payload import (HistoryEncoder, StreamedPrompt, encode_json, gzip_body, gzip_stream, has_streamed_content,
+                     mark_cacheable, stream_json_body, GZIP_MIN_BYTES)
+from rate_limit import RateLimiter, APIError, is_retryable, retry_delay, parse_retry_after
+from tokens import TokenCounter, get_token_counter
+from cassette import Cassette
+from history_buffer import HistoryBuffer
+
 # OpenRouter Pricing (cost per 1M tokens) - Updated 2026-01
 # Format: "model_id": {"input": cost_per_million, "output": cost_per_million}
+# Optional "cache_read" / "cache_write" rates apply to prompt-cached tokens
+# (models without them bill cached tokens at the input rate)
 OPENROUTER_PRICING = {
-    "anthropic/claude-opus-4.5": {"input": 15.00, "output": 75.00},
-    "anthropic/claude-sonnet-4": {"input": 3.00, "output": 15.00},
+    "anthropic/claude-opus-4.5": {"input": 15.00, "output": 75.00, "cache_read": 1.50, "cache_write": 18.75},
+    "anthropic/claude-sonnet-4": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
     "google/gemini-2.5-flash": {"input": 0.15, "output": 0.60},
     "google/gemini-2.5-pro": {"input": 1.25, "output": 5.00},
     "google/gemini-2.0-flash-001": {"input": 0.10, "output": 0.40},
@@ -26,13 +42,22 @@ OPENROUTER_PRICING = {
 }
 
 
-def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
-    """Calculate cost in USD for a given API call."""
+def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int,
+                   cached_tokens: int = 0, cache_write_tokens: int = 0) -> Optional[float]:
+    """
+    Calculate cost in USD for a given API call.
+
+    cached_tokens / cache_write_tokens are the parts of prompt_tokens read from
+    or written to the provider's prompt cache.
+    """
     if model not in OPENROUTER_PRICING:
         return None
     
     pricing = OPENROUTER_PRICING[model]
-    input_cost = (prompt_tokens / 1_000_000) * pricing["input"]
+    uncached_tokens = max(0, prompt_tokens - cached_tokens - cache_write_tokens)
+    input_cost = (uncached_tokens / 1_000_000) * pricing["input"]
+    input_cost += (cached_tokens / 1_000_000) * pricing.get("cache_read", pricing["input"])
+    input_cost += (cache_write_tokens / 1_000_000) * pricing.get("cache_write", pricing["input"])
     output_cost = (completion_tokens / 1_000_000) * pricing["output"]
     return round(input_cost + output_cost, 6)
 
@@ -42,30 +67,72 @@ class ChatSession:
 
     def __init__(self, client: 'HybridClient', history: List[Dict] = None, model_getter=None):
         self.client = client
-        self.history = history or []
+        self.history = history if history is not None else []
         self.model_getter = model_getter  # Function to get current model (for fatigue)
+        self.gemini_chat = None  # Live direct-Gemini chat kept in step with history (see _GeminiChat)
+        self.encoder = HistoryEncoder()  # Serialized history, re-encoded only where it changed
+        self.context = None  # Optional ContextManager: compacts history in place after each turn
+
+    def send_message(self, message: str, stream: bool = False, hedge: bool = False) -> 'ChatResponse':
+        """
+        Send a message and get a response.
 
-    def send_message(self, message: str) -> 'ChatResponse':
-        """Send a message and get a response."""
+        With stream=True a StreamingChatResponse is returned: iterate it for
+        text deltas; the assistant entry is added to history once it finishes.
+        With hedge=True a slow first byte triggers a duplicate request (see HybridClient.chat).
+        """
         # Add user message to history
-        self.history.append({
+        user_entry = {
             "role": "user",
             "content": message
-        })
+        }
+        self.history.append(user_entry)
 
         # Get current model (may change due to fatigue)
         model = self.model_getter() if self.model_getter else self.client.default_model
 
-        # Make API call
-        response_text = self.client.chat(self.history, model)
+        # Make API call (drop the user entry on failure so retries don't duplicate it)
+        try:
+            result = self.client.chat(self.history, model, stream=stream, prompt_cache=True, hedge=hedge,
+                                      session=self)
+        except Exception:
+            self._discard(user_entry)
+            raise
+
+        if stream:
+            return StreamingChatResponse(
+                result,
+                self.history,
+                on_complete=self._append_assistant,
+                on_error=lambda: self._discard(user_entry)
+            )
 
-        # Add assistant response to history
+        self._append_assistant(result)
+        return ChatResponse(result, self.history)
+
+    def _append_assistant(self, response_text: str):
+        """Add assistant response to history (then let the context manager trim it)."""
         self.history.append({
             "role": "assistant",
             "content": response_text
         })
+        if self.context is not None:
+            self.context.after_turn(self)
+
+    def record_partial_turn(self, message: str, response_text: str):
+        """Keep a turn whose reply stream failed part-way: the user message and the usable part of the reply."""
+        last = self.history[-1] if self.history else None
+        if not (last and last.get("role") == "user" and last.get("content") == message):
+            self.history.append({
+                "role": "user",
+                "content": message
+            })
+        self._append_assistant(response_text)
 
-        return ChatResponse(response_text, self.history)
+    def _discard(self, entry: Dict):
+        """Remove a pending user entry after a failed call."""
+        if self.history and self.history[-1] is entry:
+            self.history.pop()
 
 
 class ChatResponse:
@@ -81,6 +148,105 @@ class ChatResponse:
         return self._text
 
 
+class StreamingChatResponse(ChatResponse):
+    """
+    Chat response whose text arrives incrementally.
+
+    Iterating yields text deltas as they stream in. Reading .text (or
+    .parts) drains whatever is left and returns the full response.
+    """
+
+    def __init__(self, deltas: Iterator[str], history: List[Dict],
+                 on_complete: Callable[[str], None] = None, on_error: Callable[[], None] = None):
+        self._deltas = deltas
+        self._history = history
+        self._chunks = []
+        self._text = None
+        self._on_complete = on_complete
+        self._on_error = on_error
+
+    def __iter__(self) -> Iterator[str]:
+        if self._text is not None:
+            return
+        try:
+            for delta in self._deltas:
+                self._chunks.append(delta)
+                yield delta
+        except Exception:
+            if self._on_error:
+                self._on_error()
+            raise
+
+        self._text = "".join(self._chunks)
+        if self._on_complete:
+            self._on_complete(self._text)
+
+    @property
+    def done(self) -> bool:
+        return self._text is not None
+
+    @property
+    def text(self):
+        for _ in self:
+            pass
+        return self._text
+
+    @property
+    def parts(self):
+        return [TextPart(self.text)]
+
+
+class _Prefetched:
+    """Iterator over stream deltas whose first delta has already been read."""
+
+    def __init__(self, deltas: Iterator[str]):
+        self._deltas = deltas
+        self._first = next(deltas, None)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            if self._first is not None:
+                yield self._first
+            yield from self._deltas
+        finally:
+            self.close()
+
+    def close(self):
+        close = getattr(self._deltas, "close", None)
+        if close:
+            close()
+
+
+class _GeminiChat:
+    """
+    A live genai chat mirroring a ChatSession's history.
+
+    After a call, the genai chat holds messages[:synced]: everything sent
+    plus the model's reply. It stays usable while the session's history only
+    grows past that point; any rewrite (e.g. compaction) forces a rebuild.
+    """
+
+    def __init__(self, model: str, chat, messages: List[Dict], reply: str):
+        self.model = model
+        self.chat = chat
+        self.synced = len(messages) + 1
+        self._first = messages[0]
+        self._last_sent = messages[-1]
+        self._reply = reply
+
+    def matches(self, messages: List[Dict], model: str) -> bool:
+        """Check the history still starts with exactly what the genai chat has seen."""
+        if model != self.model or len(messages) <= self.synced:
+            return False
+        reply = messages[self.synced - 1]
+        return (
+            messages[0] is self._first
+            and messages[self.synced - 2] is self._last_sent
+            and reply.get("role") == "assistant"
+            and reply.get("content") == self._reply
+        )
+
+
 class TextPart:
     """Mimics Gemini's part structure."""
 
@@ -95,7 +261,7 @@ class HybridClient:
     - Gemini models -> OpenRouter (paid) or Direct Google API (free tier)
     """
 
-    OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+    OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
     # Model ID mappings for Gemini (OpenRouter ID -> Gemini SDK ID)
     GEMINI_MODEL_MAP = {
@@ -106,9 +272,52 @@ class HybridClient:
         "google/gemini-3-flash-preview": "gemini-3-flash-preview",
     }
 
-    def __init__(self, openrouter_key: str = None, gemini_key: str = None, default_model: str = "anthropic/claude-opus-4.5"):
-        # OpenRouter setup (for Claude)
+    # Max simultaneous in-flight requests per model for batch jobs (generate_many)
+    DEFAULT_MODEL_CONCURRENCY = 8
+    MODEL_CONCURRENCY = {
+        "anthropic/claude-opus-4.5": 4,
+    }
+
+    # Models that honour cache_control breakpoints via OpenRouter (Anthropic prompt caching)
+    PROMPT_CACHE_MODEL_PREFIXES = ("anthropic/",)
+
+    # Hedged requests: duplicate a call whose first byte is slower than the model's
+    # recent p95 (or hedge_after seconds until enough samples exist)
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_MIN_DELAY = 2.0
+
+    # Connection pool defaults (keep-alive connections reused across calls)
+    POOL_CONNECTIONS = 4   # Number of distinct hosts to keep pools for
+    POOL_MAXSIZE = 10      # Max open connections per host
+
+    def __init__(
+        self,
+        openrouter_key: str = None,
+        gemini_key: str = None,
+        default_model: str = "anthropic/claude-opus-4.5",
+        pool_connections: int = None,
+        pool_maxsize: int = None,
+        pool_block: bool = False,
+        cache: 'ResponseCache' = None,
+        limiter: RateLimiter = None,
+        ledger: LedgerWriter = None,
+        compress_requests: bool = False,
+        fallback_chain: Callable[[str], List[str]] = None,
+        on_failover: Callable[[str, str, str], None] = None,
+        failover_after: int = 2,
+        latency_slo: float = None,
+        hedge_model: Callable[[str], Optional[str]] = None,
+        hedge_after: float = 20.0,
+        tokens: TokenCounter = None,
+        base_url: str = None,
+        cassette: Cassette = None
+    ):
+        # OpenRouter setup (for Claude); base_url / OPENROUTER_BASE_URL point it
+        # at a compatible server instead, e.g. mock_openrouter.py
         self.openrouter_key = openrouter_key or os.environ.get("OPENROUTER_API_KEY")
+        self.base_url = (base_url or os.environ.get("OPENROUTER_BASE_URL") or self.OPENROUTER_BASE_URL).rstrip("/")
+        self.openrouter_url = f"{self.base_url}/chat/completions"
         self.openrouter_headers = {
             "Authorization": f"Bearer {self.openrouter_key}",
             "Content-Type": "application/json",
@@ -116,6 +325,21 @@ class HybridClient:
             "X-Title": "Crow Planetary Audit"
         }
 
+        # Pooled keep-alive transport, shared by every ChatSession and
+        # generate_content call made through this client
+        self.pool_connections = pool_connections or self.POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or self.POOL_MAXSIZE
+        self.pool_block = pool_block
+        self.http = self._create_http_session()
+
+        # Per-model concurrency limits shared by every batch on this client
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+        # genai.GenerativeModel objects, built once per Gemini model ID
+        self._gemini_models = {}
+        self._gemini_lock = threading.Lock()
+
         # Gemini setup (direct, free tier)
         self.gemini_key = gemini_key or os.environ.get("GEMINI_API_KEY")
         if self.gemini_key:
@@ -123,6 +347,61 @@ class HybridClient:
 
         self.default_model = default_model
 
+        # Optional on-disk cache for one-shot generate_content calls
+        self.cache = cache
+
+        # Per-model token buckets and circuit breakers
+        self.limiter = limiter or RateLimiter()
+
+        # Write-behind ledger (batched appends from a background thread)
+        self.ledger = ledger or get_ledger()
+
+        # Prompt token estimates, calibrated against the usage OpenRouter reports
+        self.tokens = tokens or get_token_counter()
+
+        # Record every completion to a cassette, or answer from one without
+        # the network (defaults to CROW_CASSETTE / CROW_CASSETTE_MODE)
+        self.cassette = cassette or Cassette.from_env()
+
+        # gzip request bodies (only for endpoints that accept Content-Encoding: gzip)
+        self.compress_requests = compress_requests
+
+        # Failover: fallback_chain(model) lists models to try when `model` is
+        # degraded (failover_after consecutive failures, open circuit, or
+        # responses slower than latency_slo seconds); on_failover is told
+        # (from_model, to_model, reason) whenever a fallback answers instead
+        self.fallback_chain = fallback_chain
+        self.on_failover = on_failover
+        self.failover_after = failover_after
+        self.latency_slo = latency_slo
+
+        # Hedging (opt-in per call): hedge_model(model) picks the duplicate's
+        # model, e.g. a cheaper tier; defaults to the same model
+        self.hedge_model = hedge_model
+        self.hedge_after = hedge_after
+        self._hedge_pool = None
+        self._hedge_lock = threading.Lock()
+
+    def _create_http_session(self) -> requests.Session:
+        """Create the pooled HTTP session used for OpenRouter requests."""
+        session = requests.Session()
+        # pool_maxsize caps connections per host; pool_block makes extra
+        # threads wait for a free connection instead of opening throwaways
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.openrouter_headers)
+        return session
+
+    def close(self):
+        """Close pooled connections."""
+        if self.http is not None:
+            self.http.close()
+
     def _is_gemini_model(self, model: str) -> bool:
         """Check if model should use direct Gemini API."""
         # TEMPORARY: Route all through OpenRouter for testing
@@ -134,101 +413,626 @@ class HybridClient:
         """Convert OpenRouter model ID to Gemini SDK model ID."""
         return self.GEMINI_MODEL_MAP.get(model, model.replace("google/", ""))
 
-    def _chat_openrouter(self, messages: List[Dict], model: str) -> str:
-        """Send request to OpenRouter (for Claude)."""
+    def _build_payload(self, messages: List[Dict], model: str, stream: bool = False,
+                       prompt_cache: bool = False) -> Dict:
+        """Build the chat completion request body (prompt_cache marks cacheable prefixes)."""
         if not self.openrouter_key:
             raise ValueError("OPENROUTER_API_KEY not set")
 
+        if prompt_cache and self._supports_prompt_cache(model):
+            messages = self._apply_cache_breakpoints(messages)
+
         payload = {
             "model": model,
-            "messages": messages
+            "messages": list(messages)  # Plain list for the JSON encoders (history may be a HistoryBuffer)
         }
+        if stream:
+            payload["stream"] = True
+            # Ask OpenRouter to append token usage to the final SSE chunk
+            payload["usage"] = {"include": True}
+        return payload
 
-        response = requests.post(
-            self.OPENROUTER_URL,
-            headers=self.openrouter_headers,
-            json=payload,
-            timeout=120
-        )
+    def _supports_prompt_cache(self, model: str) -> bool:
+        """Check if a model supports explicit prompt-cache breakpoints."""
+        return model.startswith(self.PROMPT_CACHE_MODEL_PREFIXES)
+
+    @staticmethod
+    def _apply_cache_breakpoints(messages: List[Dict]) -> List[Dict]:
+        """
+        Mark the stable prefixes of a conversation as cacheable.
 
-        if response.status_code != 200:
-            error_msg = f"OpenRouter API error {response.status_code}: {response.text}"
-            raise Exception(error_msg)
+        Two breakpoints: the first message (SEED_PROMPT - system instructions,
+        cortex, journal, dreams) and the last message before the new one,
+        so the whole history sent last turn is read back from the cache.
+        Returns a new list; the session history is left untouched.
+        """
+        breakpoints = {0, len(messages) - 2} if len(messages) > 1 else {0}
+        return [mark_cacheable(msg) if i in breakpoints else msg for i, msg in enumerate(messages)]
 
-        data = response.json()
+    def _encode_request(self, messages: List[Dict], model: str, stream: bool = False,
+                        prompt_cache: bool = False,
+                        encoder: HistoryEncoder = None) -> Tuple[Union[bytes, Iterator[bytes]], Dict]:
+        """
+        Serialize a request body; returns (body, extra headers).
+
+        With a session's encoder only the messages added since its last
+        request are encoded; one-shot calls encode the whole payload.
+        Messages with StreamedPrompt content give a chunked body (a generator,
+        built fresh on every call so retries resend the whole prompt).
+        """
+        if has_streamed_content(messages):
+            body = stream_json_body(self._build_payload(messages, model, stream, prompt_cache))
+            if self.compress_requests:
+                body = gzip_stream(body)
+            return body, ({"Content-Encoding": "gzip"} if self.compress_requests else {})
+        elif encoder is None:
+            body = encode_json(self._build_payload(messages, model, stream, prompt_cache))
+            compress = self.compress_requests and len(body) >= GZIP_MIN_BYTES
+            if compress:
+                body = gzip_body(body)
+        else:
+            options = self._build_payload([], model, stream)
+            del options["messages"]
+            breakpoints = prompt_cache and self._supports_prompt_cache(model)
+            compress = self.compress_requests
+            body = encoder.encode(messages, options, breakpoints, compress)
+        return body, ({"Content-Encoding": "gzip"} if compress else {})
+
+    def _post_openrouter(self, messages: List[Dict], model: str, stream: bool = False,
+                         prompt_cache: bool = False, encoder: HistoryEncoder = None,
+                         metrics: CallMetrics = None) -> requests.Response:
+        """
+        POST a chat completion request to OpenRouter, raising on HTTP errors.
 
+        Non-streamed responses are fully read before returning; metrics (if
+        given) records the rate-limit wait, time to first byte and request size.
+        """
+        metrics = metrics or CallMetrics()
+        body, headers = self._encode_request(messages, model, stream, prompt_cache, encoder)
+        body = metrics.count_request(body)
+        self._estimate_prompt(messages, model, metrics)
+
+        # Fail fast if the model's circuit is open, otherwise wait for a rate-limit token
+        guard = self.limiter.guard(model)
+        wait = guard.before_call()
+        try:
+            if wait > 0:
+                metrics.rate_wait = wait
+                time.sleep(wait)
+
+            started = time.monotonic()
+            try:
+                # Always stream at the transport level so the first byte can be timed
+                response = self.http.post(
+                    self.openrouter_url,
+                    data=body,
+                    headers=headers,
+                    timeout=120,
+                    stream=True
+                )
+                metrics.mark_first_byte()
+                if not stream:
+                    metrics.response_bytes = len(response.content)
+            except requests.RequestException as e:
+                guard.record_failure(e)
+                raise
+            # Time to headers when streaming, full response time otherwise
+            guard.record_latency(time.monotonic() - started, self.latency_slo)
+
+            if response.status_code != 200:
+                error = APIError(
+                    f"OpenRouter API error {response.status_code}: {response.text}",
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers),
+                    model=model
+                )
+                response.close()
+                guard.record_failure(error)
+                raise error
+        except BaseException:
+            guard.release_probe()  # Interrupted mid-call: don't keep a half-open circuit's probe
+            raise
+
+        guard.record_success(response.headers)
+        return response
+
+    def _estimate_prompt(self, messages: List[Dict], model: str, metrics: CallMetrics):
+        """Record the local prompt estimate so the reported usage can calibrate it."""
+        if isinstance(messages, HistoryBuffer):
+            base = messages.base_tokens  # Running total - no recount of the whole history
+        elif has_streamed_content(messages):
+            return  # Counting would materialize the whole streamed prompt
+        else:
+            base = self.tokens.count_base(messages)
+        metrics.token_scale = self.tokens.scale(model)
+        metrics.estimated_prompt_tokens = round(base * metrics.token_scale)
+
+    @staticmethod
+    def _api_error_from_body(error: Dict, prefix: str) -> APIError:
+        """Build an APIError from an OpenRouter error object (sent with HTTP 200 or mid-stream)."""
+        code = error.get("code") if isinstance(error, dict) else None
+        return APIError(f"{prefix}: {error}", status_code=code if isinstance(code, int) else None,
+                        retryable=None if isinstance(code, int) else True)
+
+    @staticmethod
+    def _parse_completion(data: Dict) -> str:
+        """Extract the response text from a (non-streaming) completion."""
+        if "error" in data:
+            raise HybridClient._api_error_from_body(data["error"], "OpenRouter API error")
         if "choices" not in data or len(data["choices"]) == 0:
-            raise Exception(f"Invalid response from OpenRouter: {data}")
+            raise APIError(f"Invalid response from OpenRouter: {data}", retryable=True)
+        return data["choices"][0]["message"]["content"]
 
-        # Log token usage and cost for financial tracking
+    @staticmethod
+    def _parse_sse_line(line: str) -> Optional[Dict]:
+        """
+        Parse one line of an OpenRouter event stream.
+
+        Returns the decoded chunk, None for lines to skip, or {"done": True}
+        at the end of the stream.
+        """
+        # Blank lines separate events, ':' lines are keep-alive comments
+        if not line or not line.startswith("data:"):
+            return None
+
+        data_str = line[len("data:"):].strip()
+        if data_str == "[DONE]":
+            return {"done": True}
+
+        chunk = json.loads(data_str)
+        if "error" in chunk:
+            raise HybridClient._api_error_from_body(chunk["error"], "OpenRouter stream error")
+        return chunk
+
+    @staticmethod
+    def _chunk_deltas(chunk: Dict) -> Iterator[str]:
+        """Yield the content deltas carried by a stream chunk."""
+        for choice in chunk.get("choices", []):
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+    def _record_usage(self, model: str, usage: Optional[Dict], ledger_fields: Dict = None,
+                      metrics: CallMetrics = None):
+        """Append token usage, cost and call metrics to the ledger."""
         try:
-            usage = data.get("usage")
-            if usage:
-                prompt_tokens = usage.get("prompt_tokens", 0)
-                completion_tokens = usage.get("completion_tokens", 0)
-                total_tokens = usage.get("total_tokens", 0)
-                cost = calculate_cost(model, prompt_tokens, completion_tokens)
-                
-                log_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "model": model,
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": total_tokens,
-                    "cost_usd": cost
-                }
-                # Ensure logs directory exists
-                ledger_dir = Path(__file__).parent / "logs"
-                ledger_dir.mkdir(exist_ok=True)
-                with open(ledger_dir / "ledger.log", "a") as f:
-                    f.write(json.dumps(log_entry) + "\n")
+            usage = usage or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            total_tokens = usage.get("total_tokens", 0)
+            # Prompt caching: OpenRouter reports cache reads/writes under prompt_tokens_details
+            details = usage.get("prompt_tokens_details") or {}
+            cached_tokens = details.get("cached_tokens", 0) or 0
+            cache_write_tokens = details.get("cache_write_tokens", 0) or 0
+            cost = calculate_cost(model, prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens)
+
+            log_entry = {
+                "timestamp": datetime.now().isoformat(),
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": total_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "cache_write_tokens": cache_write_tokens,
+                "uncached_prompt_tokens": max(0, prompt_tokens - cached_tokens - cache_write_tokens),
+                "cost_usd": cost if usage else None
+            }
+            if not usage:
+                # No usage reported - still record the call's timings and sizes
+                log_entry["usage_missing"] = True
+            if ledger_fields:
+                log_entry.update(ledger_fields)
+            if metrics:
+                log_entry.update(metrics.fields())
+                if usage and metrics.estimated_prompt_tokens:
+                    self.tokens.observe(model, metrics.estimated_prompt_tokens / metrics.token_scale,
+                                        prompt_tokens)
+            self._write_ledger(log_entry)
         except Exception as e:
             # Log any errors during cost tracking to avoid blocking main operation
-            error_log_path = Path(__file__).parent / 'logs' / 'openrouter_errors.log'
-            with open(error_log_path, 'a') as f:
-                f.write(f'[{datetime.now().isoformat()}] Error logging OpenRouter usage: {e}\n')
+            self.ledger.error(f"Error logging OpenRouter usage: {e}")
 
-        return data["choices"][0]["message"]["content"]
+    def _write_ledger(self, log_entry: Dict):
+        """
+        Queue one JSON line for logs/ledger.log (written behind by the ledger thread).
+
+        Adds the enclosing ledger_context fields (subsystem, retries) and the
+        path the call took.
+        """
+        for key, value in context_fields().items():
+            log_entry.setdefault(key, value)
+        log_entry.setdefault("path", call_path(log_entry))
+        self.ledger.record(log_entry)
+
+    def _record_cache_hit(self, model: str, ledger_fields: Dict = None):
+        """Record a response served from the cache (no tokens billed)."""
+        try:
+            log_entry = {
+                "timestamp": datetime.now().isoformat(),
+                "model": model,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cost_usd": 0.0,
+                "cache": "hit",
+                "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses
+            }
+            if ledger_fields:
+                log_entry.update(ledger_fields)
+            self._write_ledger(log_entry)
+        except Exception:
+            pass
+
+    def _chat_openrouter(self, messages: List[Dict], model: str, ledger_fields: Dict = None,
+                         prompt_cache: bool = False, encoder: HistoryEncoder = None) -> str:
+        """Send request to OpenRouter (for Claude)."""
+        metrics = CallMetrics()
+        response = self._post_openrouter(messages, model, prompt_cache=prompt_cache, encoder=encoder,
+                                         metrics=metrics)
+        data = response.json()
+        text = self._parse_completion(data)
+
+        self._record_usage(model, data.get("usage"), ledger_fields, metrics)
+
+        return text
+
+    def _stream_openrouter(self, messages: List[Dict], model: str, ledger_fields: Dict = None,
+                           prompt_cache: bool = False, encoder: HistoryEncoder = None) -> Iterator[str]:
+        """
+        Send a streaming request to OpenRouter.
+
+        The request is made (and HTTP errors raised) before returning, so
+        callers can retry the call itself. The returned iterator yields text
+        deltas as server-sent events arrive.
+        """
+        metrics = CallMetrics()
+        response = self._post_openrouter(messages, model, stream=True, prompt_cache=prompt_cache, encoder=encoder,
+                                         metrics=metrics)
+        return self._iter_sse_deltas(response, model, ledger_fields, metrics)
+
+    def _iter_sse_deltas(self, response: requests.Response, model: str, ledger_fields: Dict = None,
+                         metrics: CallMetrics = None) -> Iterator[str]:
+        """Yield content deltas from an OpenRouter SSE stream."""
+        metrics = metrics or CallMetrics()
+        usage = None
+        try:
+            for raw_line in response.iter_lines():
+                metrics.response_bytes += len(raw_line) + 1
+                # Decode ourselves - event streams often omit a charset
+                line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+                chunk = self._parse_sse_line(line)
+                if chunk is None:
+                    continue
+                if chunk.get("done"):
+                    break
+
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for delta in self._chunk_deltas(chunk):
+                    metrics.mark_first_token()
+                    yield delta
+        except Exception as e:
+            self.limiter.guard(model).record_failure(e)
+            raise
+        finally:
+            response.close()
+
+        self._record_usage(model, usage, ledger_fields, metrics)
+
+    def _chat_gemini_guarded(self, messages: List[Dict], model: str, session: 'ChatSession' = None) -> str:
+        """Direct Gemini call behind the same rate limiter / circuit breaker."""
+        guard = self.limiter.guard(model)
+        wait = guard.before_call()
+        try:
+            if wait > 0:
+                time.sleep(wait)
+            text = self._chat_gemini(messages, model, session)
+        except Exception as e:
+            guard.record_failure(e)
+            raise
+        except BaseException:
+            guard.release_probe()
+            raise
+        guard.record_success()
+        return text
+
+    def limiter_state(self) -> Dict[str, Dict]:
+        """Per-model rate limiter and circuit breaker state, for monitoring."""
+        return self.limiter.state()
 
-    def _chat_gemini(self, messages: List[Dict], model: str) -> str:
-        """Send request directly to Gemini API (free tier)."""
+    def _get_gemini_model(self, model: str) -> 'genai.GenerativeModel':
+        """Get (or build once) the genai model object for a model."""
         gemini_model_id = self._get_gemini_model_id(model)
-        gemini_model = genai.GenerativeModel(gemini_model_id)
-
-        # Convert message format to Gemini format
-        gemini_history = []
-        for msg in messages[:-1]:  # All but last message go to history
-            role = "model" if msg["role"] == "assistant" else "user"
-            gemini_history.append({
-                "role": role,
-                "parts": [msg["content"]]
-            })
+        with self._gemini_lock:
+            if gemini_model_id not in self._gemini_models:
+                self._gemini_models[gemini_model_id] = genai.GenerativeModel(gemini_model_id)
+            return self._gemini_models[gemini_model_id]
+
+    @staticmethod
+    def _to_gemini_content(msg: Dict) -> 'genai.protos.Content':
+        """Convert one message to Gemini's Content format."""
+        role = "model" if msg["role"] == "assistant" else "user"
+        return genai.protos.Content(role=role, parts=[genai.protos.Part(text=str(msg["content"]))])
+
+    def _chat_gemini(self, messages: List[Dict], model: str, session: 'ChatSession' = None) -> str:
+        """
+        Send request directly to Gemini API (free tier).
 
-        chat = gemini_model.start_chat(history=gemini_history)
+        With a session, its live genai chat is reused and only the messages
+        added since the last call are appended; otherwise (or after the
+        history was rewritten) the chat is rebuilt from all messages.
+        """
+        live = session.gemini_chat if session else None
+        if live is not None and live.matches(messages, model):
+            chat = live.chat
+            for msg in messages[live.synced:-1]:
+                chat.history.append(self._to_gemini_content(msg))
+        else:
+            # All but the last message go to history
+            history = [self._to_gemini_content(msg) for msg in messages[:-1]]
+            chat = self._get_gemini_model(model).start_chat(history=history)
 
         # Send the last message
-        last_msg = messages[-1]["content"] if messages else ""
-        response = chat.send_message(last_msg)
+        last_msg = str(messages[-1]["content"]) if messages else ""
+        try:
+            text = chat.send_message(last_msg).text
+        except Exception:
+            if session:
+                session.gemini_chat = None  # Chat state is unknown - rebuild next time
+            raise
 
-        return response.text
+        if session and messages:
+            session.gemini_chat = _GeminiChat(model, chat, messages, text)
+        return text
 
-    def chat(self, messages: List[Dict], model: str = None) -> str:
+    def chat(self, messages: List[Dict], model: str = None, stream: bool = False,
+             ledger_fields: Dict = None, prompt_cache: bool = False,
+             hedge: bool = False, session: 'ChatSession' = None) -> Union[str, Iterator[str]]:
         """
         Send a chat completion request, routing to appropriate API.
 
         Args:
             messages: List of message dicts with 'role' and 'content'
             model: Model ID to use
+            stream: If True, return an iterator of text deltas instead
+            ledger_fields: Extra fields to record in the ledger entry (e.g. batch_id)
+            prompt_cache: Mark stable prefixes for provider prompt caching (chat sessions)
+            hedge: Send a duplicate request if the first byte is slow and keep the faster one
+            session: The ChatSession making the call (lets direct Gemini reuse its live chat)
 
         Returns:
-            Response text from the model
+            Response text from the model (or an iterator of deltas if streaming)
         """
         model = model or self.default_model
+        if self.cassette is not None and self.cassette.replaying:
+            return self._replay(messages, model, stream, ledger_fields)
+
+        started = time.monotonic()
+        result = self._chat_with_failover(messages, model, stream, ledger_fields, prompt_cache, hedge, session)
+        if self.cassette is None:
+            return result
+        if stream:
+            return self._recorded_stream(result, messages, model, started)
+        self.cassette.record(messages, model, result, seconds=time.monotonic() - started)
+        return result
+
+    def _chat_with_failover(self, messages: List[Dict], model: str, stream: bool, ledger_fields: Optional[Dict],
+                            prompt_cache: bool, hedge: bool,
+                            session: 'ChatSession' = None) -> Union[str, Iterator[str]]:
+        """Try `model`, then its fallback chain while models are degraded."""
+        candidates = self._failover_candidates(model)
+        reason = None
+
+        for index, candidate in enumerate(candidates):
+            is_last = index == len(candidates) - 1
+            guard = self.limiter.guard(candidate)
+
+            # Skip straight past models already known to be degraded
+            degraded = guard.is_degraded(self.failover_after)
+            if degraded and not is_last:
+                reason = reason or degraded
+                continue
+
+            try:
+                fields = self._failover_fields(ledger_fields, model, candidate, reason)
+                if hedge and not self._is_gemini_model(candidate):
+                    result = self._hedged(messages, candidate, stream, fields, prompt_cache, session)
+                else:
+                    result = self._route(messages, candidate, stream, fields, prompt_cache, session)
+            except Exception as e:
+                # Fail over in the same call once this failure tips the model into degraded
+                degraded = guard.is_degraded(self.failover_after)
+                if is_last or not is_retryable(e) or not degraded:
+                    raise
+                reason = reason or degraded
+                continue
+
+            if candidate != model:
+                self._notify_failover(model, candidate, reason)
+            return result
+
+    def _recorded_stream(self, deltas: Iterator[str], messages: List[Dict], model: str,
+                         started: float) -> Iterator[str]:
+        """Pass deltas through, recording the stream once it completes."""
+        received = []
+        for delta in deltas:
+            received.append(delta)
+            yield delta
+        self.cassette.record(messages, model, "".join(received), received, seconds=time.monotonic() - started)
+
+    def _replay(self, messages: List[Dict], model: str, stream: bool,
+                ledger_fields: Dict = None) -> Union[str, Iterator[str]]:
+        """Answer from the cassette (no network); the ledger entry is marked as a replay."""
+        entry = self.cassette.replay(messages, model)
+        try:
+            log_entry = {
+                "timestamp": datetime.now().isoformat(),
+                "model": model,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cost_usd": 0.0,
+                "replay": True
+            }
+            if ledger_fields:
+                log_entry.update(ledger_fields)
+            self._write_ledger(log_entry)
+        except Exception:
+            pass
+        if stream:
+            return iter(entry.get("deltas") or [entry["text"]])
+        return entry["text"]
 
+    def _route(self, messages: List[Dict], model: str, stream: bool, ledger_fields: Dict,
+               prompt_cache: bool, session: 'ChatSession' = None) -> Union[str, Iterator[str]]:
+        """Send one request to a single model via the appropriate API."""
         if self._is_gemini_model(model):
-            return self._chat_gemini(messages, model)
+            text = self._chat_gemini_guarded(messages, model, session)
+            return iter([text]) if stream else text
+
+        encoder = session.encoder if session is not None else None
+        if stream:
+            return self._stream_openrouter(messages, model, ledger_fields, prompt_cache, encoder)
         else:
-            return self._chat_openrouter(messages, model)
+            return self._chat_openrouter(messages, model, ledger_fields, prompt_cache, encoder)
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for a first byte before hedging a call to `model`."""
+        p95 = self.limiter.guard(model).first_byte_percentile(self.HEDGE_PERCENTILE, self.HEDGE_MIN_SAMPLES)
+        return max(self.HEDGE_MIN_DELAY, p95 if p95 is not None else self.hedge_after)
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+            return self._hedge_pool
+
+    def _first_response(self, messages: List[Dict], model: str, stream: bool, ledger_fields: Dict,
+                        prompt_cache: bool, session: 'ChatSession' = None) -> Union[str, Iterator[str]]:
+        """
+        Make a call and wait for its first output: the full text, or (when
+        streaming) an iterator whose first delta has already arrived.
+        """
+        started = time.monotonic()
+        result = self._route(messages, model, stream, ledger_fields, prompt_cache, session)
+        if stream:
+            result = _Prefetched(result)
+        self.limiter.guard(model).record_first_byte(time.monotonic() - started)
+        return result
+
+    def _hedged(self, messages: List[Dict], model: str, stream: bool, ledger_fields: Optional[Dict],
+                prompt_cache: bool, session: 'ChatSession' = None) -> Union[str, Iterator[str]]:
+        """
+        Race a primary call against a delayed duplicate.
+
+        The duplicate is only sent if the primary has produced nothing after
+        hedge_delay(model). The first to answer wins; a losing stream is
+        closed as soon as it produces output. Both ledger entries carry the
+        hedge_id, and a cancelled loser is recorded with its estimated cost.
+        """
+        hedge_id = uuid.uuid4().hex[:12]
+        pool = self._get_hedge_pool()
+        primary_fields = dict(ledger_fields or {}, hedge_id=hedge_id, hedge_role="primary")
+        # Prompt sizes as sent: by the time a loser finishes, the history has moved on
+        primary_estimate = self._dispatch_estimate(messages, model)
+        # Run in copies of the caller's context so ledger_context tags follow the call
+        primary = pool.submit(contextvars.copy_context().run, self._first_response,
+                              messages, model, stream, primary_fields, prompt_cache, session)
+
+        delay = self.hedge_delay(model)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        backup_model = (self.hedge_model(model) if self.hedge_model else None) or model
+        backup_fields = dict(ledger_fields or {}, hedge_id=hedge_id, hedge_role="backup",
+                             hedge_delay=round(delay, 2), hedge_primary=model)
+        backup_estimate = self._dispatch_estimate(messages, backup_model)
+        backup = pool.submit(contextvars.copy_context().run, self._first_response,
+                             messages, backup_model, stream, backup_fields, prompt_cache, session)
+        racers = {primary: (model, primary_fields, primary_estimate),
+                  backup: (backup_model, backup_fields, backup_estimate)}
+
+        winner, error = None, None
+        pending = set(racers)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and winner is None:
+                    winner = future
+                elif future.exception() is not None and error is None:
+                    error = future.exception()
+
+        for future, (loser_model, loser_fields, loser_estimate) in racers.items():
+            if future is not winner:
+                future.add_done_callback(
+                    lambda f, m=loser_model, fields=loser_fields, tokens=loser_estimate:
+                        self._cancel_hedge_loser(f, m, tokens, messages, fields)
+                )
+
+        if winner is None:
+            raise error
+        return winner.result()
+
+    def _dispatch_estimate(self, messages: List[Dict], model: str) -> Optional[int]:
+        """Estimated prompt tokens of a request at the moment it is sent (None for streamed prompts)."""
+        metrics = CallMetrics()
+        self._estimate_prompt(messages, model, metrics)
+        return metrics.estimated_prompt_tokens
+
+    def _cancel_hedge_loser(self, future: Future, model: str, prompt_tokens: Optional[int], messages: List[Dict],
+                            ledger_fields: Dict):
+        """Close a losing hedged stream and record what it probably cost (prompt estimated at dispatch)."""
+        if future.exception() is not None:
+            return
+        result = future.result()
+        if not isinstance(result, _Prefetched):
+            return  # Non-streamed loser already finished and recorded its own usage
+        result.close()
+
+        # The stream was cut before usage arrived - charge the prompt as it was when sent
+        if prompt_tokens is None:
+            prompt_tokens = self.tokens.count_messages(messages, model)  # Streamed prompt: fixed, counted only now
+        try:
+            log_entry = {
+                "timestamp": datetime.now().isoformat(),
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 0,
+                "total_tokens": prompt_tokens,
+                "cost_usd": calculate_cost(model, prompt_tokens, 0),
+                "cost_estimated": True
+            }
+            log_entry.update(ledger_fields, hedge_outcome="cancelled")
+            self._write_ledger(log_entry)
+        except Exception:
+            pass
+
+    def _failover_candidates(self, model: str) -> List[str]:
+        """The requested model followed by its fallback chain (no duplicates)."""
+        candidates = [model]
+        if self.fallback_chain:
+            for fallback in self.fallback_chain(model) or []:
+                if fallback not in candidates:
+                    candidates.append(fallback)
+        return candidates
+
+    @staticmethod
+    def _failover_fields(ledger_fields: Optional[Dict], model: str, candidate: str,
+                         reason: Optional[str]) -> Optional[Dict]:
+        """Ledger fields for a call, tagged with the failover when a fallback is used."""
+        if candidate == model:
+            return ledger_fields
+        return dict(ledger_fields or {}, failover_from=model, failover_reason=reason)
+
+    def _notify_failover(self, from_model: str, to_model: str, reason: str):
+        if self.on_failover:
+            try:
+                self.on_failover(from_model, to_model, reason)
+            except Exception:
+                pass  # Reporting a failover must never fail the call
 
     def start_chat(self, history: List[Dict] = None, model_getter: Callable = None) -> ChatSession:
         """
@@ -241,7 +1045,13 @@ class HybridClient:
         Returns:
             ChatSession object for continued conversation
         """
-        # Convert history from Gemini format if needed
+        if isinstance(history, HistoryBuffer):
+            return ChatSession(self, history, model_getter)  # Already chat format - keep its running totals
+        return ChatSession(self, self._convert_history(history), model_getter)
+
+    @staticmethod
+    def _convert_history(history: Optional[List[Dict]]) -> List[Dict]:
+        """Convert history from Gemini format (role/parts) if needed."""
         converted_history = []
         if history:
             for item in history:
@@ -259,30 +1069,110 @@ class HybridClient:
                     "content": content
                 })
 
-        return ChatSession(self, converted_history, model_getter)
+        return converted_history
+
+    def generate_content(self, prompt: Union[str, StreamedPrompt], model: str = None, ledger_fields: Dict = None,
+                         use_cache: bool = True) -> ChatResponse:
+        """
+        Simple one-shot generation.
 
-    def generate_content(self, prompt: str, model: str = None) -> ChatResponse:
-        """Simple one-shot generation."""
+        If the client has a response cache, identical model + prompt pairs are
+        served from it; use_cache=False bypasses it for this call. A
+        StreamedPrompt is sent as a chunked body without being joined in memory.
+        """
+        model = model or self.default_model
         messages = [{"role": "user", "content": prompt}]
-        response_text = self.chat(messages, model)
+
+        cache = self.cache if (use_cache and self.cache and self.cache.enabled) else None
+        if cache:
+            cached = cache.get(model, prompt)
+            if cached is not None:
+                self._record_cache_hit(model, ledger_fields)
+                return ChatResponse(cached, messages)
+            ledger_fields = dict(ledger_fields or {}, cache="miss",
+                                 cache_hits=cache.hits, cache_misses=cache.misses)
+
+        response_text = self.chat(messages, model, ledger_fields=ledger_fields)
+        if cache:
+            cache.put(model, prompt, response_text)
         return ChatResponse(response_text, messages)
 
+    def _model_slots(self, model: str) -> threading.BoundedSemaphore:
+        """Get the semaphore capping in-flight requests for a model."""
+        with self._slots_lock:
+            if model not in self._slots:
+                limit = self.MODEL_CONCURRENCY.get(model, self.DEFAULT_MODEL_CONCURRENCY)
+                self._slots[model] = threading.BoundedSemaphore(limit)
+            return self._slots[model]
+
+    def generate_many(self, prompts: List[str], model: str = None, max_concurrency: int = 4,
+                      max_retries: int = 3, base_delay: float = 2) -> List[Union[ChatResponse, Exception]]:
+        """
+        Run a batch of one-shot prompts in parallel.
+
+        Results come back in prompt order. A failed prompt doesn't affect the
+        others - its slot holds the exception instead of a ChatResponse.
+        Transient errors are retried per prompt, and in-flight requests per
+        model never exceed MODEL_CONCURRENCY, however many batches run at
+        once. Ledger entries carry a shared batch_id plus batch_index.
+        """
+        model = model or self.default_model
+        batch_id = uuid.uuid4().hex[:12]
+
+        def run_one(index: int, prompt: str) -> ChatResponse:
+            fields = {"batch_id": batch_id, "batch_index": index}
+            for attempt in range(max_retries):
+                try:
+                    with self._model_slots(model), ledger_context(retries=attempt):
+                        return self.generate_content(prompt, model, ledger_fields=fields)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= max_retries - 1:
+                        raise
+                    time.sleep(retry_delay(e, attempt, base_delay))
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            # Each task runs in a copy of the caller's context (ledger_context tags)
+            futures = [pool.submit(contextvars.copy_context().run, run_one, i, prompt)
+                       for i, prompt in enumerate(prompts)]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
 
 # Alias for backwards compatibility
 OpenRouterClient = HybridClient
 
 
+_default_client: Optional[HybridClient] = None
+
+
+def get_default_client() -> HybridClient:
+    """Get the process-wide client so wrappers share one connection pool."""
+    global _default_client
+    if _default_client is None:
+        _default_client = HybridClient()
+    return _default_client
+
+
 # For compatibility with existing code that expects GenerativeModel interface
 class GenerativeModel:
     """Wrapper to match Gemini's GenerativeModel interface."""
 
     def __init__(self, model_name: str, client: HybridClient = None, model_getter=None):
         self.model_name = model_name
-        self.client = client or HybridClient()
+        self.client = client or get_default_client()
         self.model_getter = model_getter
 
     def start_chat(self, history: List = None) -> ChatSession:
         """Start a chat session."""
+        if isinstance(history, HistoryBuffer):
+            return self.client.start_chat(history, self.model_getter)
+
         # Convert Gemini-style history if provided
         converted = []
         if history:
@@ -297,7 +1187,12 @@ class GenerativeModel:
 
         return self.client.start_chat(converted, self.model_getter)
 
-    def generate_content(self, prompt: str) -> ChatResponse:
+    def generate_content(self, prompt: Union[str, StreamedPrompt]) -> ChatResponse:
         """Generate content from a prompt."""
         model = self.model_getter() if self.model_getter else self.model_name
         return self.client.generate_content(prompt, model)
+
+    def generate_many(self, prompts: List[str], max_concurrency: int = 4) -> List[Union[ChatResponse, Exception]]:
+        """Generate content for a batch of prompts in parallel (see HybridClient.generate_many)."""
+        model = self.model_getter() if self.model_getter else self.model_name
+        return self.client.generate_many(prompts, model, max_concurrency)
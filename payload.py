@@ -0,0 +1,201 @@
+"""
+Request Body Serialization for Crow
+- JSON encoding of chat completion payloads (compact, same escaping as requests)
+- HistoryEncoder: per-session incremental encoding of a growing history, so a
+  turn only encodes the messages added since the last one
+- Optional gzip, also incremental for sessions
+- StreamedPrompt: prompt text produced piece by piece (e.g. file by file) and
+  streamed into a chunked request body without ever being joined in memory
+"""
+
+import json
+import gzip
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+GZIP_LEVEL = 1          # Fast: bodies are large and mostly repetitive text
+GZIP_MIN_BYTES = 1024   # Not worth compressing below this
+STREAM_CHUNK_BYTES = 64 * 1024  # Coalesce small pieces into chunks of about this size
+
+
+def encode_json(obj) -> bytes:
+    """Encode a JSON body (ASCII-escaped like requests' json=, without the spaces)."""
+    return json.dumps(obj, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def gzip_body(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class StreamedPrompt:
+    """
+    Prompt text that is generated in pieces rather than held as one string.
+
+    `factory` must return a fresh iterable of str pieces on every call, so
+    the request body (and the response cache key) can be rebuilt for each
+    retry without keeping the whole text in memory.
+    """
+
+    def __init__(self, factory: Callable[[], Iterable[str]]):
+        self.factory = factory
+
+    def parts(self) -> Iterator[str]:
+        return iter(self.factory())
+
+    def __str__(self) -> str:
+        # Materializes the whole prompt - only for paths that need a plain string
+        return "".join(self.parts())
+
+
+def has_streamed_content(messages: List[Dict]) -> bool:
+    return any(isinstance(msg.get("content"), StreamedPrompt) for msg in messages)
+
+
+def stream_json_body(payload: Dict) -> Iterator[bytes]:
+    """
+    Encode a payload as JSON, escaping StreamedPrompt values piece by piece.
+
+    The rest of the payload is encoded up front with placeholders; the
+    streamed strings are spliced in as they are produced. Peak memory is
+    about the largest single piece.
+    """
+    streamed = []
+
+    def placeholder(value):
+        if isinstance(value, StreamedPrompt):
+            streamed.append(value)
+            return f"\0streamed-{len(streamed) - 1}\0"
+        if isinstance(value, dict):
+            return {k: placeholder(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [placeholder(v) for v in value]
+        return value
+
+    skeleton = encode_json(placeholder(payload))
+    buffer = bytearray()
+    for index, prompt in enumerate(streamed):
+        marker = encode_json(f"\0streamed-{index}\0")
+        before, skeleton = skeleton.split(marker, 1)
+        buffer += before + b'"'
+        for part in prompt.parts():
+            if not part:
+                continue
+            buffer += json.dumps(part)[1:-1].encode("ascii")  # Escape without the quotes
+            if len(buffer) >= STREAM_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b'"'
+    buffer += skeleton
+    yield bytes(buffer)
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """gzip a chunked body on the fly."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def mark_cacheable(msg: Dict) -> Dict:
+    """Return the message with an Anthropic cache_control breakpoint (if it has text content)."""
+    if not (isinstance(msg.get("content"), str) and msg["content"]):
+        return msg
+    return {
+        "role": msg["role"],
+        "content": [{
+            "type": "text",
+            "text": msg["content"],
+            "cache_control": {"type": "ephemeral"}
+        }]
+    }
+
+
+class HistoryEncoder:
+    """
+    Incrementally serialized request body for one chat session.
+
+    The body is laid out as {"messages":[...],<options>} so everything up to
+    the last two messages is the same from turn to turn (the breakpoint on
+    the second-to-last message moves every turn). That stable prefix is kept
+    as bytes - and as a running gzip stream when compressing - and only the
+    new messages are encoded. Messages are matched by identity, so any
+    rewrite of the history (e.g. compaction) falls back to a full re-encode.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None, False)
+
+    def _reset(self, first: Optional[Dict], breakpoints: bool):
+        self._first = first
+        self._breakpoints = breakpoints
+        self._count = 0           # Messages covered by _stable
+        self._last = None         # Last message covered by _stable
+        self._stable = bytearray()
+        self._gz = None           # Compressor that has consumed _stable
+        self._gz_out = bytearray()
+
+    def _encode_message(self, msg: Dict, marked: bool) -> bytes:
+        return encode_json(mark_cacheable(msg) if marked else msg)
+
+    def _valid_for(self, messages: List[Dict], breakpoints: bool) -> bool:
+        return (
+            self._count > 0
+            and breakpoints == self._breakpoints
+            and len(messages) >= self._count
+            and messages[0] is self._first
+            and messages[self._count - 1] is self._last
+        )
+
+    def _append_stable(self, chunk: bytes):
+        self._stable += chunk
+        if self._gz is not None:
+            self._gz_out += self._gz.compress(chunk)
+
+    def encode(self, messages: List[Dict], options: Dict, breakpoints: bool = False,
+               compress: bool = False) -> bytes:
+        """
+        Encode {"messages": messages, **options}.
+
+        breakpoints marks messages 0 and len-2 as cacheable, exactly like
+        HybridClient._apply_cache_breakpoints.
+        """
+        if not messages:
+            body = encode_json(dict(options, messages=[]))
+            return gzip_body(body) if compress else body
+
+        with self._lock:
+            if not self._valid_for(messages, breakpoints):
+                self._reset(messages[0], breakpoints)
+                self._append_stable(b'{"messages":[' + self._encode_message(messages[0], breakpoints))
+                self._count, self._last = 1, messages[0]
+
+            # Everything before the moving breakpoint is final
+            stable_end = max(1, len(messages) - 2)
+            for msg in messages[self._count:stable_end]:
+                self._append_stable(b"," + self._encode_message(msg, False))
+            if stable_end > self._count:
+                self._count, self._last = stable_end, messages[stable_end - 1]
+
+            tail = bytearray()
+            for i in range(self._count, len(messages)):
+                marked = breakpoints and i == len(messages) - 2
+                tail += b"," + self._encode_message(messages[i], marked)
+            tail += b"]"
+            if options:
+                tail += b"," + encode_json(options)[1:]
+            else:
+                tail += b"}"
+
+            if not compress:
+                return bytes(self._stable) + bytes(tail)
+
+            if self._gz is None:
+                self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                self._gz_out = bytearray(self._gz.compress(bytes(self._stable)))
+            finisher = self._gz.copy()
+            return bytes(self._gz_out) + finisher.compress(bytes(tail)) + finisher.flush()
@@ -0,0 +1,418 @@
+"""
+Rate Limiting for Crow
+- Classifies API errors from HTTP status codes (not exception text)
+- Per-model adaptive pacing: no limit until the provider signals one (429,
+  Retry-After, X-RateLimit-Remaining: 0), then AIMD pacing that lapses again
+  once the signals stop
+- Per-model circuit breaker so callers fail fast during provider incidents
+"""
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Mapping
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Statuses worth retrying: timeouts, conflicts, rate limits, server/gateway errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504} | set(range(520, 530))
+
+# Pacing after a rate-limit signal
+PACING_WINDOW = 60.0      # Seconds of recent requests used to measure the current rate
+PACING_RECOVERY = 120.0   # Pacing lapses this long after the last rate-limit signal
+MIN_PACED_RATE = 1 / 60   # Requests per second never paced below (1 per minute)
+
+
+class APIError(Exception):
+    """An error from a model provider, carrying the HTTP status when there is one."""
+
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None,
+                 model: str = None, retryable: bool = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.model = model
+        self._retryable = retryable
+
+    @property
+    def retryable(self) -> bool:
+        if self._retryable is not None:
+            return self._retryable
+        return self.status_code in RETRYABLE_STATUS
+
+
+class CircuitOpenError(APIError):
+    """Raised without touching the network while a model's circuit breaker is open."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(
+            f"Circuit open for {model}: failing fast for {retry_after:.0f}s",
+            retry_after=retry_after, model=model, retryable=True
+        )
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to Retry-After or X-RateLimit-Reset headers."""
+    if not headers:
+        return None
+
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    reset = headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            reset_at = float(reset)
+        except ValueError:
+            return None
+        # OpenRouter sends a millisecond epoch timestamp
+        if reset_at > 1e11:
+            reset_at /= 1000
+        return max(0.0, reset_at - time.time())
+
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether an error is transient (worth retrying)."""
+    if isinstance(error, APIError):
+        return error.retryable
+    if isinstance(error, (requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    if aiohttp is not None and isinstance(error, aiohttp.ClientError):
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, json.JSONDecodeError):
+        return True  # Truncated or garbled response body
+
+    # SDK errors (e.g. google.api_core) expose the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return False
+
+
+def retry_delay(error: BaseException, attempt: int, base_delay: float = 2, max_delay: float = 30) -> float:
+    """Backoff before the next attempt, honouring the server's Retry-After when given."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return min(max_delay, retry_after + random.uniform(0, 0.5))
+    return min(max_delay, base_delay * (2 ** attempt) + random.uniform(0, 1))
+
+
+class TokenBucket:
+    """
+    Thread-safe adaptive pacer.
+
+    Calls go straight through until the provider signals a rate limit. The
+    first signal starts pacing at half the request rate seen over the last
+    PACING_WINDOW seconds; further 429s halve it again and successes add
+    back a tenth of the starting rate. Pacing lapses PACING_RECOVERY seconds
+    after the last signal. reserve() returns how long the caller should
+    wait, so the same bucket works for blocking and async callers.
+
+    requests_per_minute, when given, is a fixed ceiling applied from the start.
+    """
+
+    def __init__(self, requests_per_minute: float = None):
+        self.max_rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.rate = self.max_rate  # None = not paced
+        self.step = 0.0
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.signalled_at = None
+        self.recent = deque()  # Monotonic times of recent requests
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _expire(self, now: float):
+        """Stop adaptive pacing once the provider has been quiet long enough."""
+        if self.signalled_at is not None and now - self.signalled_at >= PACING_RECOVERY:
+            self.signalled_at = None
+            self.rate = self.max_rate
+            self.tokens = 1.0
+
+    def reserve(self) -> float:
+        """Take a token; return seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self.recent.append(now)
+            while self.recent and self.recent[0] < now - PACING_WINDOW:
+                self.recent.popleft()
+            wait = 0.0
+            if self.rate is not None:
+                self._refill(now)
+                self.tokens -= 1
+                wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while (provider said to back off)."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _signal(self):
+        """The provider pushed back: start pacing, or slow it down if already paced."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.signalled_at is None:
+            span = now - self.recent[0] if self.recent else PACING_WINDOW
+            observed = len(self.recent) / max(1.0, span)  # Requests per second lately
+            rate = max(MIN_PACED_RATE, observed / 2)
+            if self.max_rate is not None:
+                rate = min(rate, self.max_rate)
+            self.rate, self.step, self.tokens = rate, rate / 10, 0.0
+        else:
+            self.rate = max(MIN_PACED_RATE, self.rate / 2)
+        self.signalled_at = now
+
+    def on_rate_limited(self, retry_after: float = None):
+        """Multiplicative decrease after a 429."""
+        with self._lock:
+            self._signal()
+        if retry_after:
+            self.pause(retry_after)
+
+    def on_success(self):
+        """Additive increase while paced (up to the ceiling, if any)."""
+        with self._lock:
+            if self.signalled_at is not None:
+                self.rate += self.step
+                if self.max_rate is not None:
+                    self.rate = min(self.max_rate, self.rate)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Follow Retry-After and X-RateLimit-Remaining / X-RateLimit-Reset on successful responses."""
+        if not headers:
+            return
+        wait = None
+        remaining = headers.get("X-RateLimit-Remaining")
+        try:
+            if remaining is not None and float(remaining) <= 0:
+                wait = parse_retry_after({"X-RateLimit-Reset": headers.get("X-RateLimit-Reset")}) or 0.0
+        except ValueError:
+            pass
+        if headers.get("Retry-After"):
+            wait = max(wait or 0.0, parse_retry_after({"Retry-After": headers.get("Retry-After")}) or 0.0)
+        if wait is None:
+            return
+        with self._lock:
+            self._signal()
+        if wait:
+            self.pause(wait)
+
+    def state(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._refill(now)
+            return {
+                "paced": self.rate is not None,
+                "tokens": round(self.tokens, 2),
+                "requests_per_minute": round(self.rate * 60, 2) if self.rate is not None else None,
+                "paused_for": round(max(0.0, self.paused_until - now), 2)
+            }
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    closed -> open after failure_threshold consecutive transient failures;
+    open -> half_open once cooldown has passed (one probe call allowed);
+    half_open -> closed on success, or back to open on failure.
+
+    The probe holds a lease of `cooldown` seconds: a probe that never reports
+    back (cancelled, interrupted, lost) lets the next caller probe instead of
+    keeping the model shut.
+    """
+
+    def __init__(self, model: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_failure_at = 0.0
+        self.probe_until = 0.0  # Lease of the half-open probe (0: none out)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError instead of letting a call through while open."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            now = time.monotonic()
+            if self.state == "half_open" and now >= self.probe_until:
+                self.probe_until = now + self.cooldown
+                return
+            raise CircuitOpenError(self.model, max(remaining, self.probe_until - now, 1.0))
+
+    @property
+    def probe_in_flight(self) -> bool:
+        return self.state == "half_open" and time.monotonic() < self.probe_until
+
+    def release_probe(self):
+        """Give the half-open probe back without a verdict (the call was cancelled or failed non-transiently)."""
+        with self._lock:
+            self.probe_until = 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probe_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.last_failure_at = time.monotonic()
+            self.probe_until = 0.0
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open" and time.monotonic() < self.opened_at + self.cooldown
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in": round(max(0.0, self.opened_at + self.cooldown - time.monotonic()), 2)
+                if self.state == "open" else 0.0
+            }
+
+
+class ModelGuard:
+    """Rate limiter, circuit breaker and latency tracking for one model."""
+
+    SLOW_STRIKES = 2  # Consecutive SLO breaches before a model counts as degraded
+    FIRST_BYTE_SAMPLES = 100  # Recent time-to-first-byte samples kept for percentiles
+
+    def __init__(self, model: str, requests_per_minute: Optional[float], failure_threshold: int, cooldown: float):
+        self.model = model
+        self.bucket = TokenBucket(requests_per_minute)
+        self.breaker = CircuitBreaker(model, failure_threshold, cooldown)
+        self.cooldown = cooldown
+        self.slow_strikes = 0
+        self.slow_until = 0.0
+        self.first_byte = deque(maxlen=self.FIRST_BYTE_SAMPLES)
+
+    def record_latency(self, seconds: float, slo: float = None):
+        """Track latency against an SLO; repeated breaches mark the model slow for a cooldown."""
+        if not slo:
+            return
+        if seconds <= slo:
+            self.slow_strikes = 0
+            return
+        self.slow_strikes += 1
+        if self.slow_strikes >= self.SLOW_STRIKES:
+            self.slow_until = time.monotonic() + self.cooldown
+
+    def record_first_byte(self, seconds: float):
+        """Record how long a successful call took to produce its first output."""
+        self.first_byte.append(seconds)
+
+    def first_byte_percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Time-to-first-byte percentile over recent calls (None with too few samples)."""
+        samples = sorted(self.first_byte)
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def is_degraded(self, failover_after: int) -> Optional[str]:
+        """Why calls should be routed elsewhere right now (None if the model looks healthy)."""
+        if self.breaker.is_open:
+            return "circuit open"
+        # Recent failures only - after a cooldown the model gets another chance
+        recent = time.monotonic() < self.breaker.last_failure_at + self.cooldown
+        if recent and self.breaker.failures >= failover_after:
+            return f"{self.breaker.failures} consecutive failures"
+        if time.monotonic() < self.slow_until:
+            return "latency SLO breached"
+        return None
+
+    def before_call(self) -> float:
+        """Fail fast if the breaker is open, else return seconds to wait for a token."""
+        self.breaker.before_call()
+        return self.bucket.reserve()
+
+    def release_probe(self):
+        """Called when a call that passed before_call ends without a verdict (e.g. cancellation)."""
+        self.breaker.release_probe()
+
+    def record_success(self, headers: Mapping[str, str] = None):
+        self.breaker.record_success()
+        self.bucket.on_success()
+        self.bucket.update_from_headers(headers)
+
+    def record_failure(self, error: BaseException):
+        """Feed an error into the limiter/breaker (non-transient errors are ignored)."""
+        if isinstance(error, CircuitOpenError) or not is_retryable(error):
+            self.breaker.release_probe()
+            return
+        if getattr(error, "status_code", None) == 429:
+            self.bucket.on_rate_limited(getattr(error, "retry_after", None))
+        self.breaker.record_failure()
+
+    def state(self) -> Dict:
+        return {
+            "limiter": self.bucket.state(),
+            "breaker": self.breaker.snapshot(),
+            "slow": time.monotonic() < self.slow_until
+        }
+
+
+class RateLimiter:
+    """Registry of per-model guards shared by every call on a client."""
+
+    def __init__(self, requests_per_minute: Dict[str, float] = None,
+                 failure_threshold: int = 5, cooldown: float = 30.0):
+        self.requests_per_minute = dict(requests_per_minute or {})  # Optional fixed ceilings per model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def guard(self, model: str) -> ModelGuard:
+        with self._lock:
+            if model not in self._guards:
+                rpm = self.requests_per_minute.get(model)  # None: unpaced until the provider pushes back
+                self._guards[model] = ModelGuard(model, rpm, self.failure_threshold, self.cooldown)
+            return self._guards[model]
+
+    def state(self) -> Dict[str, Dict]:
+        """Limiter/breaker state per model, for monitoring."""
+        with self._lock:
+            guards = list(self._guards.values())
+        return {g.model: g.state() for g in guards}
@@ -0,0 +1,143 @@
+"""
+Response Cache for Crow
+Content-addressed on-disk cache for one-shot generate_content calls
+(compaction summaries, code analysis reports, INTERNAL_QUERY answers).
+
+Entries are plain JSON files named by sha256(model + prompt), written
+atomically, so every process in the workspace can share one cache without
+locking. Least-recently-used entries are evicted past max_bytes, and
+entries older than ttl_seconds are treated as misses.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict
+
+WORKSPACE = Path(__file__).parent
+DEFAULT_CACHE_DIR = WORKSPACE / ".cache" / "responses"
+
+
+class ResponseCache:
+    """On-disk LRU + TTL cache of model responses keyed by model and prompt hash."""
+
+    EVICT_EVERY = 50  # Check the size limit every N writes (and on the first one)
+
+    def __init__(
+        self,
+        directory: Path = None,
+        max_bytes: int = 200 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        self.directory = Path(directory or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Cache can be bypassed for a whole process with CROW_CACHE_BYPASS=1."""
+        return os.environ.get("CROW_CACHE_BYPASS", "") not in ("1", "true", "yes")
+
+    @staticmethod
+    def key(model: str, prompt) -> str:
+        """
+        Content address for a model + prompt pair.
+
+        prompt may also be a payload.StreamedPrompt; it is hashed piece by
+        piece and gets the same key as the equivalent string.
+        """
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        for part in ([prompt] if isinstance(prompt, str) else prompt.parts()):
+            digest.update(part.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        # Two-level fan-out keeps directories small
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss."""
+        path = self._path(self.key(model, prompt))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["text"]
+
+    def put(self, model: str, prompt: str, text: str):
+        """Store a response (atomic write, safe with concurrent processes)."""
+        path = self._path(self.key(model, prompt))
+        entry = {"model": model, "created": time.time(), "text": text}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # A cache write failure must never break the call
+
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+        self._writes += 1
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove every cached entry."""
+        for path in self.directory.glob("*/*.json"):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -15,7 +15,8 @@ from datetime import datetime
 WORKSPACE = Path(__file__).parent
 BACKUP_DIR = WORKSPACE / "backup"
 HEARTBEAT_FILE = WORKSPACE / ".heartbeat"
-CRITICAL_FILES = ["main.py", "system_instructions.txt", "conversation.json", "conversation_full.json"]
+CRITICAL_FILES = ["main.py", "system_instructions.txt", "conversation.json"]
+CRITICAL_DIRS = ["conversation_full"]  # Full history segments (closed ones never change)
 
 # Stall detection: if no heartbeat for this many seconds, consider it stalled
 STALL_TIMEOUT = 120  # 2 minutes
@@ -35,6 +36,24 @@ def log(msg):
     print(f"{C.CYAN}[{ts}] [Runner]{C.RESET} {msg}")
 
 
+def mirror_dir(src, dst):
+    """Make dst a copy of src, copying only files whose size or mtime changed."""
+    dst.mkdir(exist_ok=True)
+    names = set()
+    for path in src.iterdir():
+        if not path.is_file():
+            continue
+        names.add(path.name)
+        target = dst / path.name
+        stat = path.stat()
+        if target.exists() and (target.stat().st_size, target.stat().st_mtime) == (stat.st_size, stat.st_mtime):
+            continue
+        shutil.copy2(path, target)
+    for path in dst.iterdir():
+        if path.is_file() and path.name not in names:
+            path.unlink()
+
+
 def backup():
     """Backup critical files."""
     BACKUP_DIR.mkdir(exist_ok=True)
@@ -43,6 +62,10 @@ def backup():
         if src.exists():
             dst = BACKUP_DIR / filename
             shutil.copy2(src, dst)
+    for dirname in CRITICAL_DIRS:
+        src = WORKSPACE / dirname
+        if src.is_dir():
+            mirror_dir(src, BACKUP_DIR / dirname)
     log(f"{C.GREEN}Backup created{C.RESET}")
 
 
@@ -57,6 +80,10 @@ def restore():
         if src.exists():
             dst = WORKSPACE / filename
             shutil.copy2(src, dst)
+    for dirname in CRITICAL_DIRS:
+        src = BACKUP_DIR / dirname
+        if src.is_dir():
+            mirror_dir(src, WORKSPACE / dirname)
     log(f"{C.YELLOW}Restored from backup{C.RESET}")
     return True
 
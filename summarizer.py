@@ -0,0 +1,150 @@
+"""
+Hierarchical Summarization for Crow
+- Map: the messages being compacted are split into token-sized chunks and
+  every chunk is summarized in parallel (one generate_many batch per level)
+- Reduce: chunk summaries are grouped and summarized again, level by level,
+  until a single summary is left
+- Messages are kept whole (no 500-character cut); a message too big for one
+  chunk is split across several
+- Every level is returned, so callers keep only the top summary in context
+  and store the lower levels for retrieval
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+from tokens import TokenCounter, get_token_counter
+
+CHUNK_TOKENS = 24000      # Transcript tokens per map prompt
+FAN_IN = 8                # Summaries combined per reduce prompt
+MAX_CONCURRENCY = 4       # Summary calls in flight at once
+FAILED_EXCERPT = 1000     # Characters kept when a chunk's summary call fails
+
+MAP_PROMPT = """Summarize this conversation excerpt concisely, preserving key decisions, actions taken, and important context. Be brief but complete.
+
+CONVERSATION:
+{text}
+
+SUMMARY:"""
+
+REDUCE_PROMPT = """These are summaries of consecutive parts of one conversation, oldest first. Combine them into one summary, preserving key decisions, actions taken, and important context in order. Be brief but complete.
+
+SUMMARIES:
+{text}
+
+SUMMARY:"""
+
+
+class SummaryError(Exception):
+    """Some summary calls failed; .text is the best-effort summary (with excerpts where calls failed)."""
+
+    def __init__(self, message: str, text: str):
+        super().__init__(message)
+        self.text = text
+
+
+def message_text(msg: Dict) -> str:
+    """Text of a stored ({role, parts}) or chat ({role, content}) message."""
+    if "parts" in msg:
+        return " ".join(str(part) for part in msg["parts"])
+    return str(msg.get("content", ""))
+
+
+class SummaryTree:
+    """All levels of one hierarchical summary: levels[0] are the chunk summaries, levels[-1] is [top]."""
+
+    def __init__(self, levels: List[List[str]], messages: int, failed: int = 0):
+        self.levels = levels
+        self.messages = messages
+        self.failed = failed  # Summary calls that failed (their input excerpt stands in)
+
+    @property
+    def top(self) -> str:
+        return self.levels[-1][0]
+
+    @property
+    def depth(self) -> int:
+        return len(self.levels)
+
+
+class HierarchicalSummarizer:
+    """
+    Map-reduce summarizer over a batch generator.
+
+    generate_many(prompts, max_concurrency) returns one response (or
+    Exception) per prompt, like GenerativeModel.generate_many; `text`
+    extracts the text from a response.
+    """
+
+    def __init__(
+        self,
+        generate_many: Callable[[List[str], int], List],
+        text: Callable[[object], str] = lambda response: response.text,
+        tokens: TokenCounter = None,
+        model_getter: Callable[[], str] = None,
+        chunk_tokens: int = CHUNK_TOKENS,
+        fan_in: int = FAN_IN,
+        max_concurrency: int = MAX_CONCURRENCY
+    ):
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self.generate_many = generate_many
+        self.text = text
+        self.tokens = tokens or get_token_counter()
+        self.model_getter = model_getter
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = fan_in
+        self.max_concurrency = max_concurrency
+
+    def chunks(self, messages: List[Dict]) -> List[str]:
+        """Transcript of the messages cut into pieces of at most ~chunk_tokens each."""
+        model = self.model_getter() if self.model_getter else None
+        chunks, lines, size = [], [], 0
+        for msg in messages:
+            line = f"{msg.get('role', 'user')}: {message_text(msg)}\n"
+            count = self.tokens.count_message(msg, model)
+            if lines and size + count > self.chunk_tokens:
+                chunks.append("".join(lines))
+                lines, size = [], 0
+            if count <= self.chunk_tokens:
+                lines.append(line)
+                size += count
+                continue
+            # One message bigger than a chunk - split its text evenly by characters
+            pieces = -(-count // self.chunk_tokens)
+            step = -(-len(line) // pieces)
+            chunks.extend(line[i:i + step] for i in range(0, len(line), step))
+        if lines:
+            chunks.append("".join(lines))
+        return chunks
+
+    def _run(self, prompts: List[str], fallbacks: List[str]) -> Tuple[List[str], int]:
+        """One parallel batch; a failed call keeps an excerpt of its input instead. Returns (results, failures)."""
+        responses = self.generate_many(prompts, self.max_concurrency)
+        results, failed = [], 0
+        for response, fallback in zip(responses, fallbacks):
+            if isinstance(response, Exception):
+                results.append(f"[Summary failed: {response}] " + fallback[:FAILED_EXCERPT])
+                failed += 1
+            else:
+                results.append(self.text(response))
+        return results, failed
+
+    def summarize_tree(self, messages: List[Dict]) -> SummaryTree:
+        """Summarize the messages into every level of the hierarchy."""
+        chunks = self.chunks(messages) or [""]
+        level, failed = self._run([MAP_PROMPT.format(text=chunk) for chunk in chunks], chunks)
+        levels = [level]
+        while len(level) > 1:
+            groups = [level[i:i + self.fan_in] for i in range(0, len(level), self.fan_in)]
+            merge = [i for i, group in enumerate(groups) if len(group) > 1]  # A lone summary passes through
+            texts = ["\n\n".join(groups[i]) for i in merge]
+            results, failures = self._run([REDUCE_PROMPT.format(text=text) for text in texts], texts)
+            merged = dict(zip(merge, results))
+            failed += failures
+            level = [merged[i] if i in merged else group[0] for i, group in enumerate(groups)]
+            levels.append(level)
+        return SummaryTree(levels, len(messages), failed)
+
+    def summarize(self, messages: List[Dict]) -> str:
+        """The top-level summary only."""
+        return self.summarize_tree(messages).top
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tokens import TokenCounter  # noqa: E402
+
+
+class MemoryLedger:
+    """LedgerWriter stand-in that keeps entries in memory instead of writing logs/ledger.log."""
+
+    def __init__(self):
+        self.entries = []
+        self.errors = []
+
+    def record(self, entry):
+        self.entries.append(entry)
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+@pytest.fixture
+def client_kwargs(tmp_path):
+    """HybridClient arguments that keep the ledger and token calibration out of logs/."""
+    return {
+        "openrouter_key": "mock",
+        "ledger": MemoryLedger(),
+        "tokens": TokenCounter(ledger_path=tmp_path / "ledger.log")
+    }
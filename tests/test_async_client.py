@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from async_client import AsyncHybridClient  # noqa: E402
+from mock_openrouter import MockOpenRouter, Script  # noqa: E402
+from rate_limit import APIError, RateLimiter  # noqa: E402
+
+MODEL = "anthropic/claude-sonnet-4.5"
+
+
+def test_429_is_retried_after_retry_after(client_kwargs):
+    script = Script([{"error": 429}, {"content": "recovered"}])
+
+    async def run():
+        async with AsyncHybridClient(base_url=mock.base_url, **client_kwargs) as client:
+            return await client.generate_many(["prompt"], MODEL, max_retries=3, base_delay=0.01)
+
+    with MockOpenRouter(script=script, retry_after=0.05) as mock:
+        (result,) = asyncio.run(run())
+        stats = mock.stats()
+
+    assert result.text == "recovered"
+    assert stats["requests"] == 2
+    assert stats["by_outcome"] == {"429": 1, "ok": 1}
+
+
+def test_streaming_session_turn(client_kwargs):
+    content = "streamed from the mock in several pieces"
+
+    async def run():
+        async with AsyncHybridClient(base_url=mock.base_url, **client_kwargs) as client:
+            session = client.start_chat()
+            response = await session.send_message("hello", stream=True)
+            deltas = [delta async for delta in response]
+            return session, response, deltas
+
+    with MockOpenRouter(script=Script([{"content": content}]), stream_chunks=4) as mock:
+        session, response, deltas = asyncio.run(run())
+
+    assert len(deltas) == 4
+    assert "".join(deltas) == response.text == content
+    assert [m["role"] for m in session.history] == ["user", "assistant"]
+    assert session.history[-1]["content"] == content
+    assert client_kwargs["ledger"].entries  # Usage from the final SSE chunk was recorded
+
+
+def test_gather_runs_prompts_concurrently(client_kwargs):
+    prompts = [f"prompt {i}" for i in range(6)]
+
+    async def run():
+        async with AsyncHybridClient(base_url=mock.base_url, **client_kwargs) as client:
+            started = time.monotonic()
+            responses = await asyncio.gather(*(client.generate_content(p, MODEL) for p in prompts))
+            return responses, time.monotonic() - started
+
+    with MockOpenRouter(latency=0.3) as mock:
+        responses, elapsed = asyncio.run(run())
+        stats = mock.stats()
+
+    assert all(response.text for response in responses)
+    assert stats["requests"] == len(prompts)
+    assert stats["max_in_flight"] > 1
+    assert elapsed < 0.3 * len(prompts) / 2
+
+
+def test_cancelled_stream_closes_the_response(client_kwargs):
+    async def run():
+        async with AsyncHybridClient(base_url=mock.base_url, **client_kwargs) as client:
+            session = client.start_chat()
+            response = await session.send_message("hello", stream=True)
+
+            async def consume():
+                async for _ in response:
+                    pass
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.3)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return session
+
+    # 40 chunks at 0.1s each: the full stream would take 4s
+    script = Script([{"content": "x" * 400}])
+    with MockOpenRouter(script=script, stream_chunks=40, chunk_delay=0.1) as mock:
+        started = time.monotonic()
+        session = asyncio.run(run())
+        while mock.stats()["in_flight"] and time.monotonic() - started < 2:
+            time.sleep(0.05)
+        stats = mock.stats()
+
+    assert stats["in_flight"] == 0  # The server saw the connection drop well before the stream ended
+    assert session.history == []  # The unanswered user entry was discarded
+
+
+def test_cancelled_probe_does_not_keep_the_circuit_open(client_kwargs):
+    # A 500 opens the circuit, the half-open probe is cancelled, then the model must be usable again
+    script = Script([{"error": 500}, {"latency": 2.0}, {"content": "recovered"}])
+
+    async def run():
+        limiter = RateLimiter(failure_threshold=1, cooldown=1.0)
+        async with AsyncHybridClient(base_url=mock.base_url, limiter=limiter, **client_kwargs) as client:
+            with pytest.raises(APIError):
+                await client.chat([{"role": "user", "content": "fail"}], MODEL)
+            assert limiter.guard(MODEL).breaker.state == "open"
+            await asyncio.sleep(1.05)
+
+            probe = asyncio.create_task(client.chat([{"role": "user", "content": "probe"}], MODEL))
+            await asyncio.sleep(0.2)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            return await client.chat([{"role": "user", "content": "retry"}], MODEL), limiter
+
+    with MockOpenRouter(script=script) as mock:
+        text, limiter = asyncio.run(run())
+
+    assert text == "recovered"
+    assert limiter.guard(MODEL).breaker.state == "closed"
@@ -0,0 +1,51 @@
+import random
+import threading
+
+from context_manager import ContextManager
+from history_buffer import HistoryBuffer
+from tokens import TokenCounter
+
+
+class Session:
+    def __init__(self, tokens):
+        self.history = HistoryBuffer(tokens=tokens)
+
+
+def run_session(tokens, sizes, budget):
+    """Append one user/assistant turn per size pair and check the context after each."""
+    calls = []
+    lock = threading.Lock()
+
+    def summarize(messages):
+        with lock:
+            calls.append(len(messages))
+        return "summary"
+
+    manager = ContextManager(lambda: budget, summarize, tokens=tokens)
+    session = Session(tokens)
+    for user, assistant in sizes:
+        session.history.append({"role": "user", "content": "word " * user})
+        session.history.append({"role": "assistant", "content": "word " * assistant})
+        manager.after_turn(session)
+    return manager, calls
+
+
+def test_crossing_turn_reuses_the_pending_summary(tmp_path):
+    tokens = TokenCounter(ledger_path=tmp_path / "ledger.log")
+    manager, calls = run_session(tokens, [(150, 450)] * 40, budget=6000)
+
+    assert manager.compactions >= 2
+    assert manager.presummarized == manager.compactions
+    assert len(calls) <= manager.compactions + 1  # At most one job left waiting for the next crossing
+
+
+def test_pending_summary_survives_uneven_turns(tmp_path):
+    tokens = TokenCounter(ledger_path=tmp_path / "ledger.log")
+    rng = random.Random(7)
+    for _ in range(20):
+        sizes = [(rng.randint(20, 400), rng.randint(50, 1500)) for _ in range(60)]
+        manager, calls = run_session(tokens, sizes, budget=20000)
+
+        assert manager.compactions
+        assert manager.presummarized == manager.compactions
+        assert len(calls) <= manager.compactions + 1
@@ -0,0 +1,28 @@
+from mock_openrouter import MockOpenRouter
+from openrouter_client import HybridClient
+
+MODEL = "anthropic/claude-sonnet-4.5"
+
+
+def test_sequential_calls_reuse_one_connection(client_kwargs):
+    with MockOpenRouter() as mock:
+        client = HybridClient(base_url=mock.base_url, **client_kwargs)
+        for i in range(5):
+            assert client.generate_content(f"prompt {i}", MODEL).text
+
+        stats = mock.stats()
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+
+
+def test_chat_session_turns_share_the_client_pool(client_kwargs):
+    with MockOpenRouter() as mock:
+        client = HybridClient(base_url=mock.base_url, **client_kwargs)
+        first, second = client.start_chat(), client.start_chat()
+        for i in range(3):
+            first.send_message(f"first {i}")
+            second.send_message(f"second {i}")
+
+        stats = mock.stats()
+        assert stats["requests"] == 6
+        assert stats["connections"] == 1
@@ -0,0 +1,223 @@
+"""
+Token Accounting for Crow
+- Local token estimates per model family: tiktoken's cl100k_base when it is
+  installed, otherwise a word/number/punctuation approximation of BPE
+- Per-message counts cached by content, so a budget check only tokenizes
+  messages it has not seen before
+- Self-calibrating: each family's scale is fitted to the prompt_tokens
+  OpenRouter reports, read back from logs/ledger.log at startup and updated
+  after every call
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+LEDGER_PATH = Path(__file__).parent / "logs" / "ledger.log"
+
+# Provider tokenizers relative to the local estimate - starting points, calibration refines them
+FAMILY_SCALE = {"anthropic": 1.15, "google": 0.95, "default": 1.0}
+MESSAGE_OVERHEAD = 4              # Role and separator tokens per message
+CACHE_SIZE = 100000               # Cached per-text counts
+CALIBRATION_SAMPLES = 200         # Most recent calls used per family
+CALIBRATION_TAIL_BYTES = 4 << 20  # Only the end of the ledger is read at startup
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+
+_WORDS = re.compile(r"[A-Za-z]+")
+_NUMBERS = re.compile(r"\d{1,3}")          # BPE vocabularies split numbers into 1-3 digit groups
+_WHITESPACE = re.compile(r"\s\s+|[^\S ]")  # A single space is merged into the next word
+_SYMBOLS = re.compile(r"[^\sA-Za-z\d]")    # Punctuation and non-ASCII characters
+
+
+def model_family(model: str) -> str:
+    """Tokenizer family for a model id ("anthropic/claude-..." -> "anthropic")."""
+    provider = (model or "").split("/", 1)[0]
+    if provider in FAMILY_SCALE:
+        return provider
+    if "claude" in provider:
+        return "anthropic"
+    if "gemini" in provider:
+        return "google"
+    return "default"
+
+
+def approximate_tokens(text: str) -> int:
+    """Heuristic BPE count: words by length, numbers by digit group, one per symbol."""
+    words = sum((len(word) + 5) // 6 for word in _WORDS.findall(text))
+    return (words + len(_NUMBERS.findall(text)) + len(_WHITESPACE.findall(text))
+            + len(_SYMBOLS.findall(text)))
+
+
+class TokenCounter:
+    """
+    Cached, calibrated token estimates.
+
+    Counts are cached unscaled, keyed by the text's hash and length (str
+    hashes are memoized on the object, so repeat lookups are O(1)); the
+    per-family scale is applied on top, so recalibrating never invalidates
+    the cache.
+    """
+
+    def __init__(self, ledger_path: Path = None, cache_size: int = CACHE_SIZE):
+        self.ledger_path = Path(ledger_path or LEDGER_PATH)
+        self.cache_size = cache_size
+        self.scales = dict(FAMILY_SCALE)
+        self.hits = 0
+        self.misses = 0
+        self._samples = {}  # family -> deque of (estimated_base, actual)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoding = None
+        self._calibrated = False
+
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                pass  # Encoding files unavailable (offline) - use the approximation
+
+    @property
+    def tokenizer(self) -> str:
+        return "cl100k_base" if self._encoding is not None else "approximate"
+
+    def _base_count(self, text: str) -> int:
+        key = (hash(text), len(text))
+        with self._lock:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return count
+        if self._encoding is not None:
+            count = len(self._encoding.encode(text, disallowed_special=()))
+        else:
+            count = approximate_tokens(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = count
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+    def _message_base(self, msg: Dict) -> int:
+        """Unscaled tokens for one message in either format (content, or Gemini-style parts)."""
+        content = msg.get("content")
+        if content is None:
+            texts = msg.get("parts") or []
+        elif isinstance(content, str):
+            texts = (content,)
+        elif isinstance(content, list):
+            texts = [block.get("text", "") if isinstance(block, dict) else str(block) for block in content]
+        else:
+            texts = (str(content),)  # e.g. a StreamedPrompt - materialized once, then cached
+        return MESSAGE_OVERHEAD + sum(self._base_count(text) for text in texts if text)
+
+    def scale(self, model: str) -> float:
+        self._ensure_calibrated()
+        return self.scales.get(model_family(model), self.scales["default"])
+
+    def count_base(self, messages: Iterable[Dict]) -> int:
+        """Unscaled estimate for a message list (what calibration compares against)."""
+        return sum(self._message_base(msg) for msg in messages)
+
+    def count_text(self, text: str, model: str = None) -> int:
+        return round(self._base_count(text) * self.scale(model)) if text else 0
+
+    def count_message(self, msg: Dict, model: str = None) -> int:
+        return round(self._message_base(msg) * self.scale(model))
+
+    def count_messages(self, messages: Iterable[Dict], model: str = None) -> int:
+        """Estimated prompt tokens for `model`."""
+        return round(self.count_base(messages) * self.scale(model))
+
+    def observe(self, model: str, estimated_base: int, actual: int):
+        """Fold one reported prompt_tokens value into the family's scale."""
+        if not estimated_base or not actual or actual <= 0:
+            return
+        self._ensure_calibrated()
+        self._add_sample(model_family(model), estimated_base, actual)
+
+    def _add_sample(self, family: str, estimated_base: float, actual: int):
+        with self._lock:
+            samples = self._samples.setdefault(family, deque(maxlen=CALIBRATION_SAMPLES))
+            samples.append((estimated_base, actual))
+            estimated = sum(e for e, _ in samples)
+            if estimated > 0:
+                fitted = sum(a for _, a in samples) / estimated
+                self.scales[family] = min(MAX_SCALE, max(MIN_SCALE, fitted))
+
+    def _ensure_calibrated(self):
+        if self._calibrated:
+            return
+        self._calibrated = True
+        self.calibrate_from_ledger()
+
+    def calibrate_from_ledger(self, path: Path = None) -> Dict[str, int]:
+        """
+        Fit scales to past calls in the ledger (entries written with an
+        estimate and a reported prompt_tokens). Returns samples used per family.
+        """
+        path = Path(path or self.ledger_path)
+        used = {}
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - CALIBRATION_TAIL_BYTES))
+                lines = f.read().splitlines()
+        except OSError:
+            return used
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Partial first line of the tail, or a corrupt entry
+            estimate = entry.get("estimated_prompt_tokens")
+            actual = entry.get("prompt_tokens")
+            if not estimate or not actual or entry.get("cost_estimated") or entry.get("usage_missing"):
+                continue
+            family = model_family(entry.get("model", ""))
+            base = estimate / (entry.get("token_scale") or 1.0)
+            self._add_sample(family, base, actual)
+            used[family] = used.get(family, 0) + 1
+        return used
+
+    def state(self) -> Dict:
+        with self._lock:
+            return {
+                "tokenizer": self.tokenizer,
+                "scales": {family: round(scale, 3) for family, scale in self.scales.items()},
+                "samples": {family: len(samples) for family, samples in self._samples.items()},
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+_default_counter = None
+_default_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Process-wide token counter, calibrated lazily from logs/ledger.log."""
+    global _default_counter
+    with _default_lock:
+        if _default_counter is None:
+            _default_counter = TokenCounter()
+        return _default_counter
+
+
+def estimate_tokens(messages: Union[Iterable[Dict], str], model: str = None) -> int:
+    """Estimated tokens for a message list (or a single string) on `model`."""
+    counter = get_token_counter()
+    if isinstance(messages, str):
+        return counter.count_text(messages, model)
+    return counter.count_messages(messages, model)